@@ -1,9 +1,34 @@
+import os
 import json
 import math
 from pathlib import Path
 from collections import defaultdict
 import csv
-import heapq
+import argparse
+import pickle
+import hashlib
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from osm_pbf import is_route_relation
+from osm_records import load_route_records, load_hut_records
+from shortest_path import ENGINES, make_engine
+from edge_profiles import PROFILES, profile_graph, load_dem_elevations
+from hut_duplicates import drop_duplicate_huts
+from node_order import NodeOrder, NODE_ORDERS
+
+MAX_DISTANCE_KM = 40.0
+ANCHOR_RADIUS_M = 3_000.0
+# Liaison A-B indirecte si d(A,C) + d(C,B) <= d(A,B) * (1 + PRUNE_EPSILON)
+PRUNE_EPSILON = 0.05
+
+STATE_FILE = Path("cache") / "build_state.pickle"
+STATE_VERSION = 1
+
+CHECKPOINT_FILE = Path("cache") / "dijkstra_checkpoint.pickle"
+CHECKPOINT_EVERY = 50        # huts sources
+CHECKPOINT_MAX_AGE_S = 60.0  # ou au plus tard toutes les 60 s
 
 
 # -----------------------------
@@ -27,24 +52,62 @@ def haversine(lat1, lon1, lat2, lon2):
 # -----------------------------
 # Chargement des chemins OSM
 # -----------------------------
-def load_nordics_paths(path: Path):
-    print(f"Lecture du fichier principal (paths) : {path}")
-    data = json.loads(path.read_text(encoding="utf-8"))
-    elements = data.get("elements", [])
+def parse_paths_file(path: Path):
+    """
+    Lit un fichier de chemins (JSON Overpass ou .osm.pbf) sans rien partager
+    avec l'appelant (exécutable dans un autre processus).
+
+    Renvoie une table compacte :
+      node_ids / lats / lons : tableaux parallèles (array)
+      ways_by_id:      way_id -> {"id", "nodes", "tags"}
+      relations_by_id: route_id -> [way_ids membres] (relations hiking/ski)
+    """
+    node_ids = array("q")
+    lats = array("d")
+    lons = array("d")
+    ways_by_id = {}
+    relations_by_id = {}
+
+    data = load_route_records(path)
+    for node in data.nodes:
+        node_ids.append(node.id)
+        lats.append(node.lat)
+        lons.append(node.lon)
+    for way in data.ways:
+        ways_by_id[way.id] = {"id": way.id, "nodes": way.nodes, "tags": way.tags}
+    for rel in data.relations:
+        if is_route_relation(rel.tags):
+            relations_by_id[rel.id] = [m.ref for m in rel.members if m.type == "way"]
 
+    return node_ids, lats, lons, ways_by_id, relations_by_id
+
+
+def merge_paths_tables(paths, tables):
+    """Fusionne les tables de parse_paths_file dans l'ordre des fichiers."""
     nodes = {}
     ways_by_id = {}
+    relations_by_id = {}
 
-    for el in elements:
-        etype = el.get("type")
-        if etype == "node":
-            nodes[el["id"]] = el
-        elif etype == "way":
-            ways_by_id[el["id"]] = el
+    for path, (node_ids, lats, lons, ways, relations) in zip(paths, tables):
+        print(f"Lecture du fichier principal (paths) : {path}")
+        for nid, lat, lon in zip(node_ids, lats, lons):
+            nodes[nid] = {"id": nid, "lat": lat, "lon": lon}
+        ways_by_id.update(ways)
+        relations_by_id.update(relations)
 
     print(f"  Nodes (chemins) : {len(nodes)}")
     print(f"  Ways  (chemins) : {len(ways_by_id)}")
-    return nodes, ways_by_id
+    return nodes, ways_by_id, relations_by_id
+
+
+def load_nordics_paths(*paths: Path):
+    """
+    Lit un ou plusieurs fichiers de chemins (JSON Overpass ou .osm.pbf)
+    et fusionne leurs nodes / ways.
+
+    relations_by_id : route_id -> [way_ids membres] (relations hiking/ski)
+    """
+    return merge_paths_tables(paths, [parse_paths_file(path) for path in paths])
 
 
 # -----------------------------
@@ -72,111 +135,147 @@ def load_excluded_hut_ids(path: Path):
 # -----------------------------
 # Chargement des huts par pays
 # -----------------------------
-def load_huts_per_country(hut_sources, nodes, excluded_ids=None):
+def parse_hut_file(path: Path, cc, excluded_ids=frozenset()):
     """
-    hut_sources : liste de (fichier_json, country_code)
+    Lit un fichier de huts (JSON Overpass ou .osm.pbf) sans rien partager
+    avec l'appelant (exécutable dans un autre processus).
 
     On garde :
       - node/way/relation avec centre géométrique,
       - avec un 'name' non vide,
       - pas dans excluded_ids.
-    On stocke tous les tags OSM dans hut_meta["tags"].
+    Renvoie (éléments lus, [(node_id, lat, lon, hut_meta)]) ou None si le
+    fichier n'existe pas. hut_meta["tags"] contient tous les tags OSM.
     """
-    if excluded_ids is None:
-        excluded_ids = set()
-
-    hut_ids = set()
-    hut_meta = {}
-
-    for path, cc in hut_sources:
-        if not path.exists():
-            print(f"ATTENTION: fichier huts {path} introuvable pour {cc}, on ignore.")
-            continue
-
-        print(f"Lecture huts {cc} : {path}")
-        data = json.loads(path.read_text(encoding="utf-8"))
-        elements = data.get("elements", [])
-
-        count_elements = 0
-        kept_as_hut = 0
-
-        for el in elements:
-            etype = el.get("type")
-            if etype not in ("node", "way", "relation"):
-                continue
-
-            node_id = el["id"]
-            count_elements += 1
-
-            # Coordonnées
+    if not path.exists():
+        return None
+
+    data = load_hut_records(path, cc)
+    count_elements = len(data)
+    rows = []
+    for etype, records in (("node", data.nodes), ("way", data.ways),
+                           ("relation", data.relations)):
+        for el in records:
+            # Coordonnées (centre géométrique pour les ways / relations)
             if etype == "node":
-                lat = el.get("lat")
-                lon = el.get("lon")
+                lat, lon = el.lat, el.lon
+            elif el.center is not None:
+                lat, lon = el.center.lat, el.center.lon
             else:
-                center = el.get("center")
-                if not center:
-                    continue
-                lat = center.get("lat")
-                lon = center.get("lon")
-
-            if lat is None or lon is None:
                 continue
 
-            tags = el.get("tags", {}) or {}
+            tags = el.tags
             name = tags.get("name", "")
             if not name or not name.strip():
                 # on vire les objets sans nom
                 continue
 
-            if node_id in excluded_ids:
+            if el.id in excluded_ids:
                 continue
 
-            tourism = tags.get("tourism")
-            amenity = tags.get("amenity")
-            shelter_type = tags.get("shelter_type")
-            operator = tags.get("operator", "") or ""
+            rows.append((el.id, lat, lon, {
+                "osm_id":       el.id,
+                "osm_type":     etype,
+                "name":         name,
+                "country_code": cc,
+                "tourism":      tags.get("tourism"),
+                "amenity":      tags.get("amenity"),
+                "shelter_type": tags.get("shelter_type"),
+                "operator":     tags.get("operator", "") or "",
+                "tags":         tags,
+            }))
+
+    return count_elements, rows
+
 
+def merge_hut_tables(hut_sources, tables, nodes):
+    """
+    Fusionne les tables de parse_hut_file dans l'ordre de hut_sources.
+    Les nodes des huts sont ajoutés à nodes ; si le node existe déjà (node
+    de chemin), sa position prime.
+    """
+    hut_ids = set()
+    hut_meta = {}
+
+    for (path, cc), table in zip(hut_sources, tables):
+        if table is None:
+            print(f"ATTENTION: fichier huts {path} introuvable pour {cc}, on ignore.")
+            continue
+
+        print(f"Lecture huts {cc} : {path}")
+        count_elements, rows = table
+
+        for node_id, lat, lon, meta in rows:
             # S'assurer que nodes[node_id] a lat/lon/tags
             if node_id not in nodes:
                 nodes[node_id] = {
                     "id": node_id,
                     "lat": lat,
                     "lon": lon,
-                    "tags": tags,
+                    "tags": meta["tags"],
                 }
             else:
                 nodes[node_id]["lat"] = nodes[node_id].get("lat", lat)
                 nodes[node_id]["lon"] = nodes[node_id].get("lon", lon)
 
             hut_ids.add(node_id)
-            hut_meta[node_id] = {
-                "osm_id":       node_id,
-                "name":         name,
-                "country_code": cc,
-                "tourism":      tourism,
-                "amenity":      amenity,
-                "shelter_type": shelter_type,
-                "operator":     operator,
-                "tags":         tags,
-            }
-            kept_as_hut += 1
+            hut_meta[node_id] = meta
 
         print(f"  Éléments total (nodes/ways/relations) pour {cc}: {count_elements}")
-        print(f"  Huts gardées pour {cc}: {kept_as_hut}")
+        print(f"  Huts gardées pour {cc}: {len(rows)}")
 
     print(f"Total de Huts distinctes (avant ancrage): {len(hut_ids)}")
     return hut_ids, hut_meta
 
 
+def load_huts_per_country(hut_sources, nodes, excluded_ids=None):
+    """
+    hut_sources : liste de (fichier_json_ou_pbf, country_code)
+    Voir parse_hut_file pour les huts gardées.
+    """
+    if excluded_ids is None:
+        excluded_ids = set()
+    tables = [parse_hut_file(path, cc, excluded_ids) for path, cc in hut_sources]
+    return merge_hut_tables(hut_sources, tables, nodes)
+
+
+def load_inputs(paths_files, hut_sources, excluded_ids=None, workers=None):
+    """
+    Chemins + huts, chaque fichier lu dans son propre processus, puis une
+    fusion déterministe (même résultat que load_nordics_paths suivi de
+    load_huts_per_country). workers=1 : tout dans le processus courant.
+    Renvoie (nodes, ways_by_id, relations_by_id, hut_ids, hut_meta).
+    """
+    if excluded_ids is None:
+        excluded_ids = set()
+    if workers is None:
+        workers = min(len(paths_files) + len(hut_sources), os.cpu_count() or 1)
+
+    if workers <= 1:
+        paths_tables = [parse_paths_file(path) for path in paths_files]
+        hut_tables = [parse_hut_file(path, cc, excluded_ids) for path, cc in hut_sources]
+    else:
+        print(f"Lecture des {len(paths_files) + len(hut_sources)} fichiers "
+              f"en parallèle ({workers} processus)")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths_futures = [pool.submit(parse_paths_file, path) for path in paths_files]
+            hut_futures = [
+                pool.submit(parse_hut_file, path, cc, excluded_ids)
+                for path, cc in hut_sources
+            ]
+            paths_tables = [f.result() for f in paths_futures]
+            hut_tables = [f.result() for f in hut_futures]
+
+    nodes, ways_by_id, relations_by_id = merge_paths_tables(paths_files, paths_tables)
+    hut_ids, hut_meta = merge_hut_tables(hut_sources, hut_tables, nodes)
+    return nodes, ways_by_id, relations_by_id, hut_ids, hut_meta
+
+
 # -----------------------------
 # Graphe des chemins
 # -----------------------------
-def build_graph(nodes, ways_by_id):
-    graph = defaultdict(list)
-
-    print("Construction du graphe (adjacence chemins)...")
-    edge_count = 0
-
+def iter_way_segments(nodes, ways_by_id):
+    """(way, n1, n2, distance_m) pour chaque segment de way entre deux nodes connus."""
     for way_id, way in ways_by_id.items():
         node_ids = way.get("nodes", [])
         if len(node_ids) < 2:
@@ -191,17 +290,63 @@ def build_graph(nodes, ways_by_id):
 
             lat1, lon1 = nodes[n1]["lat"], nodes[n1]["lon"]
             lat2, lon2 = nodes[n2]["lat"], nodes[n2]["lon"]
-            dist = haversine(lat1, lon1, lat2, lon2)
+            yield way, n1, n2, haversine(lat1, lon1, lat2, lon2)
 
-            graph[n1].append((n2, dist))
-            graph[n2].append((n1, dist))
-            edge_count += 2
+
+def build_graph(nodes, ways_by_id):
+    graph = defaultdict(list)
+
+    print("Construction du graphe (adjacence chemins)...")
+    edge_count = 0
+
+    for _, n1, n2, dist in iter_way_segments(nodes, ways_by_id):
+        graph[n1].append((n2, dist))
+        graph[n2].append((n1, dist))
+        edge_count += 2
 
     print(f"  Nombre d'arêtes (x2): {edge_count}")
     print(f"  Nombre de nœuds dans le graphe: {len(graph)}")
     return graph
 
 
+def build_graph_profiles(nodes, ways_by_id, profiles, elevations=None):
+    """
+    Comme build_graph, et dans le même parcours des ways, le coût de chaque
+    arête pour chaque profil (voir edge_profiles.PROFILES).
+
+    Renvoie (graph, weights) avec weights[profil][node] : array de coûts
+    parallèle à graph[node] (math.inf = arête fermée pour ce profil).
+    """
+    graph = defaultdict(list)
+    weights = {name: defaultdict(lambda: array("d")) for name in profiles}
+    cost_fns = [(weights[name], PROFILES[name]["cost"]) for name in profiles]
+    elevations = elevations or {}
+
+    print(f"Construction du graphe (profils : {', '.join(profiles)})...")
+    edge_count = 0
+
+    for way, n1, n2, dist in iter_way_segments(nodes, ways_by_id):
+        graph[n1].append((n2, dist))
+        graph[n2].append((n1, dist))
+        edge_count += 2
+        tags = way.get("tags", {}) or {}
+        ele1 = elevations.get(n1)
+        ele2 = elevations.get(n2)
+        for profile_weights, cost_fn in cost_fns:
+            cost = cost_fn(tags, dist, ele1, ele2)
+            profile_weights[n1].append(cost)
+            profile_weights[n2].append(cost)
+
+    print(f"  Nombre d'arêtes (x2): {edge_count}")
+    print(f"  Nombre de nœuds dans le graphe: {len(graph)}")
+    for name in profiles:
+        closed = sum(
+            1 for costs in weights[name].values() for c in costs if c == math.inf
+        )
+        print(f"  Profil {name} : {closed} arêtes (x2) fermées")
+    return graph, weights
+
+
 # -----------------------------
 # Index spatial (pour ancrage huts->chemins)
 # -----------------------------
@@ -218,19 +363,13 @@ def build_spatial_index(nodes, graph, cell_size_deg=0.05):
     return cells
 
 
-def find_nearest_graph_node_for_hut(hut_id, nodes, graph, cells,
-                                    max_radius_m=3_000.0, cell_size_deg=0.05):
+def find_nearest_graph_node(lat, lon, nodes, cells,
+                            max_radius_m=3_000.0, cell_size_deg=0.05):
     """
-    Renvoie l'ID du noeud de chemin le plus proche de la hut,
-    à moins de max_radius_m, ou None.
+    Renvoie (node_id, distance_m) du noeud de chemin le plus proche de
+    (lat, lon) dans les cellules voisines, à moins de max_radius_m,
+    ou (None, None).
     """
-    if hut_id in graph:
-        return hut_id
-
-    hut = nodes[hut_id]
-    lat = hut["lat"]
-    lon = hut["lon"]
-
     i0 = int(lat / cell_size_deg)
     j0 = int(lon / cell_size_deg)
 
@@ -248,11 +387,34 @@ def find_nearest_graph_node_for_hut(hut_id, nodes, graph, cells,
                     best_node = nid
 
     if best_node is not None and best_dist <= max_radius_m:
-        return best_node
-    return None
+        return best_node, best_dist
+    return None, None
 
 
-def compute_hut_anchors(nodes, graph, hut_ids, max_radius_m=3_000.0):
+def find_nearest_graph_node_for_hut(hut_id, nodes, graph, cells,
+                                    max_radius_m=3_000.0, cell_size_deg=0.05):
+    """
+    Renvoie l'ID du noeud de chemin le plus proche de la hut,
+    à moins de max_radius_m, ou None.
+    """
+    if hut_id in graph:
+        return hut_id
+
+    hut = nodes[hut_id]
+    best_node, _ = find_nearest_graph_node(
+        hut["lat"], hut["lon"], nodes, cells,
+        max_radius_m=max_radius_m, cell_size_deg=cell_size_deg,
+    )
+    return best_node
+
+
+def compute_hut_anchors(nodes, graph, hut_ids, max_radius_m=3_000.0, order=None):
+    """
+    Renvoie (anchor_by_hut, huts_by_anchor).
+
+    Avec order (node_order.NodeOrder), nodes et graph sont renumérotés :
+    les huts restent en ids OSM, les ancrages sont des numéros internes.
+    """
     print("Construction index spatial pour les ancrages huts->chemins...")
     cell_size_deg = 0.05
     cells = build_spatial_index(nodes, graph, cell_size_deg=cell_size_deg)
@@ -268,7 +430,7 @@ def compute_hut_anchors(nodes, graph, hut_ids, max_radius_m=3_000.0):
             print(f"  Ancrage hut {idx}/{len(hut_ids_list)} (osm_id={hut_id})")
 
         anchor = find_nearest_graph_node_for_hut(
-            hut_id, nodes, graph, cells,
+            hut_id if order is None else order.index[hut_id], nodes, graph, cells,
             max_radius_m=max_radius_m,
             cell_size_deg=cell_size_deg
         )
@@ -287,109 +449,371 @@ def compute_hut_anchors(nodes, graph, hut_ids, max_radius_m=3_000.0):
 # -----------------------------
 # Filtrage des liaisons indirectes
 # -----------------------------
+def min_detour_km(best_dist_for_pair):
+    """
+    Pour chaque liaison A-B, le plus court détour par une hut intermédiaire :
+      min sur C de d(A,C) + d(C,B)   (math.inf si aucune C)
+    On ne parcourt que les voisins communs de A et B.
+    """
+    neighbours = defaultdict(dict)
+    for (a, b), d in best_dist_for_pair.items():
+        neighbours[a][b] = d
+        neighbours[b][a] = d
+
+    detour = {}
+    for (a, b) in best_dist_for_pair:
+        near_a, near_b = neighbours[a], neighbours[b]
+        if len(near_a) > len(near_b):
+            near_a, near_b = near_b, near_a
+        best = math.inf
+        for c, d_1 in near_a.items():
+            d_2 = near_b.get(c)
+            if d_2 is not None and d_1 + d_2 < best:
+                best = d_1 + d_2
+        detour[(a, b)] = best
+    return detour
+
+
+def prune_epsilon(d_ab, detour_km):
+    """
+    Plus petit epsilon pour lequel A-B est supprimée (détour / direct - 1),
+    None si aucune hut intermédiaire.
+    """
+    if detour_km == math.inf:
+        return None
+    if d_ab <= 0.0:
+        return 0.0 if detour_km <= 0.0 else None
+    return detour_km / d_ab - 1.0
+
+
 def prune_redundant_edges(best_dist_for_pair, epsilon=0.05):
     """
     Supprime les liaisons A-B pour lesquelles il existe une hut C telle que :
       d(A,C) + d(C,B) <= d(A,B) * (1 + epsilon)
+    (les détours sont tous calculés sur les liaisons d'origine).
+    Renvoie {(a, b): détour minimal en km} pour toutes les liaisons d'origine.
     """
-    huts = set()
-    for (a, b) in best_dist_for_pair.keys():
-        huts.add(a)
-        huts.add(b)
+    print(f"Filtrage des liaisons avec hut intermédiaire (pairs={len(best_dist_for_pair)})...")
+    detour = min_detour_km(best_dist_for_pair)
 
-    def dist(a, b):
-        if a == b:
-            return 0.0
-        key = (a, b) if a < b else (b, a)
-        return best_dist_for_pair.get(key)
+    to_remove = [
+        key for key, d_ab in best_dist_for_pair.items()
+        if detour[key] <= d_ab * (1.0 + epsilon)
+    ]
+    print(f"  Liaisons supprimées (indirectes): {len(to_remove)}")
 
-    to_remove = set()
+    for key in to_remove:
+        del best_dist_for_pair[key]
+    return detour
 
-    pairs_items = list(best_dist_for_pair.items())
-    print(f"Filtrage des liaisons avec hut intermédiaire (pairs={len(pairs_items)})...")
 
-    for (a, b), d_ab in pairs_items:
-        if (a, b) in to_remove:
-            continue
-        for c in huts:
-            if c == a or c == b:
-                continue
-            d_ac = dist(a, c)
-            if d_ac is None:
-                continue
-            d_cb = dist(c, b)
-            if d_cb is None:
-                continue
-            if d_ac + d_cb <= d_ab * (1.0 + epsilon):
-                to_remove.add((a, b))
+# -----------------------------
+# Checkpoints de la boucle Dijkstra
+# -----------------------------
+def dijkstra_fingerprint(graph, anchor_by_hut, max_distance_km):
+    """
+    Empreinte du graphe, des ancrages et des paramètres : un checkpoint
+    n'est réutilisé que si elle est identique.
+    """
+    h = hashlib.sha256()
+    h.update(repr(("max_distance_km", float(max_distance_km))).encode())
+    h.update(repr(sorted(anchor_by_hut.items())).encode())
+    for node in sorted(graph):
+        h.update(repr((node, sorted(graph[node]))).encode())
+    return h.hexdigest()
+
+
+def load_checkpoint(path: Path, fingerprint):
+    """
+    Relit un checkpoint : un en-tête {"fingerprint": ...} puis des lots
+    {hut_source: {hut_target: d_km}} ajoutés au fil du calcul.
+    Renvoie None si absent ou invalide, sinon les huts déjà calculées.
+    """
+    if not path.exists():
+        return None
+    done = {}
+    with path.open("rb") as f:
+        try:
+            header = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            return None
+        if header.get("fingerprint") != fingerprint:
+            print(f"Checkpoint {path} ignoré : graphe ou paramètres modifiés.")
+            return None
+        while True:
+            try:
+                done.update(pickle.load(f))
+            except EOFError:
                 break
+            except pickle.UnpicklingError:
+                # dernier lot tronqué (interruption pendant l'écriture)
+                break
+    return done
 
-    print(f"  Liaisons supprimées (indirectes): {len(to_remove)}")
 
-    for key in to_remove:
-        if key in best_dist_for_pair:
-            del best_dist_for_pair[key]
+def start_checkpoint(path: Path, fingerprint, done):
+    """(Ré)écrit le fichier de checkpoint avec les huts déjà calculées."""
+    path.parent.mkdir(exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        pickle.dump({"fingerprint": fingerprint}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if done:
+            pickle.dump(done, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+
+
+def append_checkpoint(path: Path, batch):
+    with path.open("ab") as f:
+        pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
 
 
 # -----------------------------
 # Graphe Hut <-> Hut
 # -----------------------------
-def build_hut_graph(nodes, graph, hut_ids, hut_meta,
-                    anchor_by_hut, huts_by_anchor,
-                    max_distance_km=40.0):
+def compute_pairs_by_source(graph, anchor_by_hut, huts_by_anchor,
+                            max_distance_km=40.0, sources=None,
+                            checkpoint_path=None, resume=False,
+                            checkpoint_every=CHECKPOINT_EVERY,
+                            engine="python"):
+    """
+    Lance le moteur de plus court chemin (voir shortest_path.ENGINES) pour
+    chaque hut source (par défaut toutes les huts ancrées).
+    Renvoie {hut_source: {hut_target: distance_km}}.
+
+    Avec checkpoint_path, les résultats sont ajoutés au fichier toutes les
+    checkpoint_every huts (à la fin d'un lot du moteur) ; avec resume=True,
+    les huts d'un checkpoint valide ne sont pas recalculées. Sans
+    checkpoint_path, ni empreinte ni fichier.
+    """
     max_distance_m = max_distance_km * 1000.0
 
-    hut_ids_with_anchor = sorted(anchor_by_hut.keys())
-    print(f"Nombre de huts avec ancrage dans le graphe: {len(hut_ids_with_anchor)}")
-
+    if sources is None:
+        sources = anchor_by_hut.keys()
+    sources = sorted(sources)
+
+    pairs_by_source = {}
+    if checkpoint_path is not None:
+        fingerprint = dijkstra_fingerprint(graph, anchor_by_hut, max_distance_km)
+        done = load_checkpoint(checkpoint_path, fingerprint) if resume else None
+        if done:
+            wanted = set(sources)
+            pairs_by_source = {h: r for h, r in done.items() if h in wanted}
+            print(f"Reprise : {len(pairs_by_source)}/{len(sources)} huts déjà "
+                  f"calculées ({checkpoint_path})")
+        start_checkpoint(checkpoint_path, fingerprint, done)
+
+    todo = [h for h in sources if h not in pairs_by_source]
+    if not todo:
+        return pairs_by_source
+
+    runner = make_engine(engine, graph, anchor_by_hut, huts_by_anchor, max_distance_m)
+
+    batch = {}
+    last_write = time.monotonic()
+    step = runner.batch_size
+
+    already_done = len(sources) - len(todo)
+    for start in range(0, len(todo), step):
+        chunk = todo[start:start + step]
+        idx = already_done + start + 1
+        if start == 0 or (idx + len(chunk) - 1) // 10 > (idx - 1) // 10:
+            print(f"  Dijkstra hut {idx}/{len(sources)} "
+                  f"(hut osm_id={chunk[0]}, anchor={anchor_by_hut[chunk[0]]}, "
+                  f"moteur={runner.name})")
+        results = runner.run(chunk)
+        for hut_source in chunk:
+            pairs_by_source[hut_source] = results[hut_source]
+
+        if checkpoint_path is not None:
+            batch.update(results)
+            if (len(batch) >= checkpoint_every
+                    or time.monotonic() - last_write >= CHECKPOINT_MAX_AGE_S):
+                append_checkpoint(checkpoint_path, batch)
+                batch = {}
+                last_write = time.monotonic()
+
+    if checkpoint_path is not None and batch:
+        append_checkpoint(checkpoint_path, batch)
+
+    # Ordre des sources identique quel que soit le point de reprise
+    return {h: pairs_by_source[h] for h in sources}
+
+
+def merge_pairs_by_source(pairs_by_source):
+    """{source: {target: d}} -> {(min_id, max_id): d} (plus courte distance)"""
     best_dist_for_pair = {}
+    for hut_source, reached in pairs_by_source.items():
+        for hut_target, d_km in reached.items():
+            a = min(hut_source, hut_target)
+            b = max(hut_source, hut_target)
+            old = best_dist_for_pair.get((a, b))
+            if old is None or d_km < old:
+                best_dist_for_pair[(a, b)] = d_km
+    return best_dist_for_pair
 
-    for idx, hut_source in enumerate(hut_ids_with_anchor, start=1):
-        anchor_src = anchor_by_hut[hut_source]
-        if idx % 10 == 0 or idx == 1:
-            print(f"  Dijkstra hut {idx}/{len(hut_ids_with_anchor)} "
-                  f"(hut osm_id={hut_source}, anchor={anchor_src})")
-
-        dist_dict = {anchor_src: 0.0}
-        heap = [(0.0, anchor_src)]
-
-        while heap:
-            d, node = heapq.heappop(heap)
-            if d > max_distance_m:
-                break
-            if d != dist_dict.get(node, float("inf")):
-                continue
-
-            # Si ce noeud est l'ancrage d'une ou plusieurs huts (autres que la source)
-            if node in huts_by_anchor and node != anchor_src:
-                d_km = d / 1000.0
-                for hut_target in huts_by_anchor[node]:
-                    if hut_target == hut_source:
-                        continue
-                    a = min(hut_source, hut_target)
-                    b = max(hut_source, hut_target)
-                    old = best_dist_for_pair.get((a, b))
-                    if old is None or d_km < old:
-                        best_dist_for_pair[(a, b)] = d_km
-
-                # On ne propage pas au-delà : on ne veut pas "sauter" des huts
-                continue
-
-            for neigh, w in graph.get(node, []):
-                nd = d + w
-                if nd < dist_dict.get(neigh, float("inf")) and nd <= max_distance_m:
-                    dist_dict[neigh] = nd
-                    heapq.heappush(heap, (nd, neigh))
 
+def edges_from_pairs_by_source(pairs_by_source, epsilon=PRUNE_EPSILON):
+    """
+    [(a, b, distance_km, min_prune_epsilon)] ; epsilon=None garde toutes
+    les liaisons (min_prune_epsilon permet alors de filtrer après coup).
+    """
+    best_dist_for_pair = merge_pairs_by_source(pairs_by_source)
     print(f"  Paires hut-hut brutes avant filtrage: {len(best_dist_for_pair)}")
 
-    prune_redundant_edges(best_dist_for_pair, epsilon=0.05)
+    if epsilon is None:
+        detour = min_detour_km(best_dist_for_pair)
+    else:
+        detour = prune_redundant_edges(best_dist_for_pair, epsilon=epsilon)
 
     edges = []
     for (a, b), d_km in best_dist_for_pair.items():
-        edges.append((a, b, d_km))
+        edges.append((a, b, d_km, prune_epsilon(d_km, detour[(a, b)])))
 
     print(f"Nombre de liens hut-hut après filtrage: {len(edges)}")
+    return edges
+
+
+# -----------------------------
+# Mise à jour partielle (huts ajoutées / retirées / exclues)
+# -----------------------------
+def reload_huts_on_state(state, hut_sources, excluded_ids):
+    """
+    Relit les fichiers de huts sur les nodes de l'état en cache. Les nodes
+    des anciennes huts (doublons retirés compris) hors graphe sont retirés
+    avant la relecture pour reprendre leur position actuelle.
+    Renvoie (hut_ids, hut_meta, huts déplacées).
+    """
+    nodes = state["nodes"]
+    graph = state["graph"]
+    old_positions = {
+        hid: (nodes[hid]["lat"], nodes[hid]["lon"])
+        for hid in state["hut_ids"] if hid in nodes
+    }
+    for hid in state["hut_ids"] | state.get("duplicate_hut_ids", set()):
+        if hid not in graph:
+            nodes.pop(hid, None)
+
+    hut_ids, hut_meta = load_huts_per_country(hut_sources, nodes, excluded_ids)
+    moved = {
+        hid for hid in hut_ids & old_positions.keys()
+        if (nodes[hid]["lat"], nodes[hid]["lon"]) != old_positions[hid]
+    }
+    # Nodes des huts disparues (hors graphe) : déjà retirés ci-dessus
+    return hut_ids, hut_meta, moved
+
+
+def delta_anchors(state, hut_ids, moved):
+    """
+    Ancrages du nouveau jeu de huts : le graphe n'a pas changé, seules les
+    huts nouvelles ou déplacées sont ancrées à nouveau.
+    """
+    nodes = state["nodes"]
+    graph = state["graph"]
+    old_hut_ids = state["hut_ids"]
+    old_anchor_by_hut = state["anchor_by_hut"]
+
+    to_anchor = [h for h in hut_ids if h not in old_hut_ids or h in moved]
+    cells = None
+    if to_anchor:
+        cells = state.get("cells") or build_spatial_index(nodes, graph)
+
+    anchor_by_hut = {}
+    for hut_id in hut_ids:
+        if hut_id in old_hut_ids and hut_id not in moved:
+            if hut_id in old_anchor_by_hut:
+                anchor_by_hut[hut_id] = old_anchor_by_hut[hut_id]
+            continue
+        anchor = find_nearest_graph_node_for_hut(
+            hut_id, nodes, graph, cells, max_radius_m=state["anchor_radius_m"]
+        )
+        if anchor is not None:
+            anchor_by_hut[hut_id] = anchor
+
+    huts_by_anchor = defaultdict(list)
+    for hut_id, anchor in anchor_by_hut.items():
+        huts_by_anchor[anchor].append(hut_id)
+    return anchor_by_hut, huts_by_anchor
+
+
+def delta_pairs_by_source(graph, old_anchor_by_hut, old_pairs_by_source,
+                          anchor_by_hut, huts_by_anchor, max_distance_km=40.0,
+                          engine="python"):
+    """
+    Recalcule pairs_by_source après un changement du jeu de huts, sans
+    relancer le Dijkstra de toutes les huts.
+
+    - retirée (ou ancrage changé) : les sources qui l'atteignaient sont
+      recalculées, son ancrage ne bloque peut-être plus leur recherche ;
+    - ajoutée : son Dijkstra (nouveaux ancrages) donne exactement les
+      sources dont la recherche atteint son ancrage (graphe non orienté,
+      même règle de blocage dans les deux sens) ; elles sont recalculées.
+    """
+    removed = {h for h, a in old_anchor_by_hut.items() if anchor_by_hut.get(h) != a}
+    added = {h for h, a in anchor_by_hut.items() if old_anchor_by_hut.get(h) != a}
+    print(f"Huts ancrées retirées / ajoutées : {len(removed)} / {len(added)}")
+
+    new_pairs = compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor,
+        max_distance_km=max_distance_km, sources=added, engine=engine,
+    )
+    affected = set()
+    for reached in new_pairs.values():
+        affected.update(reached)
+    for hut_source, reached in old_pairs_by_source.items():
+        if not removed.isdisjoint(reached):
+            affected.add(hut_source)
+    affected = {h for h in affected if h in anchor_by_hut and h not in added}
+    print(f"Huts sources à recalculer : {len(affected) + len(added)} / {len(anchor_by_hut)}")
+
+    new_pairs.update(compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor,
+        max_distance_km=max_distance_km, sources=affected, engine=engine,
+    ))
+    # Même ordre des sources qu'un build complet
+    return {
+        h: new_pairs[h] if h in new_pairs else old_pairs_by_source[h]
+        for h in sorted(anchor_by_hut)
+    }
+
+
+def edges_by_profile(graph, weights, anchor_by_hut, huts_by_anchor,
+                     max_distance_km=40.0, engine="python"):
+    """
+    Un jeu d'arêtes hut-hut par profil, sur le graphe et les ancrages
+    partagés ; max_distance_km s'applique au coût du profil.
+    """
+    result = {}
+    for name, profile_weights in weights.items():
+        print(f"Profil {name} :")
+        pairs_by_source = compute_pairs_by_source(
+            profile_graph(graph, profile_weights), anchor_by_hut, huts_by_anchor,
+            max_distance_km=max_distance_km, engine=engine,
+        )
+        result[name] = edges_from_pairs_by_source(pairs_by_source)
+    return result
+
+
+def build_hut_graph(nodes, graph, hut_ids, hut_meta,
+                    anchor_by_hut, huts_by_anchor,
+                    max_distance_km=40.0, profile_weights=None):
+    """
+    Renvoie (hut_ids_with_anchor, edges) ; avec profile_weights (voir
+    build_graph_profiles), edges est {profil: arêtes}.
+    """
+    hut_ids_with_anchor = sorted(anchor_by_hut.keys())
+    print(f"Nombre de huts avec ancrage dans le graphe: {len(hut_ids_with_anchor)}")
+
+    if profile_weights is not None:
+        return hut_ids_with_anchor, edges_by_profile(
+            graph, profile_weights, anchor_by_hut, huts_by_anchor,
+            max_distance_km=max_distance_km,
+        )
+
+    pairs_by_source = compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor, max_distance_km=max_distance_km
+    )
+    edges = edges_from_pairs_by_source(pairs_by_source)
     return hut_ids_with_anchor, edges
 
 
@@ -444,6 +868,7 @@ def write_hut_csv(nodes, hut_ids, hut_meta, edges, output_dir: Path):
         ":START_ID(Hut)",
         ":END_ID(Hut)",
         "distance_km:float",
+        "min_prune_epsilon:float",
     ]
 
     print(f"Écriture {edges_csv}")
@@ -451,39 +876,277 @@ def write_hut_csv(nodes, hut_ids, hut_meta, edges, output_dir: Path):
         writer = csv.DictWriter(f, fieldnames=edge_fields)
         writer.writeheader()
 
-        for start_id, end_id, dist_km in edges:
+        for start_id, end_id, dist_km, min_eps in edges:
             row = {
                 ":START_ID(Hut)": start_id,
                 ":END_ID(Hut)": end_id,
                 "distance_km:float": dist_km,
+                # vide : aucune hut intermédiaire, jamais supprimée
+                "min_prune_epsilon:float": "" if min_eps is None else round(min_eps, 6),
             }
             writer.writerow(row)
 
     print("CSV Huts générés.")
 
 
+def write_profile_edges_csv(edges, profile, output_dir: Path):
+    """huts_edges_<profil>.csv : coût du profil en km équivalents à plat."""
+    output_dir.mkdir(exist_ok=True)
+    edges_csv = output_dir / f"huts_edges_{profile}.csv"
+    speed_kmh = PROFILES[profile]["speed_kmh"]
+
+    edge_fields = [
+        ":START_ID(Hut)",
+        ":END_ID(Hut)",
+        "cost_km:float",
+    ]
+    if speed_kmh:
+        edge_fields.append("duration_h:float")
+
+    print(f"Écriture {edges_csv}")
+    with edges_csv.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=edge_fields)
+        writer.writeheader()
+
+        for start_id, end_id, cost_km, _ in edges:
+            row = {
+                ":START_ID(Hut)": start_id,
+                ":END_ID(Hut)": end_id,
+                "cost_km:float": cost_km,
+            }
+            if speed_kmh:
+                row["duration_h:float"] = cost_km / speed_kmh
+            writer.writerow(row)
+
+
+# -----------------------------
+# Cache d'état (pour les mises à jour incrémentales)
+# -----------------------------
+def save_build_state(state, path: Path = STATE_FILE):
+    path.parent.mkdir(exist_ok=True)
+    state = dict(state, version=STATE_VERSION)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+    print(f"État du build sauvegardé dans {path}")
+
+
+def load_build_state(path: Path = STATE_FILE):
+    if not path.exists():
+        raise SystemExit(
+            f"Pas d'état en cache ({path}) : lancer d'abord build_cabane_graph.py"
+        )
+    with path.open("rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != STATE_VERSION:
+        raise SystemExit(
+            f"État en cache {path} obsolète : relancer build_cabane_graph.py"
+        )
+    print(f"État du build chargé depuis {path}")
+    return state
+
+
 # -----------------------------
 # MAIN
 # -----------------------------
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Construit le graphe Hut <-> Hut (CSV Neo4j) depuis OSM."
+    )
+    parser.add_argument(
+        "--pbf", action="append", default=[], metavar="CC=FICHIER",
+        help="Extrait .osm.pbf local (type Geofabrik) pour le pays CC "
+             "(ex. SE=sweden-latest.osm.pbf). Répétable. Remplace les JSON "
+             "Overpass pour les chemins et les huts.",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Reprend la boucle Dijkstra depuis le dernier checkpoint "
+             f"({CHECKPOINT_FILE}) s'il correspond au même graphe.",
+    )
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=None, metavar="N",
+        help="Écrit un checkpoint toutes les N huts sources (avec --resume "
+             f"seul : {CHECKPOINT_EVERY}). Sans ces options, pas de checkpoint.",
+    )
+    parser.add_argument(
+        "--engine", choices=sorted(ENGINES), default="python",
+        help="Moteur de plus court chemin (défaut: python, référence).",
+    )
+    parser.add_argument(
+        "--profile", action="append", default=[], choices=sorted(PROFILES),
+        help="Écrit aussi neo4j_huts/huts_edges_<profil>.csv avec les coûts "
+             "de ce profil. Répétable ; le graphe n'est construit qu'une fois.",
+    )
+    parser.add_argument(
+        "--dem", type=Path, default=None, metavar="FICHIER",
+        help="MNT raster (GeoTIFF EPSG:4326) pour le profil time_dem.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, metavar="N",
+        help="Processus pour lire les fichiers d'entrée (défaut: un par "
+             "fichier, borné par le nombre de CPU ; 1 = lecture séquentielle).",
+    )
+    parser.add_argument(
+        "--distance-matrix", action="store_true",
+        help="Garde aussi toutes les distances hut-hut du rayon (avec la hut "
+             "intermédiaire) dans cache/hut_distances.bin ; voir "
+             "hut_distance_matrix.py.",
+    )
+    parser.add_argument(
+        "--keep-indirect", action="store_true",
+        help="N'élimine pas les liaisons indirectes : huts_edges.csv garde "
+             "toutes les paires, à filtrer sur min_prune_epsilon.",
+    )
+    parser.add_argument(
+        "--no-dedup", action="store_true",
+        help="Garde les doublons de huts (même nom, à quelques dizaines de "
+             "mètres) au lieu de les fusionner ; voir hut_duplicates.py.",
+    )
+    parser.add_argument(
+        "--node-order", choices=NODE_ORDERS, default="osm",
+        help="Renumérote les nodes le long d'une courbe de remplissage "
+             "(hilbert, zorder) pour l'ancrage et le Dijkstra : des nodes "
+             "voisins sur le terrain restent voisins en mémoire. Le cache "
+             "garde les ids OSM ; voir node_order.py (bench).",
+    )
+    parser.add_argument(
+        "--delta", action="store_true",
+        help="Relit seulement les huts (et excluded_huts.txt) et ne relance le "
+             f"Dijkstra que pour les huts touchées, à partir de {STATE_FILE}. "
+             "Les chemins ne sont pas relus : voir update_from_osc.py.",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_pbf_sources(specs):
+    """['SE=sweden.osm.pbf', ...] -> [(Path, 'SE'), ...]"""
+    sources = []
+    for spec in specs:
+        cc, sep, path = spec.partition("=")
+        if not sep or not cc or not path:
+            raise SystemExit(f"--pbf attend CC=FICHIER, reçu : {spec!r}")
+        sources.append((Path(path), cc.upper()))
+    return sources
+
+
+def run_delta(base_dir, hut_sources, excluded_ids, engine="python", dedup=True,
+              keep_indirect=False, distance_matrix=False):
+    """
+    Build partiel : même sortie qu'un build complet sur le nouveau jeu de
+    huts, avec les mêmes --keep-indirect / --distance-matrix.
+    """
+    state_path = base_dir / STATE_FILE
+    state = load_build_state(state_path)
+
+    hut_ids, hut_meta, moved = reload_huts_on_state(state, hut_sources, excluded_ids)
+    duplicate_hut_ids = set()
+    if dedup:
+        hut_ids, hut_meta, duplicate_hut_ids = drop_duplicate_huts(
+            state["nodes"], hut_ids, hut_meta
+        )
+        moved &= hut_ids
+    print(f"Huts : {len(state['hut_ids'])} -> {len(hut_ids)} "
+          f"({len(moved)} déplacées)")
+    anchor_by_hut, huts_by_anchor = delta_anchors(state, hut_ids, moved)
+
+    pairs_by_source = delta_pairs_by_source(
+        state["graph"], state["anchor_by_hut"], state["pairs_by_source"],
+        anchor_by_hut, huts_by_anchor,
+        max_distance_km=state["max_distance_km"], engine=engine,
+    )
+    edges = edges_from_pairs_by_source(
+        pairs_by_source, epsilon=None if keep_indirect else PRUNE_EPSILON
+    )
+    # import local : hut_distance_matrix importe ce module
+    from hut_distance_matrix import build_matrix, MATRIX_FILE
+    if distance_matrix:
+        build_matrix(pairs_by_source, state["max_distance_km"], base_dir / MATRIX_FILE)
+    elif (base_dir / MATRIX_FILE).exists():
+        print(f"ATTENTION : {MATRIX_FILE} n'est plus à jour "
+              f"(relancer avec --distance-matrix)")
+    write_hut_csv(state["nodes"], hut_ids, hut_meta, edges, base_dir / "neo4j_huts")
+
+    state.update({
+        "hut_ids": hut_ids,
+        "hut_meta": hut_meta,
+        "duplicate_hut_ids": duplicate_hut_ids,
+        "anchor_by_hut": anchor_by_hut,
+        "pairs_by_source": pairs_by_source,
+    })
+    save_build_state(state, state_path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     base_dir = Path(".")
 
-    paths_file = base_dir / "overpass_nordics_paths.json"
-    hut_sources = [
-        (base_dir / "overpass_sweden_huts.json", "SE"),
-        (base_dir / "overpass_norway_huts.json", "NO"),
-        # Finlande ignorée pour l'instant
-    ]
+    if args.pbf:
+        hut_sources = parse_pbf_sources(args.pbf)
+        paths_files = [path for path, _ in hut_sources]
+    else:
+        paths_files = [base_dir / "overpass_nordics_paths.json"]
+        hut_sources = [
+            (base_dir / "overpass_sweden_huts.json", "SE"),
+            (base_dir / "overpass_norway_huts.json", "NO"),
+            # Finlande ignorée pour l'instant
+        ]
 
     excluded_file = base_dir / "excluded_huts.txt"
     excluded_ids = load_excluded_hut_ids(excluded_file)
 
-    nodes, ways_by_id = load_nordics_paths(paths_file)
-    hut_ids, hut_meta = load_huts_per_country(hut_sources, nodes, excluded_ids)
-    graph = build_graph(nodes, ways_by_id)
+    if args.delta:
+        if args.profile:
+            raise SystemExit("--delta ne gère pas --profile : lancer un build complet")
+        if args.node_order != "osm":
+            # le delta reprend le graphe du cache, en ids OSM
+            raise SystemExit("--delta ne gère pas --node-order : lancer un build complet")
+        if args.resume or args.checkpoint_every is not None:
+            raise SystemExit("--delta n'utilise pas de checkpoint : retirer "
+                             "--resume / --checkpoint-every")
+        run_delta(base_dir, hut_sources, excluded_ids, engine=args.engine,
+                  dedup=not args.no_dedup, keep_indirect=args.keep_indirect,
+                  distance_matrix=args.distance_matrix)
+        return
+
+    nodes, ways_by_id, relations_by_id, hut_ids, hut_meta = load_inputs(
+        paths_files, hut_sources, excluded_ids, workers=args.workers
+    )
+    duplicate_hut_ids = set()
+    if not args.no_dedup:
+        hut_ids, hut_meta, duplicate_hut_ids = drop_duplicate_huts(nodes, hut_ids, hut_meta)
+
+    profiles = list(dict.fromkeys(args.profile))
+    if profiles:
+        elevations = None
+        if any(PROFILES[name]["elevation"] for name in profiles):
+            if args.dem is None:
+                raise SystemExit("Le profil time_dem nécessite --dem FICHIER")
+            path_node_ids = {
+                nid for way in ways_by_id.values() for nid in way.get("nodes", [])
+                if nid in nodes
+            }
+            elevations = load_dem_elevations(nodes, path_node_ids, args.dem)
+        graph, profile_weights = build_graph_profiles(
+            nodes, ways_by_id, profiles, elevations
+        )
+    else:
+        graph = build_graph(nodes, ways_by_id)
+
+    # Graphe de travail : ids OSM, ou renumérotés le long de la courbe
+    order = None
+    run_nodes, run_graph = nodes, graph
+    if args.node_order != "osm":
+        order = NodeOrder.from_graph(nodes, graph, hut_ids, curve=args.node_order)
+        run_nodes = order.renumber_nodes(nodes)
+        run_graph = order.renumber_graph(graph)
+        if profiles:
+            profile_weights = order.renumber_weights(profile_weights)
+        print(f"Nodes renumérotés (ordre {args.node_order}) : {len(order)}")
 
     anchor_by_hut, huts_by_anchor = compute_hut_anchors(
-        nodes, graph, hut_ids, max_radius_m=3_000.0
+        run_nodes, run_graph, hut_ids, max_radius_m=ANCHOR_RADIUS_M, order=order
     )
 
     # Debug : lister les huts sans ancrage
@@ -493,16 +1156,55 @@ def main():
         meta = hut_meta.get(hid, {})
         print(f"  {hid} - {meta.get('name', '?')} ({meta.get('country_code', '')})")
 
-    MAX_DISTANCE_KM = 40.0
-    huts_with_anchor, edges = build_hut_graph(
-        nodes, graph, hut_ids, hut_meta,
-        anchor_by_hut, huts_by_anchor,
-        max_distance_km=MAX_DISTANCE_KM
+    print(f"Nombre de huts avec ancrage dans le graphe: {len(anchor_by_hut)}")
+    # Checkpoints seulement sur demande (empreinte du graphe + écritures)
+    checkpoint_path = None
+    if args.resume or args.checkpoint_every is not None:
+        checkpoint_path = base_dir / CHECKPOINT_FILE
+    pairs_by_source = compute_pairs_by_source(
+        run_graph, anchor_by_hut, huts_by_anchor, max_distance_km=MAX_DISTANCE_KM,
+        checkpoint_path=checkpoint_path, resume=args.resume,
+        checkpoint_every=args.checkpoint_every or CHECKPOINT_EVERY,
+        engine=args.engine,
+    )
+    edges = edges_from_pairs_by_source(
+        pairs_by_source, epsilon=None if args.keep_indirect else PRUNE_EPSILON
     )
+    if args.distance_matrix:
+        # import local : hut_distance_matrix importe ce module
+        from hut_distance_matrix import build_matrix, MATRIX_FILE
+        build_matrix(pairs_by_source, MAX_DISTANCE_KM, base_dir / MATRIX_FILE)
 
     output_dir = base_dir / "neo4j_huts"
     write_hut_csv(nodes, hut_ids, hut_meta, edges, output_dir)
 
+    if profiles:
+        profile_edges = edges_by_profile(
+            run_graph, profile_weights, anchor_by_hut, huts_by_anchor,
+            max_distance_km=MAX_DISTANCE_KM, engine=args.engine,
+        )
+        for name in profiles:
+            write_profile_edges_csv(profile_edges[name], name, output_dir)
+
+    if order is not None:
+        anchor_by_hut = order.osm_anchors(anchor_by_hut)
+    save_build_state({
+        "max_distance_km": MAX_DISTANCE_KM,
+        "anchor_radius_m": ANCHOR_RADIUS_M,
+        "nodes": nodes,
+        "ways_by_id": ways_by_id,
+        "relations_by_id": relations_by_id,
+        "graph": graph,
+        "hut_ids": hut_ids,
+        "hut_meta": hut_meta,
+        "duplicate_hut_ids": duplicate_hut_ids,
+        "anchor_by_hut": anchor_by_hut,
+        "pairs_by_source": pairs_by_source,
+    }, base_dir / STATE_FILE)
+    if checkpoint_path is not None:
+        # Build terminé et sauvegardé : le checkpoint ne sert plus
+        checkpoint_path.unlink(missing_ok=True)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,108 @@
+import csv
+import argparse
+from pathlib import Path
+
+from build_cabane_graph import load_build_state, STATE_FILE
+from shortest_path import shortest_path_between
+from route_geometry import (
+    route_metrics,
+    geometry_record,
+    write_geometry_tiers,
+    SIMPLIFY_TIERS_M,
+)
+
+BASE_DIR = Path(__file__).resolve().parent
+EDGES_CSV = BASE_DIR / "neo4j_huts" / "huts_edges.csv"
+LINKS_GEOMETRY_FILE = BASE_DIR / "neo4j_huts" / "links_geometry.bin"
+LINKS_GEOMETRY_CSV = BASE_DIR / "neo4j_huts" / "huts_edges_geometry.csv"
+
+
+def load_edges(path: Path):
+    edges = []
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            edges.append((int(row[":START_ID(Hut)"]), int(row[":END_ID(Hut)"])))
+    print(f"{len(edges)} liaisons chargées depuis {path}")
+    return edges
+
+
+def link_paths(state, edges):
+    """
+    Chemin de chaque liaison hut-hut sur le graphe des chemins, avec la
+    même règle que le build (on ne traverse pas l'ancrage d'une autre hut).
+    Renvoie {index de liaison: [(lat, lon), ...]}.
+    """
+    nodes = state["nodes"]
+    graph = state["graph"]
+    anchor_by_hut = state["anchor_by_hut"]
+    anchors = set(anchor_by_hut.values())
+
+    paths = {}
+    missing = 0
+    for idx, (a, b) in enumerate(edges):
+        anchor_a = anchor_by_hut.get(a)
+        anchor_b = anchor_by_hut.get(b)
+        if anchor_a is None or anchor_b is None:
+            missing += 1
+            continue
+        _, path = shortest_path_between(graph, anchor_a, anchor_b, blocked=anchors)
+        if path is None:
+            missing += 1
+            continue
+        paths[idx] = [(nodes[nid]["lat"], nodes[nid]["lon"]) for nid in path]
+    if missing:
+        print(f"  {missing} liaisons sans chemin dans le graphe en cache")
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Géométrie (complète + niveaux simplifiés) des liaisons hut-hut."
+    )
+    parser.add_argument("--edges", type=Path, default=EDGES_CSV,
+                        help="CSV des liaisons (défaut: neo4j_huts/huts_edges.csv).")
+    args = parser.parse_args(argv)
+
+    state = load_build_state(BASE_DIR / STATE_FILE)
+    edges = load_edges(args.edges)
+    paths = link_paths(state, edges)
+
+    geometries = {}
+    for idx, coords in paths.items():
+        if len(coords) < 2:
+            # deux huts sur le même ancrage : pas de géométrie
+            geometries[idx] = geometry_record([], None, 0.0)
+            continue
+        metrics = route_metrics([([lat for lat, _ in coords], [lon for _, lon in coords])])
+        flat = [c for lat, lon in coords for c in (lat, lon)]
+        geometries[idx] = geometry_record([flat], metrics["bbox"], metrics["length_m"])
+
+    errors = write_geometry_tiers(geometries, LINKS_GEOMETRY_FILE)
+
+    fields = [
+        ":START_ID(Hut)",
+        ":END_ID(Hut)",
+        "geometry_id:int",
+        "path_km:float",
+    ] + [f"error_{tol:g}m:float" for tol in SIMPLIFY_TIERS_M]
+
+    print(f"Écriture {LINKS_GEOMETRY_CSV}")
+    with LINKS_GEOMETRY_CSV.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for idx, (a, b) in enumerate(edges):
+            if idx not in geometries:
+                continue
+            row = {
+                ":START_ID(Hut)": a,
+                ":END_ID(Hut)": b,
+                "geometry_id:int": idx,
+                "path_km:float": round(geometries[idx]["length_m"] / 1000.0, 3),
+            }
+            for tol in SIMPLIFY_TIERS_M:
+                row[f"error_{tol:g}m:float"] = round(errors[tol][idx], 2)
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    main()
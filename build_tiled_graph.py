@@ -0,0 +1,367 @@
+import math
+import pickle
+import sqlite3
+import argparse
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from build_cabane_graph import (
+    load_excluded_hut_ids,
+    load_huts_per_country,
+    build_graph,
+    compute_hut_anchors,
+    compute_pairs_by_source,
+    edges_from_pairs_by_source,
+    write_hut_csv,
+    parse_pbf_sources,
+    MAX_DISTANCE_KM,
+    ANCHOR_RADIUS_M,
+)
+from osm_records import iter_route_records, OsmNode, OsmWay
+from hut_duplicates import drop_duplicate_huts
+from shortest_path import ENGINES
+
+BASE_DIR = Path(".")
+TILES_DIR = BASE_DIR / "cache" / "tiles"
+
+KM_PER_DEG_LAT = 111.32
+# Taille de cellule de build_spatial_index / find_nearest_graph_node_for_hut
+ANCHOR_CELL_DEG = 0.05
+FLUSH_EVERY = 10_000
+# Ids par requête "IN (...)" sur l'index node -> tuiles
+LOOKUP_CHUNK = 500
+
+
+# -----------------------------
+# Découpage en tuiles
+# -----------------------------
+def tile_buffer_deg(max_distance_km, anchor_radius_m, max_lat):
+    """
+    Largeur du buffer (en degrés lat, lon) autour du coeur d'une tuile.
+
+    Une hut source du coeur n'atteint que des nodes à moins de
+    max_distance_km (à vol d'oiseau, donc aussi par chemin) de son ancrage ;
+    les huts qui bloquent la recherche sont à moins d'un rayon d'ancrage de
+    plus, et leur ancrage dépend des cellules 3x3 autour d'elles. Avec ce
+    buffer, chaque tuile donne exactement le résultat du graphe complet.
+    """
+    buf_km = max_distance_km + 2.0 * anchor_radius_m / 1000.0
+    dlat = buf_km / KM_PER_DEG_LAT + 2 * ANCHOR_CELL_DEG
+    cos_lat = math.cos(math.radians(min(max_lat + dlat, 89.0)))
+    dlon = buf_km / (KM_PER_DEG_LAT * cos_lat) + 2 * ANCHOR_CELL_DEG
+    return dlat, dlon
+
+
+def tile_of(lat, lon, tile_deg):
+    return (math.floor(lat / tile_deg), math.floor(lon / tile_deg))
+
+
+def tiles_touching(lat, lon, tile_deg, dlat, dlon):
+    """Tuiles dont le coeur élargi du buffer contient (lat, lon)."""
+    i0 = math.floor((lat - dlat) / tile_deg)
+    i1 = math.floor((lat + dlat) / tile_deg)
+    j0 = math.floor((lon - dlon) / tile_deg)
+    j1 = math.floor((lon + dlon) / tile_deg)
+    for i in range(i0, i1 + 1):
+        for j in range(j0, j1 + 1):
+            yield (i, j)
+
+
+def tile_path(tile):
+    return TILES_DIR / f"tile_{tile[0]}_{tile[1]}.pickle"
+
+
+class TileWriter:
+    """Écrit les éléments de chaque tuile par lots dans cache/tiles/."""
+
+    def __init__(self, tiles):
+        TILES_DIR.mkdir(parents=True, exist_ok=True)
+        self.files = {tile: tile_path(tile).open("wb") for tile in tiles}
+        self.buffers = defaultdict(list)
+
+    def add(self, tile, el):
+        buf = self.buffers[tile]
+        buf.append(el)
+        if len(buf) >= FLUSH_EVERY:
+            self.flush(tile)
+
+    def flush(self, tile):
+        buf = self.buffers.pop(tile, None)
+        if buf:
+            pickle.dump(buf, self.files[tile], protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        for tile in list(self.buffers):
+            self.flush(tile)
+        for f in self.files.values():
+            f.close()
+
+
+class NodeTileIndex:
+    """
+    node_id -> tuiles, sur disque (sqlite) : la mémoire ne dépend pas du
+    nombre de nodes des fichiers de chemins. Les tuiles sont stockées par
+    leur rang dans la liste triée des tuiles actives.
+    """
+
+    def __init__(self, path: Path, tiles):
+        self.path = path
+        self.tiles = sorted(tiles)
+        self.rank = {tile: k for k, tile in enumerate(self.tiles)}
+        self.pending = []
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        self.db = sqlite3.connect(str(path))
+        # index jetable : ni journal ni fsync
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute(
+            "CREATE TABLE node_tiles (node_id INTEGER, tile INTEGER, "
+            "PRIMARY KEY (node_id, tile)) WITHOUT ROWID"
+        )
+
+    def add(self, node_id, tiles):
+        self.pending.extend((node_id, self.rank[t]) for t in tiles)
+        if len(self.pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            # un node présent dans deux fichiers n'est compté qu'une fois
+            self.db.executemany("INSERT OR IGNORE INTO node_tiles VALUES (?, ?)",
+                                self.pending)
+            self.pending = []
+
+    def lookup(self, node_ids):
+        """{node_id: [tuiles]} pour les node_ids indexés."""
+        self.flush()
+        node_ids = list(node_ids)
+        tiles_by_node = defaultdict(list)
+        for k in range(0, len(node_ids), LOOKUP_CHUNK):
+            chunk = node_ids[k:k + LOOKUP_CHUNK]
+            rows = self.db.execute(
+                "SELECT node_id, tile FROM node_tiles WHERE node_id IN "
+                f"({','.join('?' * len(chunk))})", chunk
+            )
+            for node_id, rank in rows:
+                tiles_by_node[node_id].append(self.tiles[rank])
+        return tiles_by_node
+
+    def node_count(self):
+        self.flush()
+        return self.db.execute(
+            "SELECT COUNT(DISTINCT node_id) FROM node_tiles"
+        ).fetchone()[0]
+
+    def close(self):
+        self.db.close()
+        self.path.unlink(missing_ok=True)
+
+
+def iter_batches(path: Path):
+    """Lots successifs d'un fichier écrit par pickle.dump répétés."""
+    with path.open("rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def shard_paths(paths_files, active_tiles, hut_nodes, tile_deg, dlat, dlon):
+    """
+    Répartit nodes et ways des chemins dans les tuiles actives.
+
+    Les fichiers sont lus élément par élément (iter_route_records). Chaque
+    node part dans ses tuiles et dans l'index node -> tuiles sur disque ;
+    les ways sont mises de côté sur disque, puis routées par lots une fois
+    les nodes de tous les fichiers indexés. La mémoire reste bornée par
+    les lots, pas par le nombre de pays.
+    """
+    writer = TileWriter(active_tiles)
+    index = NodeTileIndex(TILES_DIR / "node_tiles.sqlite", active_tiles)
+    spill_path = TILES_DIR / "ways.pickle"
+
+    with spill_path.open("wb") as spill:
+        pending = []
+        for path in paths_files:
+            print(f"Découpage en tuiles : {path}")
+            for el in iter_route_records(path):
+                t = type(el)
+                if t is OsmNode:
+                    nid = el.id
+                    if nid in hut_nodes:
+                        # comme load_huts_per_country : la position du chemin prime
+                        hut_nodes[nid]["lat"] = el.lat
+                        hut_nodes[nid]["lon"] = el.lon
+                    tiles = [
+                        tile for tile in tiles_touching(el.lat, el.lon, tile_deg, dlat, dlon)
+                        if tile in active_tiles
+                    ]
+                    if not tiles:
+                        continue
+                    index.add(nid, tiles)
+                    for tile in tiles:
+                        writer.add(tile, ("node", nid, el.lat, el.lon))
+                elif t is OsmWay:
+                    pending.append((el.id, el.nodes, el.tags))
+                    if len(pending) >= FLUSH_EVERY:
+                        pickle.dump(pending, spill, protocol=pickle.HIGHEST_PROTOCOL)
+                        pending = []
+        if pending:
+            pickle.dump(pending, spill, protocol=pickle.HIGHEST_PROTOCOL)
+
+    for batch in iter_batches(spill_path):
+        tiles_by_node = index.lookup({nid for _, way_nodes, _ in batch for nid in way_nodes})
+        for way_id, way_nodes, tags in batch:
+            tiles = set()
+            for nid in way_nodes:
+                tiles.update(tiles_by_node.get(nid, ()))
+            for tile in tiles:
+                writer.add(tile, ("way", way_id, way_nodes, tags))
+
+    writer.close()
+    print(f"  Nodes de chemins répartis : {index.node_count()}")
+    index.close()
+    spill_path.unlink()
+
+
+def read_tile(tile):
+    nodes = {}
+    ways_by_id = {}
+    for batch in iter_batches(tile_path(tile)):
+        for etype, eid, a, b in batch:
+            if etype == "node":
+                nodes[eid] = {"id": eid, "lat": a, "lon": b}
+            else:
+                ways_by_id[eid] = {"id": eid, "nodes": a, "tags": b}
+    return nodes, ways_by_id
+
+
+# -----------------------------
+# Calcul par tuile
+# -----------------------------
+def run_tile(tile, tile_huts, source_huts, max_distance_km, anchor_radius_m,
+             engine="python"):
+    """
+    tile_huts   : {hut_id: node} huts dans la tuile élargie du buffer
+    source_huts : huts dont la position tombe dans le coeur de la tuile
+    Renvoie pairs_by_source pour les huts sources de la tuile.
+    """
+    nodes, ways_by_id = read_tile(tile)
+    print(f"Tuile {tile}: {len(nodes)} nodes, {len(ways_by_id)} ways, "
+          f"{len(source_huts)} huts sources")
+
+    for hut_id, node in tile_huts.items():
+        if hut_id not in nodes:
+            nodes[hut_id] = node
+
+    graph = build_graph(nodes, ways_by_id)
+    anchor_by_hut, huts_by_anchor = compute_hut_anchors(
+        nodes, graph, set(tile_huts), max_radius_m=anchor_radius_m
+    )
+    return compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor,
+        max_distance_km=max_distance_km,
+        sources=[h for h in source_huts if h in anchor_by_hut],
+        engine=engine,
+    )
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Graphe Hut <-> Hut calculé par tuiles géographiques "
+                    "(mémoire bornée par la taille d'une tuile)."
+    )
+    parser.add_argument("--pbf", action="append", default=[], metavar="CC=FICHIER",
+                        help="Extrait .osm.pbf par pays (comme build_cabane_graph.py).")
+    parser.add_argument("--tile-deg", type=float, default=1.0,
+                        help="Taille du coeur des tuiles en degrés (défaut: 1.0).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus en parallèle (défaut: 1).")
+    parser.add_argument("--max-distance-km", type=float, default=MAX_DISTANCE_KM)
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="python",
+                        help="Moteur de plus court chemin par tuile.")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Garde les doublons de huts (comme build_cabane_graph.py).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.pbf:
+        hut_sources = parse_pbf_sources(args.pbf)
+        paths_files = [path for path, _ in hut_sources]
+    else:
+        paths_files = [BASE_DIR / "overpass_nordics_paths.json"]
+        hut_sources = [
+            (BASE_DIR / "overpass_sweden_huts.json", "SE"),
+            (BASE_DIR / "overpass_norway_huts.json", "NO"),
+        ]
+
+    excluded_ids = load_excluded_hut_ids(BASE_DIR / "excluded_huts.txt")
+    hut_nodes = {}
+    hut_ids, hut_meta = load_huts_per_country(hut_sources, hut_nodes, excluded_ids)
+    if not hut_ids:
+        raise SystemExit("Aucune hut chargée.")
+
+    max_lat = max(hut_nodes[h]["lat"] for h in hut_ids)
+    dlat, dlon = tile_buffer_deg(args.max_distance_km, ANCHOR_RADIUS_M, max_lat)
+
+    # Tuiles actives : celles qui contiennent au moins une hut source
+    sources_by_tile = defaultdict(list)
+    for hut_id in hut_ids:
+        node = hut_nodes[hut_id]
+        sources_by_tile[tile_of(node["lat"], node["lon"], args.tile_deg)].append(hut_id)
+    active_tiles = set(sources_by_tile)
+    print(f"{len(active_tiles)} tuiles de {args.tile_deg}° "
+          f"(buffer {dlat:.2f}° lat / {dlon:.2f}° lon)")
+
+    shard_paths(paths_files, active_tiles, hut_nodes, args.tile_deg, dlat, dlon)
+    if not args.no_dedup:
+        # Après shard_paths : mêmes positions que build_cabane_graph
+        hut_ids, hut_meta, _ = drop_duplicate_huts(hut_nodes, hut_ids, hut_meta)
+
+    # Les positions ont pu être corrigées par les nodes de chemins
+    sources_by_tile = defaultdict(list)
+    huts_by_tile = defaultdict(dict)
+    for hut_id in hut_ids:
+        node = hut_nodes[hut_id]
+        sources_by_tile[tile_of(node["lat"], node["lon"], args.tile_deg)].append(hut_id)
+        for t in tiles_touching(node["lat"], node["lon"], args.tile_deg, dlat, dlon):
+            huts_by_tile[t][hut_id] = node
+
+    tasks = [
+        (tile, huts_by_tile[tile], sorted(sources_by_tile[tile]),
+         args.max_distance_km, ANCHOR_RADIUS_M, args.engine)
+        for tile in sorted(sources_by_tile)
+        if tile in active_tiles
+    ]
+    missing = set(sources_by_tile) - active_tiles
+    if missing:
+        # Hut déplacée dans une tuile non découpée : cas extrême, on refuse
+        raise SystemExit(f"Tuiles non découpées pour des huts : {sorted(missing)}")
+
+    pairs_by_source = {}
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for result in pool.map(run_tile, *zip(*tasks)):
+                pairs_by_source.update(result)
+    else:
+        for task in tasks:
+            pairs_by_source.update(run_tile(*task))
+
+    # Même ordre des sources qu'un build complet ; les paires de bord sont
+    # vues depuis les deux tuiles : fusion + dédoublonnage
+    pairs_by_source = {h: pairs_by_source[h] for h in sorted(pairs_by_source)}
+    edges = edges_from_pairs_by_source(pairs_by_source)
+    write_hut_csv(hut_nodes, hut_ids, hut_meta, edges, BASE_DIR / "neo4j_huts")
+
+
+if __name__ == "__main__":
+    main()
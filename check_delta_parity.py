@@ -0,0 +1,170 @@
+import os
+import sys
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+import build_cabane_graph
+from build_cabane_graph import (
+    load_excluded_hut_ids,
+    load_inputs,
+    build_graph,
+    compute_hut_anchors,
+    load_build_state,
+    parse_pbf_sources,
+    ANCHOR_RADIUS_M,
+    STATE_FILE,
+)
+from check_engine_parity import compare_pairs
+from hut_distance_matrix import MATRIX_FILE
+from node_order import NODE_ORDERS
+from shortest_path import ENGINES
+
+BASE_DIR = Path(".")
+
+# Fichiers écrits par build_cabane_graph.py comparés octet par octet
+OUTPUT_FILES = (
+    Path("neo4j_huts") / "huts.csv",
+    Path("neo4j_huts") / "huts_edges.csv",
+)
+
+
+@contextmanager
+def working_dir(path: Path):
+    """build_cabane_graph.py lit et écrit dans le répertoire courant."""
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def write_excluded(path: Path, excluded_ids):
+    path.write_text("".join(f"{hid}\n" for hid in sorted(excluded_ids)), encoding="utf-8")
+
+
+def pick_huts(paths_files, hut_sources, excluded_ids, seed):
+    """Deux huts ancrées distinctes (ajoutée, retirée), tirées au hasard."""
+    nodes, ways_by_id, _, hut_ids, _ = load_inputs(
+        paths_files, hut_sources, excluded_ids, workers=1
+    )
+    graph = build_graph(nodes, ways_by_id)
+    anchor_by_hut, _ = compute_hut_anchors(
+        nodes, graph, hut_ids, max_radius_m=ANCHOR_RADIUS_M
+    )
+    if len(anchor_by_hut) < 2:
+        raise SystemExit("Il faut au moins deux huts ancrées pour le test")
+    added, removed = random.Random(seed).sample(sorted(anchor_by_hut), 2)
+    return added, removed
+
+
+def run_build(work_dir: Path, build_args, excluded_ids, delta=False):
+    """Lance build_cabane_graph.py (complet ou --delta) dans work_dir."""
+    write_excluded(work_dir / "excluded_huts.txt", excluded_ids)
+    with working_dir(work_dir):
+        build_cabane_graph.main(build_args + (["--delta"] if delta else []))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Vérifie qu'un build --delta (une hut retirée, une hut "
+                    "ajoutée) donne les mêmes paires et les mêmes CSV qu'un "
+                    "build complet sur le nouveau jeu de huts."
+    )
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="python")
+    parser.add_argument("--pbf", action="append", default=[], metavar="CC=FICHIER")
+    parser.add_argument("--node-order", choices=NODE_ORDERS, default="osm",
+                        help="Ordre des nodes du build complet initial.")
+    parser.add_argument("--add", type=int, default=None, metavar="HUT_ID",
+                        help="Hut absente du build initial, ajoutée par le delta.")
+    parser.add_argument("--remove", type=int, default=None, metavar="HUT_ID",
+                        help="Hut du build initial, retirée par le delta.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Graine du tirage des huts si --add / --remove absents.")
+    parser.add_argument("--keep-indirect", action="store_true",
+                        help="Passé aux trois builds (comparaison sans élagage).")
+    parser.add_argument("--distance-matrix", action="store_true",
+                        help=f"Passé aux trois builds ; compare aussi {MATRIX_FILE}.")
+    args = parser.parse_args(argv)
+
+    base_dir = BASE_DIR.resolve()
+    build_args = ["--workers", "1", "--engine", args.engine]
+    output_files = OUTPUT_FILES
+    if args.keep_indirect:
+        build_args.append("--keep-indirect")
+    if args.distance_matrix:
+        build_args.append("--distance-matrix")
+        output_files += (MATRIX_FILE,)
+    if args.pbf:
+        hut_sources = [(path.resolve(), cc) for path, cc in parse_pbf_sources(args.pbf)]
+        paths_files = [path for path, _ in hut_sources]
+        build_args += [f"--pbf={cc}={path}" for path, cc in hut_sources]
+        inputs = []
+    else:
+        paths_files = [base_dir / "overpass_nordics_paths.json"]
+        hut_sources = [
+            (base_dir / "overpass_sweden_huts.json", "SE"),
+            (base_dir / "overpass_norway_huts.json", "NO"),
+        ]
+        inputs = paths_files + [path for path, _ in hut_sources]
+
+    excluded_ids = load_excluded_hut_ids(base_dir / "excluded_huts.txt")
+    added, removed = args.add, args.remove
+    if added is None or removed is None:
+        picked_added, picked_removed = pick_huts(
+            paths_files, hut_sources, excluded_ids, args.seed
+        )
+        added = picked_added if added is None else added
+        removed = picked_removed if removed is None else removed
+    if added == removed:
+        raise SystemExit("--add et --remove doivent désigner deux huts différentes")
+    print(f"Hut ajoutée par le delta : {added}, hut retirée : {removed}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        delta_dir = Path(tmp) / "delta"
+        full_dir = Path(tmp) / "full"
+        for work_dir in (delta_dir, full_dir):
+            work_dir.mkdir()
+            for path in inputs:
+                (work_dir / path.name).symlink_to(path)
+
+        # Build initial sans la hut ajoutée, puis delta vers le nouveau jeu
+        run_build(delta_dir, build_args + ["--node-order", args.node_order],
+                  (excluded_ids | {added}) - {removed})
+        run_build(delta_dir, build_args, (excluded_ids | {removed}) - {added}, delta=True)
+        # Référence : build complet du nouveau jeu
+        run_build(full_dir, build_args, (excluded_ids | {removed}) - {added})
+
+        delta_state = load_build_state(delta_dir / STATE_FILE)
+        full_state = load_build_state(full_dir / STATE_FILE)
+        failures = []
+
+        diffs = compare_pairs(full_state["pairs_by_source"], delta_state["pairs_by_source"],
+                              rel_tol=0.0)
+        if diffs:
+            failures.append(f"{len(diffs)} écarts dans pairs_by_source")
+            for hut_source, hut_target, d_full, d_delta in diffs[:20]:
+                print(f"  {hut_source} -> {hut_target}: complet={d_full} delta={d_delta}")
+        if list(full_state["pairs_by_source"]) != list(delta_state["pairs_by_source"]):
+            failures.append("ordre des sources de pairs_by_source différent")
+        if full_state["anchor_by_hut"] != delta_state["anchor_by_hut"]:
+            failures.append("ancrages différents")
+        for rel_path in output_files:
+            if (delta_dir / rel_path).read_bytes() != (full_dir / rel_path).read_bytes():
+                failures.append(f"{rel_path} différent")
+
+    n_pairs = sum(len(r) for r in full_state["pairs_by_source"].values())
+    if failures:
+        print(f"ÉCHEC: build --delta différent du build complet ({', '.join(failures)})")
+        sys.exit(1)
+
+    print(f"OK: build --delta identique au build complet "
+          f"({len(full_state['pairs_by_source'])} sources, {n_pairs} paires, "
+          f"{', '.join(p.name for p in output_files)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import sys
+import argparse
+from pathlib import Path
+
+from build_cabane_graph import (
+    load_excluded_hut_ids,
+    load_nordics_paths,
+    load_huts_per_country,
+    build_graph,
+    compute_hut_anchors,
+    compute_pairs_by_source,
+    parse_pbf_sources,
+    MAX_DISTANCE_KM,
+    ANCHOR_RADIUS_M,
+)
+from shortest_path import ENGINES
+
+BASE_DIR = Path(".")
+
+
+def compare_pairs(reference, candidate, rel_tol=1e-9):
+    """
+    Compare deux résultats {source: {cible: d_km}}.
+    Renvoie la liste des écarts (source, cible, d_ref, d_candidat).
+    """
+    diffs = []
+    for hut_source in sorted(set(reference) | set(candidate)):
+        ref = reference.get(hut_source, {})
+        cand = candidate.get(hut_source, {})
+        for hut_target in sorted(set(ref) | set(cand)):
+            d_ref = ref.get(hut_target)
+            d_cand = cand.get(hut_target)
+            if d_ref is None or d_cand is None:
+                diffs.append((hut_source, hut_target, d_ref, d_cand))
+            elif abs(d_ref - d_cand) > rel_tol * max(abs(d_ref), 1.0):
+                diffs.append((hut_source, hut_target, d_ref, d_cand))
+    return diffs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Vérifie qu'un moteur de plus court chemin donne les "
+                    "mêmes paires hut-hut que le moteur de référence."
+    )
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="scipy")
+    parser.add_argument("--pbf", action="append", default=[], metavar="CC=FICHIER")
+    parser.add_argument("--max-distance-km", type=float, default=MAX_DISTANCE_KM)
+    args = parser.parse_args(argv)
+
+    if args.pbf:
+        hut_sources = parse_pbf_sources(args.pbf)
+        paths_files = [path for path, _ in hut_sources]
+    else:
+        paths_files = [BASE_DIR / "overpass_nordics_paths.json"]
+        hut_sources = [
+            (BASE_DIR / "overpass_sweden_huts.json", "SE"),
+            (BASE_DIR / "overpass_norway_huts.json", "NO"),
+        ]
+
+    excluded_ids = load_excluded_hut_ids(BASE_DIR / "excluded_huts.txt")
+    nodes, ways_by_id, _ = load_nordics_paths(*paths_files)
+    hut_ids, _ = load_huts_per_country(hut_sources, nodes, excluded_ids)
+    graph = build_graph(nodes, ways_by_id)
+    anchor_by_hut, huts_by_anchor = compute_hut_anchors(
+        nodes, graph, hut_ids, max_radius_m=ANCHOR_RADIUS_M
+    )
+
+    reference = compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor,
+        max_distance_km=args.max_distance_km, engine="python",
+    )
+    candidate = compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor,
+        max_distance_km=args.max_distance_km, engine=args.engine,
+    )
+
+    diffs = compare_pairs(reference, candidate)
+    n_pairs = sum(len(r) for r in reference.values())
+    if diffs:
+        print(f"ÉCHEC: {len(diffs)} écarts sur {n_pairs} paires "
+              f"(moteur {args.engine} vs python)")
+        for hut_source, hut_target, d_ref, d_cand in diffs[:20]:
+            print(f"  {hut_source} -> {hut_target}: python={d_ref} {args.engine}={d_cand}")
+        sys.exit(1)
+
+    print(f"OK: moteur {args.engine} identique au moteur python "
+          f"({len(reference)} sources, {n_pairs} paires)")
+
+
+if __name__ == "__main__":
+    main()
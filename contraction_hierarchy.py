@@ -0,0 +1,370 @@
+import sys
+import math
+import time
+import heapq
+import pickle
+import random
+import argparse
+from array import array
+from pathlib import Path
+
+from build_cabane_graph import (
+    load_nordics_paths,
+    build_graph,
+    parse_pbf_sources,
+    load_build_state,
+    STATE_FILE,
+)
+from shortest_path import shortest_path_between
+
+BASE_DIR = Path(".")
+CH_FILE = BASE_DIR / "cache" / "trail_ch.pickle"
+CH_VERSION = 1
+
+# Recherche de témoin limitée : au-delà, on ajoute le raccourci (toujours exact)
+WITNESS_SETTLE_LIMIT = 200
+
+
+# -----------------------------
+# Contraction
+# -----------------------------
+def _witness_search(adj, source, skip, targets, max_dist):
+    """
+    Dijkstra local depuis source dans le graphe restant sans le node skip,
+    arrêté à max_dist ou après WITNESS_SETTLE_LIMIT nodes.
+    Renvoie {node: distance} des targets atteintes.
+    """
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    found = {}
+    settled = 0
+    remaining = set(targets)
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if d > max_dist:
+            break
+        if d != dist.get(u):
+            continue
+        if u in remaining:
+            found[u] = d
+            remaining.discard(u)
+        settled += 1
+        if settled > WITNESS_SETTLE_LIMIT:
+            break
+        for v, w in adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, math.inf) and nd <= max_dist:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return found
+
+
+def _shortcuts_for(adj, v):
+    """Raccourcis (u, w, poids) nécessaires si on contracte v maintenant."""
+    neighbours = list(adj[v].items())
+    shortcuts = []
+    for i, (u, w_uv) in enumerate(neighbours):
+        others = neighbours[i + 1:]
+        if not others:
+            continue
+        max_dist = w_uv + max(w_vw for _, w_vw in others)
+        witnesses = _witness_search(adj, u, v, [w for w, _ in others], max_dist)
+        for w, w_vw in others:
+            via = w_uv + w_vw
+            if witnesses.get(w, math.inf) <= via:
+                continue
+            shortcuts.append((u, w, via))
+    return shortcuts
+
+
+def build_contraction_hierarchy(graph):
+    """
+    Construit une contraction hierarchy sur le graphe non orienté de
+    build_graph : ordre des nodes (différence d'arêtes + voisins déjà
+    contractés, mise à jour paresseuse) et raccourcis.
+
+    Renvoie un dict de tableaux compacts (voir ContractionHierarchy).
+    """
+    t0 = time.perf_counter()
+    node_ids = list(graph)
+    index = {nid: i for i, nid in enumerate(node_ids)}
+    n = len(node_ids)
+
+    # Graphe restant : arêtes parallèles réduites au minimum, sans boucles
+    adj = [dict() for _ in range(n)]
+    for nid, neighbours in graph.items():
+        i = index[nid]
+        for other, w in neighbours:
+            j = index[other]
+            if i == j:
+                continue
+            if w < adj[i].get(j, math.inf):
+                adj[i][j] = w
+                adj[j][i] = w
+
+    mid = {}                  # (min, max) -> node contracté du raccourci
+    rank = array("l", [0]) * n
+    deleted_neighbours = [0] * n
+    up = [None] * n           # node -> [(voisin de rang supérieur, poids)]
+
+    def priority(v):
+        return len(_shortcuts_for(adj, v)) - len(adj[v]) + deleted_neighbours[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    contracted = 0
+    next_report = max(1, n // 20)
+
+    while heap:
+        _, v = heapq.heappop(heap)
+        if up[v] is not None:
+            continue
+        # Mise à jour paresseuse de la priorité
+        p = priority(v)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, v))
+            continue
+
+        for u, w, via in _shortcuts_for(adj, v):
+            if via < adj[u].get(w, math.inf):
+                adj[u][w] = via
+                adj[w][u] = via
+                mid[(u, w) if u < w else (w, u)] = v
+
+        up[v] = list(adj[v].items())
+        rank[v] = contracted
+        contracted += 1
+        for u in adj[v]:
+            del adj[u][v]
+            deleted_neighbours[u] += 1
+        adj[v] = {}
+
+        if contracted % next_report == 0:
+            print(f"  CH: {contracted}/{n} nodes contractés "
+                  f"({len(mid)} raccourcis, {time.perf_counter() - t0:.1f} s)")
+
+    # CSR du graphe "montant"
+    offsets = array("l", [0])
+    targets = array("l")
+    weights = array("d")
+    for v in range(n):
+        for u, w in sorted(up[v]):
+            targets.append(u)
+            weights.append(w)
+        offsets.append(len(targets))
+
+    mid_keys = array("q")
+    mid_nodes = array("l")
+    for (a, b), m in sorted(mid.items()):
+        mid_keys.append(a * n + b)
+        mid_nodes.append(m)
+
+    print(f"CH construite en {time.perf_counter() - t0:.1f} s : {n} nodes, "
+          f"{len(targets)} arcs montants dont {len(mid)} raccourcis")
+    return {
+        "version": CH_VERSION,
+        "node_ids": array("q", node_ids),
+        "rank": rank,
+        "offsets": offsets,
+        "targets": targets,
+        "weights": weights,
+        "mid_keys": mid_keys,
+        "mid_nodes": mid_nodes,
+    }
+
+
+# -----------------------------
+# Requêtes
+# -----------------------------
+class ContractionHierarchy:
+    """Requêtes point à point (recherche bidirectionnelle montante)."""
+
+    def __init__(self, data):
+        self.node_ids = data["node_ids"]
+        self.rank = data["rank"]
+        self.offsets = data["offsets"]
+        self.targets = data["targets"]
+        self.weights = data["weights"]
+        self.n = len(self.node_ids)
+        self.index = {nid: i for i, nid in enumerate(self.node_ids)}
+        self.mid = dict(zip(data["mid_keys"], data["mid_nodes"]))
+        self.data = data
+
+    @classmethod
+    def load(cls, path: Path = CH_FILE):
+        with path.open("rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != CH_VERSION:
+            raise SystemExit(f"CH {path} obsolète : relancer "
+                             f"'python contraction_hierarchy.py build'")
+        return cls(data)
+
+    def save(self, path: Path = CH_FILE):
+        path.parent.mkdir(exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(self.data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"CH sauvegardée dans {path}")
+
+    def _unpack(self, a, b, out):
+        """Ajoute à out les nodes du segment a -> b (b inclus, a exclu)."""
+        stack = [(a, b)]
+        while stack:
+            x, y = stack.pop()
+            key = x * self.n + y if x < y else y * self.n + x
+            m = self.mid.get(key)
+            if m is None:
+                out.append(y)
+            else:
+                stack.append((m, y))
+                stack.append((x, m))
+
+    def query(self, source, target):
+        """
+        Plus court chemin entre deux node_ids OSM du graphe.
+        Renvoie (distance_m, [node_ids]) ou (None, None).
+        """
+        s = self.index.get(source)
+        t = self.index.get(target)
+        if s is None or t is None:
+            return None, None
+        if s == t:
+            return 0.0, [source]
+
+        dist = ({s: 0.0}, {t: 0.0})
+        parent = ({s: None}, {t: None})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        best = math.inf
+        meet = None
+
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                heap = heaps[side]
+                if not heap:
+                    continue
+                d, v = heapq.heappop(heap)
+                if d >= best:
+                    # ce côté ne peut plus améliorer le meilleur chemin
+                    heap.clear()
+                    continue
+                if d != dist[side][v]:
+                    continue
+                other = dist[1 - side].get(v)
+                if other is not None and d + other < best:
+                    best = d + other
+                    meet = v
+                for k in range(self.offsets[v], self.offsets[v + 1]):
+                    u = self.targets[k]
+                    nd = d + self.weights[k]
+                    if nd < dist[side].get(u, math.inf):
+                        dist[side][u] = nd
+                        parent[side][u] = v
+                        heapq.heappush(heap, (nd, u))
+
+        if meet is None:
+            return None, None
+
+        up_s = []
+        v = meet
+        while v is not None:
+            up_s.append(v)
+            v = parent[0][v]
+        up_s.reverse()
+        up_t = []
+        v = meet
+        while v is not None:
+            up_t.append(v)
+            v = parent[1][v]
+
+        chain = up_s + up_t[1:]
+        path = [chain[0]]
+        for a, b in zip(chain, chain[1:]):
+            self._unpack(a, b, path)
+
+        return best, [self.node_ids[i] for i in path]
+
+
+def path_length(graph, path):
+    """Longueur d'un chemin de node_ids, arêtes sommées dans l'ordre."""
+    total = 0.0
+    for a, b in zip(path, path[1:]):
+        total += min(w for n, w in graph[a] if n == b)
+    return total
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def load_graph(pbf_specs):
+    state_path = BASE_DIR / STATE_FILE
+    if state_path.exists() and not pbf_specs:
+        return load_build_state(state_path)["graph"]
+    if pbf_specs:
+        paths_files = [path for path, _ in parse_pbf_sources(pbf_specs)]
+    else:
+        paths_files = [BASE_DIR / "overpass_nordics_paths.json"]
+    nodes, ways_by_id, _ = load_nordics_paths(*paths_files)
+    return build_graph(nodes, ways_by_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Contraction hierarchy du graphe des chemins."
+    )
+    parser.add_argument("command", choices=("build", "query", "verify"))
+    parser.add_argument("nodes", nargs="*", type=int,
+                        help="query : node_id source et node_id cible")
+    parser.add_argument("--pbf", action="append", default=[], metavar="CC=FICHIER")
+    parser.add_argument("--pairs", type=int, default=200,
+                        help="verify : nombre de paires aléatoires (défaut: 200)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        graph = load_graph(args.pbf)
+        ContractionHierarchy(build_contraction_hierarchy(graph)).save(CH_FILE)
+        return
+
+    ch = ContractionHierarchy.load(CH_FILE)
+
+    if args.command == "query":
+        if len(args.nodes) != 2:
+            raise SystemExit("query attend deux node_ids")
+        t = time.perf_counter()
+        dist_m, path = ch.query(*args.nodes)
+        ms = (time.perf_counter() - t) * 1000.0
+        if dist_m is None:
+            print(f"Pas de chemin ({ms:.2f} ms)")
+        else:
+            print(f"{dist_m / 1000.0:.3f} km, {len(path)} nodes ({ms:.2f} ms)")
+        return
+
+    # verify : comparaison avec Dijkstra sur le graphe brut
+    graph = load_graph(args.pbf)
+    rng = random.Random(0)
+    node_ids = list(graph)
+    t_ch = t_dij = 0.0
+    errors = 0
+    for _ in range(args.pairs):
+        s, t = rng.choice(node_ids), rng.choice(node_ids)
+        start = time.perf_counter()
+        d_ch, path = ch.query(s, t)
+        t_ch += time.perf_counter() - start
+        start = time.perf_counter()
+        d_ref, _ = shortest_path_between(graph, s, t)
+        t_dij += time.perf_counter() - start
+        if (d_ch is None) != (d_ref is None):
+            errors += 1
+        elif d_ch is not None:
+            if (abs(d_ch - d_ref) > 1e-6 * max(d_ref, 1.0)
+                    or abs(path_length(graph, path) - d_ref) > 1e-6 * max(d_ref, 1.0)):
+                errors += 1
+    print(f"{args.pairs} paires : {errors} écarts ; "
+          f"CH {t_ch / args.pairs * 1000:.3f} ms/requête, "
+          f"Dijkstra {t_dij / args.pairs * 1000:.3f} ms/requête")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
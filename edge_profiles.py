@@ -0,0 +1,132 @@
+import math
+
+# -----------------------------
+# Profils de coût des arêtes
+# -----------------------------
+# Tous les coûts sont en mètres "équivalents" (distance à plat en été) :
+# les CSV par profil restent en km comparables à distance_km.
+# math.inf = arête fermée pour ce profil.
+
+SAC_SCALE_FACTOR = {
+    "hiking": 1.0,
+    "mountain_hiking": 1.15,
+    "demanding_mountain_hiking": 1.35,
+    "alpine_hiking": 1.7,
+    "demanding_alpine_hiking": 2.2,
+    "difficult_alpine_hiking": 3.0,
+}
+
+HIGHWAY_FACTOR = {
+    "track": 0.95,
+    "service": 0.95,
+    "unclassified": 0.95,
+    "steps": 1.5,
+}
+
+# Échelles SAC trop raides / exposées en hiver (avalanches)
+WINTER_CLOSED_SAC = {
+    "alpine_hiking",
+    "demanding_alpine_hiking",
+    "difficult_alpine_hiking",
+}
+
+# Naismith : 5 km/h à plat + 1 h par 600 m de montée. Sur une arête non
+# orientée on prend la moyenne aller/retour : 1 m de dénivelé ~ 5000/1200 m.
+WALK_SPEED_KMH = 5.0
+CLIMB_EQUIV_M = 5000.0 / 1200.0
+
+
+def is_winter_only(tags):
+    """Traces d'hiver (lacs gelés, pistes de ski sans chemin d'été)."""
+    if tags.get("seasonal") == "winter":
+        return True
+    if tags.get("winter_road") == "yes" or tags.get("ice_road") == "yes":
+        return True
+    return "piste:type" in tags and "highway" not in tags
+
+
+def summer_factor(tags):
+    if is_winter_only(tags) or tags.get("foot") == "no":
+        return math.inf
+    factor = HIGHWAY_FACTOR.get(tags.get("highway"), 1.0)
+    return factor * SAC_SCALE_FACTOR.get(tags.get("sac_scale"), 1.0)
+
+
+def winter_factor(tags):
+    if tags.get("seasonal") == "summer":
+        return math.inf
+    if tags.get("sac_scale") in WINTER_CLOSED_SAC or tags.get("highway") == "steps":
+        return math.inf
+    if tags.get("piste:type") in ("nordic", "skitour", "hike") or is_winter_only(tags):
+        # trace balisée / damée
+        return 0.8
+    # chemin d'été non balisé en hiver : neige profonde
+    return 1.2
+
+
+def summer_foot_cost(tags, dist_m, ele1, ele2):
+    return dist_m * summer_factor(tags)
+
+
+def winter_ski_cost(tags, dist_m, ele1, ele2):
+    return dist_m * winter_factor(tags)
+
+
+def time_dem_cost(tags, dist_m, ele1, ele2):
+    """Temps de marche d'été (Naismith), exprimé en mètres à plat."""
+    cost = dist_m * summer_factor(tags)
+    if ele1 is not None and ele2 is not None:
+        cost += CLIMB_EQUIV_M * abs(ele2 - ele1)
+    return cost
+
+
+PROFILES = {
+    "summer_foot": {"cost": summer_foot_cost, "elevation": False, "speed_kmh": None},
+    "winter_ski": {"cost": winter_ski_cost, "elevation": False, "speed_kmh": None},
+    "time_dem": {"cost": time_dem_cost, "elevation": True, "speed_kmh": WALK_SPEED_KMH},
+}
+
+
+def profile_graph(graph, weights):
+    """
+    Vue du graphe pour un profil : même adjacence que graph, poids pris dans
+    weights (tableaux parallèles à graph[node]), arêtes fermées retirées.
+    """
+    out = {}
+    for node, neighbours in graph.items():
+        costs = weights[node]
+        out[node] = [
+            (neigh, cost) for (neigh, _), cost in zip(neighbours, costs)
+            if cost != math.inf
+        ]
+    return out
+
+
+# -----------------------------
+# Altitudes (MNT optionnel)
+# -----------------------------
+def load_dem_elevations(nodes, node_ids, dem_path):
+    """
+    Altitude (m) de chaque node de node_ids, lue dans un MNT raster
+    (GeoTIFF en EPSG:4326). Les pixels "nodata" sont ignorés.
+    """
+    try:
+        import rasterio
+    except ImportError as e:
+        raise RuntimeError(
+            "Le profil 'time_dem' nécessite rasterio pour lire le MNT : "
+            "pip install rasterio"
+        ) from e
+
+    node_ids = list(node_ids)
+    elevations = {}
+    with rasterio.open(dem_path) as dem:
+        nodata = dem.nodata
+        coords = ((nodes[nid]["lon"], nodes[nid]["lat"]) for nid in node_ids)
+        for nid, values in zip(node_ids, dem.sample(coords, indexes=1)):
+            ele = float(values[0])
+            if nodata is not None and ele == nodata:
+                continue
+            elevations[nid] = ele
+    print(f"Altitudes MNT : {len(elevations)}/{len(node_ids)} nodes ({dem_path})")
+    return elevations
@@ -1,69 +1,75 @@
-import json
 import csv
+import sys
 from pathlib import Path
 from collections import defaultdict
 
+from osm_records import load_route_records
+from build_cabane_graph import build_graph, compute_hut_anchors, haversine
+from extract_huts_on_routes_proximity import (
+    osm_graph_from_records,
+    attach_route_parts,
+    load_routes_from_geometry,
+    bbox_distance_lower_bound_m,
+    min_distance_hut_to_route,
+    THRESHOLD_METERS,
+)
+from route_geometry import GEOMETRY_FILE
+
 BASE_DIR = Path(__file__).resolve().parent
 
 OVERPASS_JSON = BASE_DIR / "osm_routes" / "laponie_routes.json"
 HUTS_CSV = BASE_DIR / "neo4j_huts" / "huts.csv"
 OUTPUT_CSV = BASE_DIR / "neo4j_routes" / "huts_on_routes.csv"
 
+# Une hut dont le node de chemin le plus proche est à moins de cette
+# distance est considérée "sur" la way (posée sur le sentier)
+ON_WAY_RADIUS_M = 50.0
+
 
-def load_node_to_routes():
+def node_to_routes_from_records(data):
     """
-    Lit le JSON Overpass et construit un mapping:
-      node_osm_id -> ensemble de route_ids (relations route=hiking|ski)
+    node_osm_id -> ensemble de route_ids (relations route=hiking|ski)
+    dont le node est membre direct.
     """
-    with OVERPASS_JSON.open(encoding="utf-8") as f:
-        data = json.load(f)
-
-    elements = data.get("elements", [])
     node_to_routes = defaultdict(set)
 
-    for el in elements:
-        if el.get("type") != "relation":
-            continue
-
-        tags = el.get("tags", {})
-        route_type = tags.get("route")
+    for rel in data.relations:
+        route_type = rel.tags.get("route")
         if route_type not in ("hiking", "ski"):
             continue
 
-        route_id = el["id"]
-
         # on parcourt les membres de la relation
-        for mem in el.get("members", []):
-            if mem.get("type") == "node":
-                ref = mem.get("ref")
-                if ref is not None:
-                    node_to_routes[ref].add(route_id)
+        for mem in rel.members:
+            if mem.type == "node":
+                node_to_routes[mem.ref].add(rel.id)
 
     print(f"{sum(len(v) for v in node_to_routes.values())} associations node-route trouvées")
     return node_to_routes
 
 
-def main():
-    node_to_routes = load_node_to_routes()
-
-    OUTPUT_CSV.parent.mkdir(exist_ok=True)
-
-    with HUTS_CSV.open(newline="", encoding="utf-8") as f_in, \
-         OUTPUT_CSV.open("w", newline="", encoding="utf-8") as f_out:
+def load_node_to_routes(source=OVERPASS_JSON):
+    """
+    Lit le JSON Overpass (ou un extrait .osm.pbf) et construit un mapping:
+      node_osm_id -> ensemble de route_ids (relations route=hiking|ski)
+    """
+    return node_to_routes_from_records(load_route_records(source))
 
-        reader = csv.DictReader(f_in)
 
-        fieldnames = [
-            ":START_ID(Hut)",
-            ":END_ID(Route)",
-            "role",
-        ]
-        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
-        writer.writeheader()
+def build_way_node_index(routes, ways_by_id):
+    """node_id -> ensemble de route_ids, pour chaque node des ways membres."""
+    way_node_to_routes = defaultdict(set)
+    for route_id, route in routes.items():
+        for way_id in route["way_ids"]:
+            for nid in ways_by_id.get(way_id, ()):
+                way_node_to_routes[nid].add(route_id)
+    print(f"Index ways membres : {len(way_node_to_routes)} nodes")
+    return way_node_to_routes
 
-        count = 0
 
-        for row in reader:
+def load_huts_with_osm_id():
+    huts = []
+    with HUTS_CSV.open(newline="", encoding="utf-8") as f_in:
+        for row in csv.DictReader(f_in):
             # On récupère hut_id (ID du noeud Hut dans Neo4j)
             hut_id_str = row.get("hut_id:ID(Hut)") or row.get("hut_id")
             if not hut_id_str:
@@ -71,28 +77,136 @@ def main():
             hut_id = int(hut_id_str)
 
             # On récupère l'osm_id du node OSM de la cabane
-            osm_id_str = row.get("osm_id:long") or row.get("osm_id")
-            if not osm_id_str:
-                continue
+            osm_id_str = row.get("osm_id:long") or row.get("osm_id") or hut_id_str
             try:
                 osm_id = int(osm_id_str)
-            except ValueError:
+                lat = float(row["latitude:float"])
+                lon = float(row["longitude:float"])
+            except (KeyError, ValueError):
                 continue
+            huts.append({"hut_id": hut_id, "osm_id": osm_id, "lat": lat, "lon": lon})
+    print(f"{len(huts)} huts chargées depuis {HUTS_CSV}")
+    return huts
+
 
-            # Pour ce node OSM, quelles routes le référencent comme membre ?
-            route_ids = node_to_routes.get(osm_id, set())
-            if not route_ids:
+def trail_anchors(huts, nodes_by_id, ways_by_id):
+    """
+    Ancrage de chaque hut sur les ways des routes (compute_hut_anchors,
+    rayon ON_WAY_RADIUS_M) : {osm_id: node_id}.
+    """
+    nodes = {nid: {"lat": lat, "lon": lon} for nid, (lat, lon) in nodes_by_id.items()}
+    for hut in huts:
+        nodes.setdefault(hut["osm_id"], {"lat": hut["lat"], "lon": hut["lon"]})
+    graph = build_graph(nodes, {wid: {"nodes": nids} for wid, nids in ways_by_id.items()})
+    anchor_by_hut, _ = compute_hut_anchors(
+        nodes, graph, {hut["osm_id"] for hut in huts}, max_radius_m=ON_WAY_RADIUS_M
+    )
+    return anchor_by_hut
+
+
+def classify_huts(huts, node_to_routes, way_node_to_routes, anchor_by_hut,
+                  nodes_by_id):
+    """
+    Un passage sur les huts, que des recherches dans les index :
+      member : le node de la hut est membre direct de la relation
+      on_way : le node de la hut, ou son ancrage, est un node d'une way membre
+    Renvoie ({hut_id: {route_id: (role, distance_m)}}, huts sans résultat).
+    """
+    links = {}
+    unmatched = []
+    for hut in huts:
+        osm_id = hut["osm_id"]
+        found = {}
+        for route_id in way_node_to_routes.get(osm_id, ()):
+            found[route_id] = ("on_way", 0.0)
+        anchor = anchor_by_hut.get(osm_id)
+        if anchor is not None and anchor != osm_id:
+            lat, lon = nodes_by_id[anchor]
+            d = haversine(hut["lat"], hut["lon"], lat, lon)
+            for route_id in way_node_to_routes.get(anchor, ()):
+                if route_id not in found:
+                    found[route_id] = ("on_way", d)
+        for route_id in node_to_routes.get(osm_id, ()):
+            found[route_id] = ("member", 0.0)
+
+        if found:
+            links[hut["hut_id"]] = found
+        else:
+            unmatched.append(hut)
+    return links, unmatched
+
+
+def near_routes(huts, routes):
+    """Repli géométrique (comme le script de proximité) pour les huts restantes."""
+    links = {}
+    for hut in huts:
+        found = {}
+        for route_id, route in routes.items():
+            bbox = route["bbox"]
+            if bbox is None or (
+                bbox_distance_lower_bound_m(hut["lat"], hut["lon"], bbox)
+                > THRESHOLD_METERS
+            ):
                 continue
+            dist = min_distance_hut_to_route(hut, route, THRESHOLD_METERS)
+            if dist is not None and dist <= THRESHOLD_METERS:
+                found[route_id] = ("near", dist)
+        if found:
+            links[hut["hut_id"]] = found
+    return links
+
+
+def main():
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else OVERPASS_JSON
+    data = load_route_records(source)
+    node_to_routes = node_to_routes_from_records(data)
+    nodes_by_id, ways_by_id, routes = osm_graph_from_records(data)
+    del data
+
+    way_node_to_routes = build_way_node_index(routes, ways_by_id)
+    huts = load_huts_with_osm_id()
+    anchor_by_hut = trail_anchors(huts, nodes_by_id, ways_by_id)
+
+    links, unmatched = classify_huts(
+        huts, node_to_routes, way_node_to_routes, anchor_by_hut, nodes_by_id
+    )
+    print(f"{len(links)} huts classées par les index, "
+          f"{len(unmatched)} passent par la géométrie")
+
+    if unmatched:
+        if len(sys.argv) == 1 and GEOMETRY_FILE.exists():
+            routes = load_routes_from_geometry(GEOMETRY_FILE)
+        else:
+            attach_route_parts(routes, ways_by_id, nodes_by_id)
+        links.update(near_routes(unmatched, routes))
+
+    OUTPUT_CSV.parent.mkdir(exist_ok=True)
+
+    with OUTPUT_CSV.open("w", newline="", encoding="utf-8") as f_out:
+        fieldnames = [
+            ":START_ID(Hut)",
+            ":END_ID(Route)",
+            "role",
+            "distance_m:float",
+        ]
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        writer.writeheader()
 
-            for route_id in route_ids:
+        count = defaultdict(int)
+        for hut in huts:
+            found = links.get(hut["hut_id"], {})
+            for route_id in sorted(found):
+                role, dist = found[route_id]
                 writer.writerow({
-                    ":START_ID(Hut)": hut_id,
+                    ":START_ID(Hut)": hut["hut_id"],
                     ":END_ID(Route)": route_id,
-                    "role": "member",  # on pourra raffiner plus tard
+                    "role": role,
+                    "distance_m:float": f"{dist:.2f}",
                 })
-                count += 1
+                count[role] += 1
 
-    print(f"{count} relations Hut-Route écrites dans {OUTPUT_CSV}")
+    print(f"{sum(count.values())} relations Hut-Route écrites dans {OUTPUT_CSV} "
+          f"({', '.join(f'{role}: {n}' for role, n in sorted(count.items()))})")
 
 
 if __name__ == "__main__":
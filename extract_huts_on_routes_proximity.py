@@ -1,104 +1,65 @@
-import json
 import csv
 import math
+import sys
 from pathlib import Path
-from collections import defaultdict
+
+from osm_records import load_route_records
+from route_geometry import (
+    min_distance_to_parts,
+    stitch_ways,
+    lines_to_parts,
+    flatten_parts,
+    simplify_parts,
+    route_metrics,
+    tier_path,
+    RouteGeometry,
+    GEOMETRY_FILE,
+    SIMPLIFY_TIERS_M,
+)
 
 BASE_DIR = Path(__file__).resolve().parent
 
 OVERPASS_JSON = BASE_DIR / "osm_routes" / "laponie_routes.json"
 HUTS_CSV = BASE_DIR / "neo4j_huts" / "huts.csv"
+ROUTES_CSV = BASE_DIR / "neo4j_routes" / "routes.csv"
 OUTPUT_CSV = BASE_DIR / "neo4j_routes" / "huts_on_routes_proximity.csv"
 
 # Seuil max pour considérer qu'une hut est "sur" la route
 THRESHOLD_METERS = 500.0
 
-EARTH_RADIUS_M = 6_371_000.0
-
-
-def point_segment_distance_m(lat, lon, lat1, lon1, lat2, lon2):
-    """
-    Distance d'un point (lat, lon) à un segment [ (lat1,lon1) - (lat2,lon2) ] en mètres.
-    Approximation equirectangulaire suffisante à cette échelle.
-    """
-    # conversion en radians
-    lat_rad = math.radians(lat)
-    lon_rad = math.radians(lon)
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    # latitude moyenne pour corriger la convergence des méridiens
-    lat0_rad = (lat1_rad + lat2_rad) / 2.0
-
-    # origine au point 1
-    x1, y1 = 0.0, 0.0
-    x2 = (lon2_rad - lon1_rad) * math.cos(lat0_rad) * EARTH_RADIUS_M
-    y2 = (lat2_rad - lat1_rad) * EARTH_RADIUS_M
-    xp = (lon_rad - lon1_rad) * math.cos(lat0_rad) * EARTH_RADIUS_M
-    yp = (lat_rad - lat1_rad) * EARTH_RADIUS_M
-
-    dx = x2 - x1
-    dy = y2 - y1
-    seg_len2 = dx * dx + dy * dy
-
-    if seg_len2 == 0.0:
-        # segment dégénéré : distance au point 1
-        return math.hypot(xp - x1, yp - y1)
-
-    # projection du point sur la droite paramétrée par t
-    t = ((xp - x1) * dx + (yp - y1) * dy) / seg_len2
-
-    if t <= 0.0:
-        xn, yn = x1, y1
-    elif t >= 1.0:
-        xn, yn = x2, y2
-    else:
-        xn = x1 + t * dx
-        yn = y1 + t * dy
+# Marge du rejet sur géométrie simplifiée : les projections locales de
+# point_segment_distance_m diffèrent légèrement d'un segment à l'autre
+REJECT_MARGIN_M = 5.0
 
-    return math.hypot(xp - xn, yp - yn)
+EARTH_RADIUS_M = 6_371_000.0
+M_PER_DEG = math.pi * EARTH_RADIUS_M / 180.0
 
 
-def load_osm_graph():
+def load_osm_graph(source=OVERPASS_JSON):
     """
-    Charge le JSON Overpass et construit:
+    Charge le JSON Overpass (ou un extrait .osm.pbf) et construit:
       - nodes_by_id:  node_id -> (lat, lon)
       - ways_by_id:   way_id -> [node_ids]
       - routes:       route_id -> { 'name', 'route', 'way_ids': [...] }
     """
-    with OVERPASS_JSON.open(encoding="utf-8") as f:
-        data = json.load(f)
+    return osm_graph_from_records(load_route_records(source))
 
-    elements = data.get("elements", [])
 
-    nodes_by_id = {}
-    ways_by_id = {}
-    relations = []
-
-    for el in elements:
-        if el.get("type") == "node":
-            nodes_by_id[el["id"]] = (el["lat"], el["lon"])
-        elif el.get("type") == "way":
-            ways_by_id[el["id"]] = el.get("nodes", [])
-        elif el.get("type") == "relation":
-            relations.append(el)
+def osm_graph_from_records(data):
+    """Comme load_osm_graph, sur un osm_records.OsmData déjà lu."""
+    nodes_by_id = {node.id: (node.lat, node.lon) for node in data.nodes}
+    ways_by_id = {way.id: way.nodes for way in data.ways}
 
     routes = {}
 
-    for rel in relations:
-        tags = rel.get("tags", {})
+    for rel in data.relations:
+        tags = rel.tags
         route_type = tags.get("route")
         if route_type not in ("hiking", "ski"):
             continue
 
-        route_id = rel["id"]
-        way_ids = [
-            mem["ref"]
-            for mem in rel.get("members", [])
-            if mem.get("type") == "way"
-        ]
+        route_id = rel.id
+        way_ids = [mem.ref for mem in rel.members if mem.type == "way"]
 
         # Nettoyage / dédoublonnage
         way_ids = list(dict.fromkeys(way_ids))
@@ -116,6 +77,67 @@ def load_osm_graph():
     return nodes_by_id, ways_by_id, routes
 
 
+def attach_route_parts(routes, ways_by_id, nodes_by_id):
+    """
+    Ajoute à chaque route ses lignes assemblées ('parts'), sa 'bbox' et ses
+    niveaux simplifiés ('tiers' : [(écart max, parts)], du plus grossier).
+    """
+    for route in routes.values():
+        lines = stitch_ways(ways_by_id[w] for w in route["way_ids"] if w in ways_by_id)
+        parts = lines_to_parts(lines, nodes_by_id)
+        route["parts"] = flatten_parts(parts)
+        route["bbox"] = route_metrics(parts)["bbox"]
+        route["tiers"] = []
+        for tol in sorted(SIMPLIFY_TIERS_M, reverse=True):
+            simplified, err = simplify_parts(route["parts"], tol)
+            route["tiers"].append((err, simplified))
+
+
+def load_routes_from_geometry(path=GEOMETRY_FILE):
+    """
+    Routes depuis le fichier de géométrie de extract_routes_from_overpass.py
+    (mmap, sans relire le JSON) ; noms et types depuis routes.csv.
+    """
+    geometry = RouteGeometry(path)
+    tiers = [
+        RouteGeometry(tier_path(path, tol))
+        for tol in sorted(SIMPLIFY_TIERS_M, reverse=True)
+        if tier_path(path, tol).exists()
+    ]
+    routes = {}
+    with ROUTES_CSV.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            route_id = int(row["route_osm_id:ID(Route)"])
+            if route_id not in geometry:
+                continue
+            bbox = geometry.bbox(route_id)
+            routes[route_id] = {
+                "name": row.get("name", ""),
+                "route": row.get("route", ""),
+                "parts": geometry.parts(route_id),
+                "bbox": None if math.isnan(bbox[0]) else bbox,
+                "tiers": [
+                    (tier.max_error_m(route_id), tier.parts(route_id))
+                    for tier in tiers if route_id in tier
+                ],
+            }
+    print(f"{len(routes)} routes chargées depuis {path} "
+          f"({len(tiers)} niveaux simplifiés)")
+    return routes
+
+
+def bbox_distance_lower_bound_m(lat, lon, bbox):
+    """
+    Minorant de point_segment_distance_m entre (lat, lon) et tout segment
+    contenu dans la bbox (min_lat, min_lon, max_lat, max_lon).
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    dlat = max(0.0, min_lat - lat, lat - max_lat)
+    dlon = max(0.0, min_lon - lon, lon - max_lon)
+    cos_min = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    return math.hypot(dlat * M_PER_DEG, dlon * M_PER_DEG * cos_min)
+
+
 def load_huts():
     huts = []
     with HUTS_CSV.open(newline="", encoding="utf-8") as f:
@@ -149,43 +171,39 @@ def load_huts():
     return huts
 
 
-def min_distance_hut_to_route(hut, route, ways_by_id, nodes_by_id):
+def min_distance_hut_to_route(hut, route, max_distance_m=None):
     """
     Calcule la distance minimale (en m) entre la hut et la polyligne de la route
-    (toutes les ways de la relation).
+    (lignes assemblées à partir des ways de la relation).
     Retourne None si aucune géométrie utilisable.
+
+    Avec max_distance_m, les niveaux simplifiés de la route servent de
+    rejet rapide : si même la géométrie simplifiée, rapprochée de son écart
+    max, reste au-delà de max_distance_m, on renvoie None sans calcul exact.
     """
     lat = hut["lat"]
     lon = hut["lon"]
-    min_dist = None
 
-    for way_id in route["way_ids"]:
-        node_ids = ways_by_id.get(way_id)
-        if not node_ids or len(node_ids) < 2:
-            continue
+    if max_distance_m is not None:
+        for max_error, parts in route.get("tiers", ()):
+            d = min_distance_to_parts(lat, lon, parts)
+            if d is None:
+                return None
+            if d - max_error > max_distance_m + REJECT_MARGIN_M:
+                return None
 
-        # on parcourt les segments de la polyline
-        for i in range(len(node_ids) - 1):
-            nid1 = node_ids[i]
-            nid2 = node_ids[i + 1]
-
-            p1 = nodes_by_id.get(nid1)
-            p2 = nodes_by_id.get(nid2)
-            if p1 is None or p2 is None:
-                continue
-
-            lat1, lon1 = p1
-            lat2, lon2 = p2
-
-            d = point_segment_distance_m(lat, lon, lat1, lon1, lat2, lon2)
-            if min_dist is None or (d < min_dist):
-                min_dist = d
-
-    return min_dist
+    return min_distance_to_parts(lat, lon, route["parts"])
 
 
 def main():
-    nodes_by_id, ways_by_id, routes = load_osm_graph()
+    # Source optionnelle en argument : JSON Overpass ou extrait .osm.pbf ;
+    # sinon la géométrie précalculée par extract_routes_from_overpass.py
+    if len(sys.argv) == 1 and GEOMETRY_FILE.exists():
+        routes = load_routes_from_geometry(GEOMETRY_FILE)
+    else:
+        source = Path(sys.argv[1]) if len(sys.argv) > 1 else OVERPASS_JSON
+        nodes_by_id, ways_by_id, routes = load_osm_graph(source)
+        attach_route_parts(routes, ways_by_id, nodes_by_id)
     huts = load_huts()
 
     OUTPUT_CSV.parent.mkdir(exist_ok=True)
@@ -213,7 +231,13 @@ def main():
             for route_id, route in routes.items():
                 total_pairs += 1
 
-                dist = min_distance_hut_to_route(hut, route, ways_by_id, nodes_by_id)
+                bbox = route["bbox"]
+                if bbox is None or (
+                    bbox_distance_lower_bound_m(lat, lon, bbox) > THRESHOLD_METERS
+                ):
+                    continue
+
+                dist = min_distance_hut_to_route(hut, route, THRESHOLD_METERS)
                 if dist is None:
                     continue
 
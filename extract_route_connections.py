@@ -0,0 +1,173 @@
+import csv
+import sys
+import math
+from pathlib import Path
+from collections import defaultdict
+
+from osm_records import load_route_records
+from proximity import grid_pairs, find, union
+
+BASE_DIR = Path(__file__).resolve().parent
+
+OVERPASS_JSON = BASE_DIR / "osm_routes" / "laponie_routes.json"
+CONNECTS_CSV = BASE_DIR / "neo4j_routes" / "routes_connects_to.csv"
+CLUSTERS_CSV = BASE_DIR / "neo4j_routes" / "route_clusters.csv"
+
+# Deux routes sans node commun sont reliées si deux de leurs nodes sont à
+# moins de GAP_METERS (jonctions mal cartographiées, passerelles, etc.)
+GAP_METERS = 50.0
+
+
+# -----------------------------
+# Index node -> routes
+# -----------------------------
+def load_route_nodes(source=OVERPASS_JSON):
+    """
+    Lit le JSON Overpass (ou un extrait .osm.pbf) et construit :
+      - nodes_by_id:     node_id -> (lat, lon)
+      - node_to_routes:  node_id -> [route_ids] via les ways membres
+      - route_names:     route_id -> (name, route)
+    """
+    data = load_route_records(source)
+
+    nodes_by_id = {node.id: (node.lat, node.lon) for node in data.nodes}
+    ways_by_id = {way.id: way.nodes for way in data.ways}
+
+    node_to_routes = defaultdict(list)
+    route_names = {}
+    for rel in data.relations:
+        tags = rel.tags
+        route_type = tags.get("route")
+        if route_type not in ("hiking", "ski"):
+            continue
+        route_id = rel.id
+        if route_id in route_names:
+            continue
+        route_names[route_id] = (tags.get("name", ""), route_type)
+
+        route_nodes = set()
+        for mem in rel.members:
+            if mem.type == "way":
+                route_nodes.update(ways_by_id.get(mem.ref, ()))
+        for nid in route_nodes:
+            node_to_routes[nid].append(route_id)
+
+    print(f"{len(route_names)} routes, {len(node_to_routes)} nodes de ways membres")
+    return nodes_by_id, node_to_routes, route_names
+
+
+# -----------------------------
+# Connexions
+# -----------------------------
+def shared_node_connections(node_to_routes):
+    """{(route_a, route_b): nombre de nodes partagés}"""
+    shared = defaultdict(int)
+    for route_ids in node_to_routes.values():
+        if len(route_ids) < 2:
+            continue
+        route_ids = sorted(route_ids)
+        for i, a in enumerate(route_ids):
+            for b in route_ids[i + 1:]:
+                shared[(a, b)] += 1
+    return shared
+
+
+def gap_connections(nodes_by_id, node_to_routes, gap_m=GAP_METERS):
+    """
+    {(route_a, route_b): écart minimal en m} pour les routes dont deux nodes
+    sont à moins de gap_m (jointure par grille, voir proximity.grid_pairs).
+    """
+    points = {nid: nodes_by_id[nid] for nid in node_to_routes if nid in nodes_by_id}
+    gaps = {}
+    for n1, n2, d in grid_pairs(points, gap_m):
+        routes1 = node_to_routes[n1]
+        routes2 = node_to_routes[n2]
+        if routes1 == routes2:
+            continue
+        for a in routes1:
+            for b in routes2:
+                if a == b:
+                    continue
+                key = (a, b) if a < b else (b, a)
+                if d < gaps.get(key, math.inf):
+                    gaps[key] = d
+    return gaps
+
+
+# -----------------------------
+# Clusters de routes
+# -----------------------------
+def route_clusters(route_ids, pairs):
+    """{route_id: cluster_id} ; cluster_id = plus petite route_id du cluster."""
+    parent = {r: r for r in route_ids}
+    for a, b in pairs:
+        union(parent, a, b)
+    return {r: find(parent, r) for r in route_ids}
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main():
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else OVERPASS_JSON
+    nodes_by_id, node_to_routes, route_names = load_route_nodes(source)
+
+    shared = shared_node_connections(node_to_routes)
+    gaps = gap_connections(nodes_by_id, node_to_routes)
+    print(f"{len(shared)} paires de routes avec nodes communs, "
+          f"{len(gaps)} paires à moins de {GAP_METERS:.0f} m")
+
+    CONNECTS_CSV.parent.mkdir(exist_ok=True)
+    with CONNECTS_CSV.open("w", newline="", encoding="utf-8") as f_out:
+        fieldnames = [
+            ":START_ID(Route)",
+            ":END_ID(Route)",
+            "kind",
+            "shared_nodes:int",
+            "gap_m:float",
+        ]
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        writer.writeheader()
+        for a, b in sorted(set(shared) | set(gaps)):
+            n_shared = shared.get((a, b), 0)
+            writer.writerow({
+                ":START_ID(Route)": a,
+                ":END_ID(Route)": b,
+                "kind": "shared_node" if n_shared else "gap",
+                "shared_nodes:int": n_shared,
+                "gap_m:float": 0.0 if n_shared else f"{gaps[(a, b)]:.2f}",
+            })
+    print(f"Relations CONNECTS_TO écrites dans {CONNECTS_CSV}")
+
+    clusters = route_clusters(route_names, set(shared) | set(gaps))
+    sizes = defaultdict(int)
+    for cluster_id in clusters.values():
+        sizes[cluster_id] += 1
+
+    with CLUSTERS_CSV.open("w", newline="", encoding="utf-8") as f_out:
+        fieldnames = [
+            "route_osm_id:ID(Route)",
+            "name",
+            "route",
+            "cluster_id:long",
+            "cluster_size:int",
+        ]
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        writer.writeheader()
+        for route_id in sorted(clusters):
+            name, route_type = route_names[route_id]
+            writer.writerow({
+                "route_osm_id:ID(Route)": route_id,
+                "name": name,
+                "route": route_type,
+                "cluster_id:long": clusters[route_id],
+                "cluster_size:int": sizes[clusters[route_id]],
+            })
+
+    print(f"{len(sizes)} clusters de routes "
+          f"(le plus grand : {max(sizes.values(), default=0)} routes)")
+    print(f"Clusters écrits dans {CLUSTERS_CSV}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
-import json
 import csv
+import sys
 from pathlib import Path
 
+from osm_records import load_route_records
+from route_geometry import (
+    stitch_ways,
+    lines_to_parts,
+    flatten_parts,
+    route_metrics,
+    geometry_record,
+    write_geometry_tiers,
+    GEOMETRY_FILE,
+)
+
 BASE_DIR = Path(__file__).resolve().parent
 OVERPASS_JSON = BASE_DIR / "osm_routes" / "laponie_routes.json"
 ROUTES_CSV = BASE_DIR / "neo4j_routes" / "routes.csv"
@@ -10,29 +21,41 @@ ROUTES_CSV = BASE_DIR / "neo4j_routes" / "routes.csv"
 def main():
     ROUTES_CSV.parent.mkdir(exist_ok=True)
 
-    with OVERPASS_JSON.open(encoding="utf-8") as f:
-        data = json.load(f)
-
-    elements = data.get("elements", [])
+    # Source optionnelle en argument : JSON Overpass ou extrait .osm.pbf
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else OVERPASS_JSON
+    data = load_route_records(source)
     routes = []
+    geometries = {}
     seen_ids = set()
 
-    for el in elements:
-        if el.get("type") != "relation":
-            continue
+    nodes_by_id = {node.id: (node.lat, node.lon) for node in data.nodes}
+    ways_by_id = {way.id: way.nodes for way in data.ways}
 
-        tags = el.get("tags", {})
+    for rel in data.relations:
+        tags = rel.tags
         route_type = tags.get("route")
 
         # On garde uniquement les relations de rando / ski
         if route_type not in ("hiking", "ski"):
             continue
 
-        rel_id = el["id"]
+        rel_id = rel.id
         if rel_id in seen_ids:
             continue
         seen_ids.add(rel_id)
 
+        # Ways membres assemblées en lignes ordonnées
+        way_ids = list(dict.fromkeys(
+            m.ref for m in rel.members if m.type == "way"
+        ))
+        lines = stitch_ways(ways_by_id[w] for w in way_ids if w in ways_by_id)
+        parts = lines_to_parts(lines, nodes_by_id)
+        metrics = route_metrics(parts)
+        geometries[rel_id] = geometry_record(
+            flatten_parts(parts), metrics["bbox"], metrics["length_m"]
+        )
+        bbox = metrics["bbox"] or ("", "", "", "")
+
         routes.append(
             {
                 "route_osm_id:ID(Route)": rel_id,
@@ -43,6 +66,13 @@ def main():
                 "operator": tags.get("operator", ""),
                 "osmc_symbol": tags.get("osmc:symbol", ""),
                 "colour": tags.get("colour", ""),
+                "length_km:float": round(metrics["length_m"] / 1000.0, 3),
+                "min_lat:float": bbox[0],
+                "min_lon:float": bbox[1],
+                "max_lat:float": bbox[2],
+                "max_lon:float": bbox[3],
+                "part_count:int": metrics["parts"],
+                "segment_count:int": metrics["segments"],
             }
         )
 
@@ -56,6 +86,13 @@ def main():
             "operator",
             "osmc_symbol",
             "colour",
+            "length_km:float",
+            "min_lat:float",
+            "min_lon:float",
+            "max_lat:float",
+            "max_lon:float",
+            "part_count:int",
+            "segment_count:int",
         ]
         writer = csv.DictWriter(f_out, fieldnames=fieldnames)
         writer.writeheader()
@@ -64,6 +101,12 @@ def main():
 
     print(f"{len(routes)} routes écrites dans {ROUTES_CSV}")
 
+    # Géométrie complète + niveaux simplifiés (Douglas-Peucker)
+    errors = write_geometry_tiers(geometries, GEOMETRY_FILE)
+    for tol, by_route in errors.items():
+        worst = max(by_route.values(), default=0.0)
+        print(f"  Niveau {tol:g} m : écart max {worst:.1f} m")
+
 
 if __name__ == "__main__":
     main()
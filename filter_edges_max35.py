@@ -1,13 +1,32 @@
 import csv
+import math
+import argparse
 from pathlib import Path
+from collections import defaultdict
+
+from build_cabane_graph import prune_epsilon
 
 BASE_DIR = Path(__file__).resolve().parent
 IN_PATH = BASE_DIR / "neo4j_huts" / "huts_edges_ors.csv"
-OUT_PATH = BASE_DIR / "neo4j_huts" / "huts_edges_ors_max35.csv"
 
+MAX_DISTANCE_KM = 35.0
+EPSILON = 0.05
+
+
+def tier_path(max_km):
+    """35 -> neo4j_huts/huts_edges_ors_max35.csv"""
+    return BASE_DIR / "neo4j_huts" / f"huts_edges_ors_max{max_km:g}.csv"
+
+
+def load_edges(max_km=MAX_DISTANCE_KM):
+    """
+    Lecture en flux de IN_PATH, lignes <= max_km seulement.
 
-def load_edges_max35():
-    edges = []  # (a, b, dist_km, dplus, dminus)
+    Renvoie {(min_id, max_id): [dist_km min, [(a, b, d_km, dplus, dminus), ...]]} :
+    une entrée par paire non orientée, avec la ou les lignes d'origine
+    (une seule en pratique : un seul sens par paire).
+    """
+    pairs = {}
     with IN_PATH.open(newline="", encoding="utf-8") as f_in:
         reader = csv.DictReader(f_in)
         for row in reader:
@@ -18,7 +37,7 @@ def load_edges_max35():
                 d = float(val)
             except ValueError:
                 continue
-            if d > 35.0:
+            if d > max_km:
                 continue
 
             try:
@@ -29,75 +48,74 @@ def load_edges_max35():
 
             dplus = row.get("dplus_m:float") or ""
             dminus = row.get("dminus_m:float") or ""
-            edges.append((a, b, d, dplus, dminus))
-    return edges
+            key = (a, b) if a < b else (b, a)
+            entry = pairs.get(key)
+            if entry is None:
+                pairs[key] = [d, [(a, b, d, dplus, dminus)]]
+            else:
+                entry[0] = min(entry[0], d)
+                entry[1].append((a, b, d, dplus, dminus))
+    return pairs
 
 
-def prune_indirect_edges(edges, epsilon=0.05):
+def detour_frontier(pair_dist):
     """
-    edges : liste (a, b, d_km, dplus, dminus) pour un seul sens (une ligne par paire)
-
-    On construit un dictionnaire non orienté (min(a,b), max(a,b)) -> dist_km
-    Puis on supprime les paires A-B pour lesquelles il existe une hut C telle que :
-      d(A,C) + d(C,B) <= d(A,B) * (1 + epsilon)
+    pair_dist : {(min_id, max_id): dist_km}
+
+    Pour chaque paire A-B, les détours par une hut C, d(A,C) + d(C,B), en
+    fonction du rayon R = max(d(A,C), d(C,B)) : liste [(R, détour)] triée
+    par R croissant, détours strictement décroissants (front de Pareto).
+    Au palier T (paires <= T km), le plus court détour disponible est celui
+    du dernier R <= T : un seul calcul sert à tous les paliers.
+    On ne parcourt que les voisins communs de A et B.
     """
-    pair_dist = {}  # (min_id, max_id) -> dist_km
-    huts = set()
-
-    for a, b, d, _, _ in edges:
-        huts.add(a)
-        huts.add(b)
-        key = (a, b) if a < b else (b, a)
-        old = pair_dist.get(key)
-        if old is None or d < old:
-            pair_dist[key] = d
-
-    def dist(u, v):
-        if u == v:
-            return 0.0
-        key = (u, v) if u < v else (v, u)
-        return pair_dist.get(key)
-
-    to_remove = set()
-
-    print(f"Prune: on a {len(pair_dist)} paires hut-hut avant filtrage...")
-
-    huts_list = list(huts)
-    for (a, b), d_ab in list(pair_dist.items()):
-        for c in huts_list:
-            if c == a or c == b:
-                continue
-            d_ac = dist(a, c)
-            if d_ac is None:
-                continue
-            d_cb = dist(c, b)
-            if d_cb is None:
-                continue
-            if d_ac + d_cb <= d_ab * (1.0 + epsilon):
-                to_remove.add((a, b))
-                break
-
-    print(f"  Paires supprimées (indirectes): {len(to_remove)}")
-
-    kept_pairs = set(pair_dist.keys()) - {
-        (a, b) if a < b else (b, a) for (a, b) in to_remove
-    }
-    return kept_pairs
-
-
-def main():
-    edges = load_edges_max35()
-    print(f"{len(edges)} arêtes <= 35 km chargées depuis {IN_PATH}")
-
-    kept_pairs = prune_indirect_edges(edges, epsilon=0.05)
-
-    with OUT_PATH.open("w", newline="", encoding="utf-8") as f_out:
+    neighbours = defaultdict(dict)
+    for (a, b), d in pair_dist.items():
+        neighbours[a][b] = d
+        neighbours[b][a] = d
+
+    frontier = {}
+    for (a, b) in pair_dist:
+        near_a, near_b = neighbours[a], neighbours[b]
+        if len(near_a) > len(near_b):
+            near_a, near_b = near_b, near_a
+        candidates = []
+        for c, d_1 in near_a.items():
+            d_2 = near_b.get(c)
+            if d_2 is not None:
+                candidates.append((max(d_1, d_2), d_1 + d_2))
+        candidates.sort()
+        front = []
+        for radius, detour in candidates:
+            if not front or detour < front[-1][1]:
+                front.append((radius, detour))
+        frontier[(a, b)] = front
+    return frontier
+
+
+def tier_detour(front, max_km):
+    """Plus court détour avec des paires <= max_km (math.inf si aucun)."""
+    best = math.inf
+    for radius, detour in front:
+        if radius > max_km:
+            break
+        best = detour
+    return best
+
+
+def write_tier(pairs, frontier, max_km, out_path: Path, epsilon=EPSILON):
+    """
+    Lignes des paires <= max_km qui ne sont pas indirectes à ce palier
+    (toutes si epsilon=None), avec le plus petit epsilon qui les supprimerait.
+    """
+    with out_path.open("w", newline="", encoding="utf-8") as f_out:
         fieldnames = [
             ":START_ID(Hut)",
             ":END_ID(Hut)",
             "distance_km:float",
             "dplus_m:float",
             "dminus_m:float",
+            "min_prune_epsilon:float",
         ]
         writer = csv.DictWriter(f_out, fieldnames=fieldnames)
         writer.writeheader()
@@ -105,23 +123,58 @@ def main():
         kept = 0
         skipped = 0
 
-        for a, b, d, dplus, dminus in edges:
-            key = (a, b) if a < b else (b, a)
-            if key not in kept_pairs:
-                skipped += 1
+        for key, (d_min, rows) in pairs.items():
+            if d_min > max_km:
+                continue
+            detour = tier_detour(frontier[key], max_km)
+            if epsilon is not None and detour <= d_min * (1.0 + epsilon):
+                skipped += len(rows)
                 continue
 
-            writer.writerow({
-                ":START_ID(Hut)": a,
-                ":END_ID(Hut)": b,
-                "distance_km:float": d,
-                "dplus_m:float": dplus,
-                "dminus_m:float": dminus,
-            })
-            kept += 1
-
-    print(f"Conservé {kept} arêtes, supprimé {skipped}.")
-    print(f"Fichier écrit: {OUT_PATH}")
+            min_eps = prune_epsilon(d_min, detour)
+            for a, b, d, dplus, dminus in rows:
+                if d > max_km:
+                    continue
+                writer.writerow({
+                    ":START_ID(Hut)": a,
+                    ":END_ID(Hut)": b,
+                    "distance_km:float": d,
+                    "dplus_m:float": dplus,
+                    "dminus_m:float": dminus,
+                    # vide : aucune hut intermédiaire, jamais supprimée
+                    "min_prune_epsilon:float": "" if min_eps is None else round(min_eps, 6),
+                })
+                kept += 1
+
+    print(f"  <= {max_km:g} km : conservé {kept} arêtes, supprimé {skipped} -> {out_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Filtre huts_edges_ors.csv par distance max et supprime les "
+                    "liaisons indirectes, pour un ou plusieurs paliers en une passe."
+    )
+    parser.add_argument(
+        "--tiers", type=float, nargs="+", default=[MAX_DISTANCE_KM], metavar="KM",
+        help=f"Distances max (défaut: {MAX_DISTANCE_KM:g}) ; ex. --tiers 25 35 45 "
+             "écrit huts_edges_ors_max25.csv, ..._max35.csv, ..._max45.csv.",
+    )
+    parser.add_argument(
+        "--keep-indirect", action="store_true",
+        help="N'élimine pas les liaisons indirectes (filtrer ensuite sur "
+             "min_prune_epsilon).",
+    )
+    args = parser.parse_args(argv)
+    tiers = sorted(set(args.tiers))
+    epsilon = None if args.keep_indirect else EPSILON
+
+    pairs = load_edges(max(tiers))
+    print(f"{len(pairs)} paires <= {max(tiers):g} km chargées depuis {IN_PATH}")
+
+    frontier = detour_frontier({key: entry[0] for key, entry in pairs.items()})
+
+    for max_km in tiers:
+        write_tier(pairs, frontier, max_km, tier_path(max_km), epsilon)
 
 
 if __name__ == "__main__":
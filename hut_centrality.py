@@ -0,0 +1,381 @@
+import os
+import csv
+import time
+import heapq
+import argparse
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from filter_edges_max35 import tier_path, MAX_DISTANCE_KM
+
+BASE_DIR = Path(__file__).resolve().parent
+HUTS_CSV = BASE_DIR / "neo4j_huts" / "huts.csv"
+HUT_CENTRALITY_CSV = BASE_DIR / "neo4j_huts" / "hut_centrality.csv"
+EDGE_CENTRALITY_CSV = BASE_DIR / "neo4j_huts" / "huts_edges_centrality.csv"
+
+# Lots de sources par processus (plusieurs lots par processus : les
+# sources en bord de réseau finissent plus vite que celles du centre)
+CHUNKS_PER_WORKER = 4
+
+
+# -----------------------------
+# Chargement
+# -----------------------------
+def load_link_graph(path: Path):
+    """
+    Graphe non orienté des liaisons LINK (distance_km : plus courte si une
+    paire apparaît deux fois).
+
+    Renvoie (hut_ids triés, adjacence [[(j, d_km)]] par indice,
+    lignes du CSV [(a, b)] dans l'ordre du fichier).
+    """
+    best = {}
+    rows = []
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                a = int(row[":START_ID(Hut)"])
+                b = int(row[":END_ID(Hut)"])
+                d = float(row["distance_km:float"])
+            except (KeyError, ValueError):
+                continue
+            rows.append((a, b))
+            if a == b:
+                continue
+            key = (a, b) if a < b else (b, a)
+            if d < best.get(key, float("inf")):
+                best[key] = d
+
+    hut_ids = sorted({h for pair in best for h in pair})
+    index = {h: i for i, h in enumerate(hut_ids)}
+    adj = [[] for _ in hut_ids]
+    for (a, b), d in sorted(best.items()):
+        adj[index[a]].append((index[b], d))
+        adj[index[b]].append((index[a], d))
+    print(f"{len(hut_ids)} huts, {len(best)} liaisons chargées depuis {path}")
+    return hut_ids, adj, rows
+
+
+def load_hut_names(path: Path = HUTS_CSV):
+    """{hut_id: name} depuis huts.csv (vide si le fichier n'existe pas)."""
+    names = {}
+    if not path.exists():
+        return names
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                names[int(row["hut_id:ID(Hut)"])] = row.get("name", "")
+            except (KeyError, ValueError):
+                continue
+    return names
+
+
+# -----------------------------
+# Betweenness (Brandes, pondéré)
+# -----------------------------
+def brandes_sources(adj, sources):
+    """
+    Contributions des sources données à la betweenness des huts et des
+    liaisons (Brandes : un Dijkstra par source qui compte les plus courts
+    chemins, puis accumulation des dépendances en ordre inverse).
+
+    Renvoie (node_scores [float] par indice, {(i, j) avec i < j: score}).
+    Chaque paire non orientée est comptée depuis ses deux extrémités.
+    """
+    n = len(adj)
+    inf = float("inf")
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    # arcs (voisin, poids, indice de liaison) : cumul dans une liste plutôt
+    # qu'un dict indexé par paire dans la boucle
+    edge_keys = []
+    edge_index = {}
+    arcs = []
+    for v, neighbours in enumerate(adj):
+        out = []
+        for w, weight in neighbours:
+            key = (v, w) if v < w else (w, v)
+            e = edge_index.get(key)
+            if e is None:
+                e = edge_index[key] = len(edge_keys)
+                edge_keys.append(key)
+            out.append((w, weight, e))
+        arcs.append(out)
+
+    node_scores = [0.0] * n
+    edge_scores = [0.0] * len(edge_keys)
+
+    for s in sources:
+        dist = [inf] * n
+        sigma = [0] * n
+        preds = [None] * n
+        order = []
+        dist[s] = 0.0
+        sigma[s] = 1
+        preds[s] = []
+        heap = [(0.0, s)]
+        while heap:
+            d, v = heappop(heap)
+            if d > dist[v]:
+                continue
+            order.append(v)
+            sigma_v = sigma[v]
+            # poids > 0 : un node déjà sorti du tas n'est plus modifié
+            for w, weight, e in arcs[v]:
+                nd = d + weight
+                if nd < dist[w]:
+                    dist[w] = nd
+                    sigma[w] = sigma_v
+                    preds[w] = [(v, e)]
+                    heappush(heap, (nd, w))
+                elif nd == dist[w]:
+                    sigma[w] += sigma_v
+                    preds[w].append((v, e))
+
+        delta = [0.0] * n
+        for w in reversed(order):
+            coeff = (1.0 + delta[w]) / sigma[w]
+            for v, e in preds[w]:
+                c = sigma[v] * coeff
+                delta[v] += c
+                edge_scores[e] += c
+            if w != s:
+                node_scores[w] += delta[w]
+
+    return node_scores, {
+        edge_keys[e]: score for e, score in enumerate(edge_scores) if score
+    }
+
+
+def parallel_betweenness(adj, workers=None):
+    """
+    Betweenness de toutes les huts et liaisons, sources réparties en lots
+    sur un pool de processus (workers=1 : calcul séquentiel).
+    Scores non orientés : chaque paire (s, t) n'est comptée qu'une fois.
+    """
+    n = len(adj)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, n))
+
+    if workers == 1:
+        parts = [brandes_sources(adj, range(n))]
+    else:
+        # sources entrelacées : chaque lot mêle bord et centre du réseau
+        chunk_count = min(n, workers * CHUNKS_PER_WORKER)
+        chunks = [range(k, n, chunk_count) for k in range(chunk_count)]
+        print(f"Betweenness : {n} sources en {chunk_count} lots "
+              f"({workers} processus)")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(brandes_sources, adj, chunk) for chunk in chunks]
+            parts = [f.result() for f in futures]
+
+    node_scores = [0.0] * n
+    edge_scores = defaultdict(float)
+    for part_nodes, part_edges in parts:
+        for i, score in enumerate(part_nodes):
+            node_scores[i] += score
+        for key, score in part_edges.items():
+            edge_scores[key] += score
+
+    node_scores = [score / 2.0 for score in node_scores]
+    edge_scores = {key: score / 2.0 for key, score in edge_scores.items()}
+    return node_scores, edge_scores
+
+
+# -----------------------------
+# Points d'articulation et ponts
+# -----------------------------
+def articulation_points_and_bridges(adj):
+    """
+    Tarjan (DFS itératif, lowlink) sur chaque composante connexe.
+
+    Renvoie :
+      cut_by_node : {i: huts coupées du plus grand morceau restant si la
+                     hut i disparaît} pour les points d'articulation
+      cut_by_edge : {(i, j) avec i < j: huts du plus petit côté} pour les ponts
+      component   : [numéro de composante] par indice
+    """
+    n = len(adj)
+    disc = [-1] * n
+    low = [0] * n
+    size = [1] * n
+    component = [-1] * n
+    cut_by_node = {}
+    cut_by_edge = {}
+    timer = 0
+
+    for root in range(n):
+        if disc[root] != -1:
+            continue
+        comp = root
+        members = []
+        # tailles des sous-arbres détachés par chaque point d'articulation
+        separated = defaultdict(list)
+        bridge_children = []
+        root_children = []
+
+        disc[root] = low[root] = timer
+        timer += 1
+        component[root] = comp
+        members.append(root)
+        stack = [(root, -1, iter(adj[root]))]
+        while stack:
+            v, parent, neighbours = stack[-1]
+            advanced = False
+            for w, _ in neighbours:
+                if w == parent:
+                    continue
+                if disc[w] == -1:
+                    disc[w] = low[w] = timer
+                    timer += 1
+                    component[w] = comp
+                    members.append(w)
+                    stack.append((w, v, iter(adj[w])))
+                    advanced = True
+                    break
+                low[v] = min(low[v], disc[w])
+            if advanced:
+                continue
+
+            stack.pop()
+            if parent == -1:
+                continue
+            size[parent] += size[v]
+            low[parent] = min(low[parent], low[v])
+            if parent == root:
+                root_children.append(size[v])
+            elif low[v] >= disc[parent]:
+                separated[parent].append(size[v])
+            if low[v] > disc[parent]:
+                bridge_children.append((parent, v))
+
+        comp_size = len(members)
+        if len(root_children) >= 2:
+            separated[root] = root_children
+        for u, pieces in separated.items():
+            # le reste de la composante (côté parent) est aussi un morceau
+            rest = comp_size - 1 - sum(pieces)
+            largest = max(max(pieces), rest)
+            cut_by_node[u] = comp_size - 1 - largest
+        for u, v in bridge_children:
+            key = (u, v) if u < v else (v, u)
+            cut_by_edge[key] = min(size[v], comp_size - size[v])
+
+    return cut_by_node, cut_by_edge, component
+
+
+# -----------------------------
+# Écriture des CSV
+# -----------------------------
+def write_hut_centrality_csv(hut_ids, node_scores, cut_by_node, component,
+                             names, path: Path = HUT_CENTRALITY_CSV):
+    """
+    Propriétés des huts (à fusionner sur hut_id), y compris les huts de
+    huts.csv sans liaison (score nul, composante vide).
+    """
+    n = len(hut_ids)
+    # normalisation non orientée : (n - 1)(n - 2) / 2 paires hors hut
+    scale = 2.0 / ((n - 1) * (n - 2)) if n > 2 else 0.0
+    index = {h: i for i, h in enumerate(hut_ids)}
+
+    fields = [
+        "hut_id:ID(Hut)",
+        "name",
+        "betweenness:float",
+        "betweenness_norm:float",
+        "articulation:boolean",
+        "cut_huts:int",
+        "component:int",
+    ]
+    print(f"Écriture {path}")
+    path.parent.mkdir(exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for hut_id in sorted(set(hut_ids) | set(names)):
+            i = index.get(hut_id)
+            score = node_scores[i] if i is not None else 0.0
+            writer.writerow({
+                "hut_id:ID(Hut)": hut_id,
+                "name": names.get(hut_id, ""),
+                "betweenness:float": round(score, 3),
+                "betweenness_norm:float": round(score * scale, 6),
+                "articulation:boolean": "true" if i in cut_by_node else "false",
+                "cut_huts:int": cut_by_node.get(i, 0),
+                "component:int": component[i] if i is not None else "",
+            })
+
+
+def write_edge_centrality_csv(hut_ids, rows, edge_scores, cut_by_edge,
+                              path: Path = EDGE_CENTRALITY_CSV):
+    """Propriétés des liaisons, une ligne par ligne du CSV d'entrée."""
+    index = {h: i for i, h in enumerate(hut_ids)}
+    fields = [
+        ":START_ID(Hut)",
+        ":END_ID(Hut)",
+        "edge_betweenness:float",
+        "bridge:boolean",
+        "cut_huts:int",
+    ]
+    print(f"Écriture {path}")
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for a, b in rows:
+            i, j = index.get(a), index.get(b)
+            key = None if i is None or j is None else (min(i, j), max(i, j))
+            writer.writerow({
+                ":START_ID(Hut)": a,
+                ":END_ID(Hut)": b,
+                "edge_betweenness:float": round(edge_scores.get(key, 0.0), 3),
+                "bridge:boolean": "true" if key in cut_by_edge else "false",
+                "cut_huts:int": cut_by_edge.get(key, 0),
+            })
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Huts et liaisons critiques du graphe LINK : betweenness "
+                    "pondérée (Brandes), points d'articulation et ponts."
+    )
+    parser.add_argument(
+        "--edges", type=Path, default=tier_path(MAX_DISTANCE_KM),
+        help="CSV des liaisons (défaut: neo4j_huts/huts_edges_ors_max35.csv, "
+             "voir filter_edges_max35.py).",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, metavar="N",
+        help="Processus pour la betweenness (défaut: nombre de CPU ; "
+             "1 = calcul séquentiel).",
+    )
+    args = parser.parse_args(argv)
+
+    hut_ids, adj, rows = load_link_graph(args.edges)
+
+    t0 = time.perf_counter()
+    node_scores, edge_scores = parallel_betweenness(adj, args.workers)
+    print(f"  Betweenness calculée en {time.perf_counter() - t0:.1f} s")
+
+    cut_by_node, cut_by_edge, component = articulation_points_and_bridges(adj)
+    print(f"Points d'articulation : {len(cut_by_node)}, ponts : {len(cut_by_edge)}, "
+          f"composantes : {len(set(component))}")
+
+    top = sorted(range(len(hut_ids)), key=lambda i: -node_scores[i])[:10]
+    names = load_hut_names()
+    print("Huts les plus centrales :")
+    for i in top:
+        print(f"  {hut_ids[i]} - {names.get(hut_ids[i], '?')} : {node_scores[i]:.1f}"
+              + (f" (articulation, {cut_by_node[i]} huts coupées)"
+                 if i in cut_by_node else ""))
+
+    write_hut_centrality_csv(hut_ids, node_scores, cut_by_node, component, names)
+    write_edge_centrality_csv(hut_ids, rows, edge_scores, cut_by_edge)
+
+
+if __name__ == "__main__":
+    main()
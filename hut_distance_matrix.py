@@ -0,0 +1,255 @@
+import mmap
+import time
+import heapq
+import struct
+import bisect
+import random
+import argparse
+from array import array
+from pathlib import Path
+from collections import defaultdict
+
+from build_cabane_graph import (
+    load_build_state,
+    merge_pairs_by_source,
+    STATE_FILE,
+)
+
+BASE_DIR = Path(".")
+MATRIX_FILE = BASE_DIR / "cache" / "hut_distances.bin"
+
+# Fichier binaire (little-endian), lu en mmap par HutDistanceMatrix :
+#   en-tête  : MAGIC, nombre de huts, nombre d'entrées, rayon (km)
+#   hut_ids  : q[n]      (triés ; indice = rang dans ce tableau)
+#   indptr   : Q[n + 1]  (entrées de la hut i : indptr[i]..indptr[i + 1])
+#   cols     : I[m]      (indice de la hut cible, croissant dans une ligne)
+#   dist_km  : f[m]      (plus courte distance par les chemins, float32)
+#   via      : i[m]      (indice de la première hut intermédiaire, -1 = direct)
+#   direct   : d[m]      (distance de la liaison directe, NaN si aucune)
+MAGIC = b"HDST0001"
+HEADER = struct.Struct("<8sQQd")
+
+
+# -----------------------------
+# Calcul
+# -----------------------------
+def hut_distance_rows(pairs_by_source, max_distance_km):
+    """
+    Toutes les distances hut-hut <= max_distance_km, à partir des résultats
+    Dijkstra bloqués (pairs_by_source) : un chemin qui traverse l'ancrage
+    d'une hut se découpe en liaisons directes, donc un Dijkstra sur le
+    graphe des liaisons directes donne la distance complète et la première
+    hut traversée.
+
+    Renvoie (hut_ids triés, {i: [(j, dist_km, via_index, direct_km)]}).
+    """
+    direct = merge_pairs_by_source(pairs_by_source)
+    hut_ids = sorted({h for pair in direct for h in pair} | set(pairs_by_source))
+    index = {h: i for i, h in enumerate(hut_ids)}
+
+    neighbours = defaultdict(list)
+    for (a, b), d in direct.items():
+        neighbours[index[a]].append((index[b], d))
+        neighbours[index[b]].append((index[a], d))
+
+    rows = {}
+    for i in range(len(hut_ids)):
+        dist = {i: 0.0}
+        via = {i: -1}
+        heap = [(0.0, i)]
+        done = set()
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            for v, w in neighbours[u]:
+                nd = d + w
+                if nd > max_distance_km or nd >= dist.get(v, float("inf")):
+                    continue
+                dist[v] = nd
+                # première hut intermédiaire sur le chemin depuis i
+                via[v] = -1 if u == i else (via[u] if via[u] != -1 else u)
+                heapq.heappush(heap, (nd, v))
+
+        row = []
+        for j in sorted(dist):
+            if j == i:
+                continue
+            a, b = hut_ids[i], hut_ids[j]
+            key = (a, b) if a < b else (b, a)
+            row.append((j, dist[j], via[j], direct.get(key, float("nan"))))
+        rows[i] = row
+    return hut_ids, rows
+
+
+def write_matrix(hut_ids, rows, max_distance_km, path: Path = MATRIX_FILE):
+    path.parent.mkdir(exist_ok=True)
+    indptr = array("Q", [0])
+    cols = array("I")
+    dist_km = array("f")
+    via = array("i")
+    direct = array("d")
+    for i in range(len(hut_ids)):
+        for j, d, v, d_direct in rows[i]:
+            cols.append(j)
+            dist_km.append(d)
+            via.append(v)
+            direct.append(d_direct)
+        indptr.append(len(cols))
+
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        f.write(HEADER.pack(MAGIC, len(hut_ids), len(cols), max_distance_km))
+        for arr in (array("q", hut_ids), indptr, cols, dist_km, via, direct):
+            f.write(arr.tobytes())
+    tmp.replace(path)
+    print(f"Matrice de distances : {len(hut_ids)} huts, {len(cols)} paires "
+          f"<= {max_distance_km:g} km écrite dans {path}")
+
+
+def build_matrix(pairs_by_source, max_distance_km, path: Path = MATRIX_FILE):
+    t0 = time.perf_counter()
+    hut_ids, rows = hut_distance_rows(pairs_by_source, max_distance_km)
+    write_matrix(hut_ids, rows, max_distance_km, path)
+    print(f"  calculée en {time.perf_counter() - t0:.1f} s")
+
+
+# -----------------------------
+# Lecture (mmap)
+# -----------------------------
+class HutDistanceMatrix:
+    """Lecture en mmap du fichier écrit par write_matrix."""
+
+    def __init__(self, path: Path = MATRIX_FILE):
+        self._file = path.open("rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, m, self.max_distance_km = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} n'est pas une matrice de distances hut-hut")
+
+        view = memoryview(self._mm)
+        pos = HEADER.size
+        sections = []
+        for code, count in (("q", n), ("Q", n + 1), ("I", m), ("f", m),
+                            ("i", m), ("d", m)):
+            size = array(code).itemsize * count
+            sections.append(view[pos:pos + size].cast(code))
+            pos += size
+        (self._hut_ids, self._indptr, self._cols, self._dist,
+         self._via, self._direct) = sections
+        self.index = {h: i for i, h in enumerate(self._hut_ids)}
+
+    def __len__(self):
+        return len(self._hut_ids)
+
+    def _find(self, a, b):
+        i = self.index.get(a)
+        j = self.index.get(b)
+        if i is None or j is None:
+            return None
+        lo, hi = self._indptr[i], self._indptr[i + 1]
+        k = bisect.bisect_left(self._cols, j, lo, hi)
+        if k < hi and self._cols[k] == j:
+            return k
+        return None
+
+    def lookup(self, a, b):
+        """
+        (distance_km, via_hut_id) entre les huts a et b : via_hut_id est la
+        première hut traversée depuis a (None si le plus court chemin est
+        direct). None si b est au-delà du rayon.
+        """
+        if a == b:
+            return 0.0, None
+        k = self._find(a, b)
+        if k is None:
+            return None
+        v = self._via[k]
+        return float(self._dist[k]), (self._hut_ids[v] if v >= 0 else None)
+
+    def direct_km(self, a, b):
+        """Distance de la liaison directe (sans traverser d'ancrage), ou None."""
+        k = self._find(a, b)
+        if k is None or self._direct[k] != self._direct[k]:
+            return None
+        return self._direct[k]
+
+    def neighbours(self, a):
+        """[(hut_id, distance_km)] de toutes les huts dans le rayon de a."""
+        i = self.index[a]
+        return [
+            (self._hut_ids[self._cols[k]], float(self._dist[k]))
+            for k in range(self._indptr[i], self._indptr[i + 1])
+        ]
+
+    def direct_pairs(self):
+        """
+        {(min_id, max_id): distance_km} des liaisons directes, comme
+        merge_pairs_by_source : entrée de prune_redundant_edges sans
+        relancer de Dijkstra.
+        """
+        pairs = {}
+        for i, a in enumerate(self._hut_ids):
+            for k in range(self._indptr[i], self._indptr[i + 1]):
+                d = self._direct[k]
+                b = self._hut_ids[self._cols[k]]
+                if d == d and a < b:
+                    pairs[(a, b)] = d
+        return pairs
+
+    def close(self):
+        for section in (self._hut_ids, self._indptr, self._cols, self._dist,
+                        self._via, self._direct):
+            section.release()
+        self._mm.close()
+        self._file.close()
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Matrice des distances hut-hut (toutes les paires dans le rayon)."
+    )
+    parser.add_argument("command", choices=("build", "lookup", "bench"))
+    parser.add_argument("huts", nargs="*", type=int, help="lookup : HUT_A HUT_B")
+    parser.add_argument("--n", type=int, default=100_000,
+                        help="bench : nombre de recherches (défaut: 100000)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        state = load_build_state(BASE_DIR / STATE_FILE)
+        build_matrix(state["pairs_by_source"], state["max_distance_km"])
+        return
+
+    matrix = HutDistanceMatrix(MATRIX_FILE)
+    if args.command == "lookup":
+        if len(args.huts) != 2:
+            raise SystemExit("lookup attend deux hut_ids")
+        a, b = args.huts
+        result = matrix.lookup(a, b)
+        if result is None:
+            print(f"{a} -> {b} : au-delà de {matrix.max_distance_km:g} km")
+        else:
+            d_km, via = result
+            direct = matrix.direct_km(a, b)
+            print(f"{a} -> {b} : {d_km:.3f} km"
+                  + (f" via {via}" if via is not None else " (direct)")
+                  + (f", liaison directe {direct:.3f} km" if direct is not None
+                     and via is not None else ""))
+        return
+
+    hut_ids = list(matrix.index)
+    rng = random.Random(0)
+    queries = [(rng.choice(hut_ids), rng.choice(hut_ids)) for _ in range(args.n)]
+    t0 = time.perf_counter()
+    found = sum(1 for a, b in queries if matrix.lookup(a, b) is not None)
+    elapsed = time.perf_counter() - t0
+    print(f"{args.n} recherches en {elapsed:.3f} s "
+          f"({args.n / elapsed:,.0f}/s, {found} dans le rayon)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import csv
+import unicodedata
+from pathlib import Path
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from proximity import grid_pairs, local_distance_m, find, union
+
+BASE_DIR = Path(".")
+REPORT_CSV = BASE_DIR / "neo4j_huts" / "hut_duplicates_report.csv"
+
+# Deux huts à moins de DEDUP_RADIUS_M sont candidates au doublon
+# (même cabane cartographiée en node et en way, centre décalé, ...)
+DEDUP_RADIUS_M = 100.0
+# Score minimal (similarité des noms x accord des tags) pour fusionner
+DEDUP_MIN_SCORE = 0.85
+
+# Tags comparés entre deux candidates (si présents des deux côtés)
+COMPARED_TAGS = ("tourism", "amenity", "shelter_type", "operator")
+
+# Lettres nordiques sans décomposition Unicode
+NAME_TRANSLATE = str.maketrans({"ø": "o", "æ": "ae", "ð": "d", "þ": "th", "ß": "ss"})
+
+
+# -----------------------------
+# Similarité
+# -----------------------------
+def normalize_name(name):
+    """'Fjällstuga Vaisaluokta' -> 'fjallstuga vaisaluokta' (mots triés)."""
+    name = name.casefold().translate(NAME_TRANSLATE)
+    name = "".join(
+        c for c in unicodedata.normalize("NFKD", name)
+        if not unicodedata.combining(c)
+    )
+    words = "".join(c if c.isalnum() else " " for c in name).split()
+    return " ".join(sorted(words))
+
+
+def name_similarity(a, b):
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def tag_similarity(tags_a, tags_b):
+    """Part des tags de COMPARED_TAGS présents des deux côtés qui concordent."""
+    compared = [k for k in COMPARED_TAGS if tags_a.get(k) and tags_b.get(k)]
+    if not compared:
+        return 1.0
+    same = sum(1 for k in compared if tags_a[k] == tags_b[k])
+    return same / len(compared)
+
+
+def duplicate_score(name_a, name_b, tags_a, tags_b):
+    """
+    Similarité des noms normalisés, pénalisée (jusqu'à -25 %) quand les
+    tags de type de hut se contredisent.
+    """
+    return name_similarity(name_a, name_b) * (0.75 + 0.25 * tag_similarity(tags_a, tags_b))
+
+
+def canonical_key(hut_id, meta):
+    """
+    Un node OSM plutôt qu'une way / relation, puis le plus petit id (objet
+    le plus ancien, stable d'un rafraîchissement à l'autre ; c'est aussi le
+    choix fait à la main dans excluded_huts.txt).
+    """
+    return (meta.get("osm_type", "node") != "node", hut_id)
+
+
+def find_duplicates(nodes, hut_ids, hut_meta, radius_m=DEDUP_RADIUS_M,
+                    min_score=DEDUP_MIN_SCORE):
+    """
+    Renvoie {hut_id: (canonical_id, distance_m, score)} pour chaque hut d'un
+    groupe de doublons (la canonique comprise, score 1.0).
+    """
+    # triées par hut_id : paires candidates dans un ordre stable
+    positions = {h: (nodes[h]["lat"], nodes[h]["lon"]) for h in sorted(hut_ids)}
+    names = {h: normalize_name(hut_meta[h]["name"]) for h in hut_ids}
+
+    parent = {}
+    best = {}
+    for a, b, _ in grid_pairs(positions, radius_m):
+        a, b = min(a, b), max(a, b)
+        score = duplicate_score(names[a], names[b],
+                                hut_meta[a].get("tags") or {},
+                                hut_meta[b].get("tags") or {})
+        if score < min_score:
+            continue
+        parent.setdefault(a, a)
+        parent.setdefault(b, b)
+        union(parent, a, b)
+        for h in (a, b):
+            best[h] = max(best.get(h, 0.0), score)
+
+    clusters = defaultdict(list)
+    for h in parent:
+        clusters[find(parent, h)].append(h)
+
+    duplicates = {}
+    for members in clusters.values():
+        canonical = min(members, key=lambda h: canonical_key(h, hut_meta[h]))
+        lat0, lon0 = positions[canonical]
+        for h in members:
+            lat, lon = positions[h]
+            score = 1.0 if h == canonical else best[h]
+            duplicates[h] = (canonical, local_distance_m(lat0, lon0, lat, lon), score)
+    return duplicates
+
+
+# -----------------------------
+# Rapport + filtrage
+# -----------------------------
+def write_duplicates_report(nodes, hut_meta, duplicates, path: Path = REPORT_CSV):
+    """CSV à relire : un groupe par canonique, la canonique en premier."""
+    path.parent.mkdir(exist_ok=True)
+    fields = [
+        "canonical_id",
+        "hut_id",
+        "role",
+        "name",
+        "country_code",
+        "latitude",
+        "longitude",
+        "distance_m",
+        "score",
+    ]
+    rows = sorted(duplicates.items(), key=lambda kv: (kv[1][0], kv[0] != kv[1][0], kv[0]))
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for hut_id, (canonical, dist_m, score) in rows:
+            meta = hut_meta.get(hut_id, {})
+            writer.writerow({
+                "canonical_id": canonical,
+                "hut_id": hut_id,
+                "role": "canonical" if hut_id == canonical else "duplicate",
+                "name": meta.get("name", ""),
+                "country_code": meta.get("country_code", ""),
+                "latitude": nodes[hut_id]["lat"],
+                "longitude": nodes[hut_id]["lon"],
+                "distance_m": round(dist_m, 1),
+                "score": round(score, 3),
+            })
+    print(f"Rapport des doublons écrit dans {path}")
+
+
+def drop_duplicate_huts(nodes, hut_ids, hut_meta, report_path: Path = REPORT_CSV):
+    """
+    Retire de hut_ids / hut_meta les doublons (on garde la canonique de
+    chaque groupe) et écrit le rapport.
+    Renvoie (hut_ids, hut_meta, ids des doublons retirés).
+    """
+    duplicates = find_duplicates(nodes, hut_ids, hut_meta)
+    dropped = {h for h, (canonical, _, _) in duplicates.items() if h != canonical}
+    print(f"Doublons de huts : {len(dropped)} retirées "
+          f"({len(duplicates) - len(dropped)} groupes)")
+    for hut_id in sorted(dropped):
+        canonical = duplicates[hut_id][0]
+        print(f"  {hut_id} - {hut_meta[hut_id]['name']} -> {canonical} - "
+              f"{hut_meta[canonical]['name']}")
+    write_duplicates_report(nodes, hut_meta, duplicates, report_path)
+
+    hut_ids = hut_ids - dropped
+    hut_meta = {h: m for h, m in hut_meta.items() if h not in dropped}
+    return hut_ids, hut_meta, dropped
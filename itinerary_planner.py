@@ -0,0 +1,400 @@
+import csv
+import sys
+import time
+import heapq
+import pickle
+import random
+import hashlib
+import argparse
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+LINKS_CSV = BASE_DIR / "neo4j_huts" / "huts_edges_ors_max35.csv"
+HUTS_CSV = BASE_DIR / "neo4j_huts" / "huts.csv"
+TABLE_FILE = BASE_DIR / "cache" / "link_all_pairs.pickle"
+TABLE_VERSION = 1
+
+NO_PATH = -1
+UNREACHABLE_HOPS = 0xFFFF
+# Marge relative sur le minorant "distance restante" de plan_itineraries
+LOWER_BOUND_SLACK = 1e-6
+
+
+# -----------------------------
+# Chargement du graphe LINK
+# -----------------------------
+def load_links(path: Path):
+    """
+    Arêtes du graphe LINK : [(a, b, dist_km, dplus_m, dminus_m)].
+    Une ligne par paire ; dans le sens b -> a, D+ et D- sont inversés.
+    D+/D- vides (pas de profil ORS) comptent pour 0.
+    """
+    links = []
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                a = int(row[":START_ID(Hut)"])
+                b = int(row[":END_ID(Hut)"])
+                d = float(row["distance_km:float"])
+            except (KeyError, ValueError):
+                continue
+            dplus = float(row.get("dplus_m:float") or 0.0)
+            dminus = float(row.get("dminus_m:float") or 0.0)
+            links.append((a, b, d, dplus, dminus))
+    print(f"{len(links)} liaisons chargées depuis {path}")
+    return links
+
+
+def load_hut_names(path: Path):
+    names = {}
+    if not path.exists():
+        return names
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            names[int(row["hut_id:ID(Hut)"])] = row["name"]
+    return names
+
+
+def file_fingerprint(path: Path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+# -----------------------------
+# Table toutes paires
+# -----------------------------
+def build_all_pairs(links):
+    """
+    Un Dijkstra par hut sur le graphe LINK (à distance égale, le chemin
+    avec le moins d'étapes). Matrices N x N à plat, ligne = hut de départ :
+      dist_km  (float32, inf si pas de chemin)
+      dplus_m  D+ cumulé le long de ce plus court chemin (float32)
+      hops     nombre de liaisons du chemin (uint16)
+      pred     hut précédant la colonne sur le chemin (index, -1 sinon)
+    """
+    t0 = time.perf_counter()
+    huts = sorted({a for a, *_ in links} | {b for _, b, *_ in links})
+    index = {h: i for i, h in enumerate(huts)}
+    n = len(huts)
+
+    adj = [[] for _ in range(n)]
+    for a, b, d, dplus, dminus in links:
+        i, j = index[a], index[b]
+        adj[i].append((j, d, dplus))
+        adj[j].append((i, d, dminus))
+
+    inf = float("inf")
+    dist_km = array("f", [inf]) * (n * n)
+    dplus_m = array("f", [0.0]) * (n * n)
+    hops = array("H", [UNREACHABLE_HOPS]) * (n * n)
+    pred = array("l", [NO_PATH]) * (n * n)
+
+    for src in range(n):
+        row = src * n
+        best = {src: (0.0, 0)}
+        heap = [(0.0, 0, 0.0, src, NO_PATH)]
+        while heap:
+            d, h, up, u, p = heapq.heappop(heap)
+            if hops[row + u] != UNREACHABLE_HOPS:
+                continue
+            dist_km[row + u] = d
+            hops[row + u] = h
+            dplus_m[row + u] = up
+            pred[row + u] = p
+            for v, w, dp in adj[u]:
+                key = (d + w, h + 1)
+                if key < best.get(v, (inf, 0)):
+                    best[v] = key
+                    heapq.heappush(heap, (d + w, h + 1, up + dp, v, u))
+
+    print(f"Table toutes paires : {n} huts, {len(links)} liaisons "
+          f"en {time.perf_counter() - t0:.2f} s")
+    return {
+        "version": TABLE_VERSION,
+        "huts": array("q", huts),
+        "dist_km": dist_km,
+        "dplus_m": dplus_m,
+        "hops": hops,
+        "pred": pred,
+    }
+
+
+class LinkTable:
+    """Table toutes paires du graphe LINK, plus voisins triés par distance."""
+
+    def __init__(self, data):
+        self.data = data
+        self.huts = data["huts"]
+        self.n = len(self.huts)
+        self.index = {h: i for i, h in enumerate(self.huts)}
+        self.dist_km = data["dist_km"]
+        self.dplus_m = data["dplus_m"]
+        self.hops = data["hops"]
+        self.pred = data["pred"]
+
+        # Pour chaque hut : huts atteignables triées par distance, et les
+        # distances correspondantes (bisect pour "à moins de D km")
+        n = self.n
+        self.order = []
+        self.order_km = []
+        for i in range(n):
+            row = i * n
+            reach = sorted(
+                (self.dist_km[row + j], j) for j in range(n)
+                if j != i and self.hops[row + j] != UNREACHABLE_HOPS
+            )
+            self.order.append(array("l", [j for _, j in reach]))
+            self.order_km.append(array("d", [d for d, _ in reach]))
+
+    @classmethod
+    def load_or_build(cls, links_csv: Path = LINKS_CSV,
+                      path: Path = TABLE_FILE, rebuild=False):
+        fingerprint = file_fingerprint(links_csv)
+        if path.exists() and not rebuild:
+            with path.open("rb") as f:
+                data = pickle.load(f)
+            if (data.get("version") == TABLE_VERSION
+                    and data.get("fingerprint") == fingerprint):
+                return cls(data)
+            print(f"Table {path} obsolète : recalcul")
+        data = build_all_pairs(load_links(links_csv))
+        data["fingerprint"] = fingerprint
+        path.parent.mkdir(exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Table sauvegardée dans {path}")
+        return cls(data)
+
+    def path(self, i, j):
+        """Indices des huts du plus court chemin i -> j (inclus), ou None."""
+        row = i * self.n
+        if self.hops[row + j] == UNREACHABLE_HOPS:
+            return None
+        out = [j]
+        while j != i:
+            j = self.pred[row + j]
+            out.append(j)
+        out.reverse()
+        return out
+
+
+# -----------------------------
+# Planification
+# -----------------------------
+def plan_itineraries(table, hut_a, hut_b, days, max_km, max_dplus_m=None, k=1):
+    """
+    Itinéraires de hut_a à hut_b en exactement `days` étapes, chaque étape
+    suivant le plus court chemin LINK entre deux huts de nuit, avec au plus
+    max_km et max_dplus_m de D+ par jour. On ne dort jamais deux fois dans
+    la même hut.
+
+    Recherche best-first sur les itinéraires partiels, ordonnés par
+    distance parcourue + distance restante jusqu'à hut_b (minorant : les
+    étapes suivent des plus courts chemins). Deux partiels de même état
+    (hut du soir, huts de nuit déjà visitées) ont exactement les mêmes
+    suites possibles : chaque état est développé au plus k fois, par les
+    k meilleurs partiels. La recherche s'arrête quand aucun partiel ne
+    peut plus battre le k-ième itinéraire complet : résultat exact.
+    Renvoie jusqu'à k listes d'indices de huts de nuit, de la plus courte
+    à la plus longue : [(total_km, [i0, i1, ..., iK])].
+    """
+    a = table.index[hut_a]
+    b = table.index[hut_b]
+    n = table.n
+    dist_km = table.dist_km
+    dplus_m = table.dplus_m
+    to_b = b  # colonne "vers l'arrivée" : dist(v, b) = dist_km[v * n + b]
+    # minorant un peu réduit : les distances de la table sont en float32
+    h_scale = 1.0 - LOWER_BOUND_SLACK
+
+    heap = [(h_scale * dist_km[a * n + to_b], 0.0, (a,), frozenset((a,)))]
+    expanded = {}
+    found = []
+    kth_km = float("inf")
+    while heap:
+        f, total, stops, visited = heapq.heappop(heap)
+        if f > kth_km:
+            break
+        day = len(stops)  # numéro de l'étape suivante
+        if day > days:
+            found.append((total, stops))
+            if len(found) >= k:
+                kth_km = heapq.nsmallest(k, found)[-1][0]
+            continue
+
+        u = stops[-1]
+        state = (u, visited)
+        count = expanded.get(state, 0)
+        if count >= k:
+            continue
+        expanded[state] = count + 1
+
+        remaining = (days - day) * max_km
+        row = u * n
+        order = table.order[u]
+        stop = bisect_right(table.order_km[u], max_km)
+        for pos in range(stop):
+            v = order[pos]
+            if v in visited:
+                continue
+            to_go = dist_km[v * n + to_b]
+            if day == days:
+                if v != b:
+                    continue
+            elif v == b or to_go > remaining:
+                continue
+            if max_dplus_m is not None and dplus_m[row + v] > max_dplus_m:
+                continue
+            new_total = total + dist_km[row + v]
+            heapq.heappush(heap, (new_total + h_scale * to_go, new_total,
+                                  stops + (v,), visited | {v}))
+
+    return [(total, list(stops)) for total, stops in heapq.nsmallest(k, found)]
+
+
+def brute_force_itineraries(table, hut_a, hut_b, days, max_km, max_dplus_m=None, k=1):
+    """
+    Référence pour plan_itineraries : énumère toutes les suites de huts de
+    nuit distinctes (étapes <= max_km et max_dplus_m), puis garde les k
+    plus courtes. Exponentiel en `days`, pour de petits tests seulement.
+    """
+    a = table.index[hut_a]
+    b = table.index[hut_b]
+    n = table.n
+    plans = []
+
+    def extend(total, stops):
+        u = stops[-1]
+        if len(stops) == days + 1:
+            if u == b:
+                plans.append((total, stops))
+            return
+        for v in table.order[u]:
+            d = table.dist_km[u * n + v]
+            if d > max_km or v in stops:
+                continue
+            if max_dplus_m is not None and table.dplus_m[u * n + v] > max_dplus_m:
+                continue
+            extend(total + d, stops + (v,))
+
+    extend(0.0, (a,))
+    return [(total, list(stops)) for total, stops in heapq.nsmallest(k, plans)]
+
+
+def describe_itinerary(table, stops, names):
+    """Étapes lisibles d'un itinéraire (liste d'indices de huts de nuit)."""
+    n = table.n
+    stages = []
+    for u, v in zip(stops, stops[1:]):
+        via = table.path(u, v)[1:-1]
+        stages.append({
+            "from": table.huts[u],
+            "to": table.huts[v],
+            "km": round(table.dist_km[u * n + v], 2),
+            "dplus_m": round(table.dplus_m[u * n + v]),
+            "via": [names.get(table.huts[w], str(table.huts[w])) for w in via],
+        })
+    return stages
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def resolve_hut(ref, names, table):
+    try:
+        hut_id = int(ref)
+    except ValueError:
+        matches = [h for h, name in names.items() if name == ref]
+        if not matches:
+            raise SystemExit(f"Hut inconnue : {ref}")
+        hut_id = matches[0]
+    if hut_id not in table.index:
+        raise SystemExit(f"Hut {ref} absente du graphe LINK")
+    return hut_id
+
+
+def run_bench(table, count, days, max_km, max_dplus_m, k):
+    rng = random.Random(0)
+    huts = list(table.huts)
+    found = 0
+    t0 = time.perf_counter()
+    for _ in range(count):
+        a, b = rng.sample(huts, 2)
+        if plan_itineraries(table, a, b, days, max_km, max_dplus_m, k):
+            found += 1
+    elapsed = time.perf_counter() - t0
+    print(f"{count} plans ({days} jours, {max_km} km/jour, k={k}) en "
+          f"{elapsed:.2f} s : {count / elapsed:.0f} plans/s, {found} faisables")
+
+
+def run_check(table, count, days, max_km, max_dplus_m, k):
+    """plan_itineraries contre brute_force_itineraries sur des paires au hasard."""
+    rng = random.Random(0)
+    huts = list(table.huts)
+    found = 0
+    for _ in range(count):
+        a, b = rng.sample(huts, 2)
+        expected = brute_force_itineraries(table, a, b, days, max_km, max_dplus_m, k)
+        got = plan_itineraries(table, a, b, days, max_km, max_dplus_m, k)
+        if got != expected:
+            print(f"ÉCHEC {a} -> {b} :\n  attendu {expected}\n  obtenu  {got}")
+            sys.exit(1)
+        found += bool(expected)
+    print(f"OK: {count} plans ({days} jours, {max_km} km/jour, k={k}) identiques "
+          f"à l'énumération exhaustive, {found} faisables")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Planificateur de treks hut à hut sur le graphe LINK "
+                    "(huts_edges_ors_max35.csv)."
+    )
+    parser.add_argument("command", choices=("build", "plan", "bench", "check"))
+    parser.add_argument("huts", nargs="*",
+                        help="plan : hut de départ et hut d'arrivée (osm_id ou nom)")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--max-km", type=float, default=25.0,
+                        help="Distance maximale par jour (défaut: 25).")
+    parser.add_argument("--max-dplus", type=float, default=None,
+                        help="D+ maximal par jour en mètres.")
+    parser.add_argument("--k", type=int, default=3,
+                        help="Nombre d'itinéraires alternatifs (défaut: 3).")
+    parser.add_argument("--plans", type=int, default=5000,
+                        help="bench / check : nombre de plans aléatoires.")
+    args = parser.parse_args(argv)
+
+    table = LinkTable.load_or_build(rebuild=args.command == "build")
+    if args.command == "build":
+        return
+    if args.command == "bench":
+        run_bench(table, args.plans, args.days, args.max_km, args.max_dplus, args.k)
+        return
+    if args.command == "check":
+        run_check(table, args.plans, args.days, args.max_km, args.max_dplus, args.k)
+        return
+
+    if len(args.huts) != 2:
+        raise SystemExit("plan attend une hut de départ et une hut d'arrivée")
+    names = load_hut_names(HUTS_CSV)
+    hut_a = resolve_hut(args.huts[0], names, table)
+    hut_b = resolve_hut(args.huts[1], names, table)
+
+    results = plan_itineraries(table, hut_a, hut_b, args.days, args.max_km,
+                               args.max_dplus, args.k)
+    if not results:
+        print(f"Aucun itinéraire en {args.days} jours avec ces contraintes.")
+        sys.exit(1)
+    for rank, (total, stops) in enumerate(results, start=1):
+        stages = describe_itinerary(table, stops, names)
+        total_dplus = sum(s["dplus_m"] for s in stages)
+        print(f"Itinéraire {rank} : {total:.1f} km, D+ {total_dplus} m")
+        for day, s in enumerate(stages, start=1):
+            via = f" (via {', '.join(s['via'])})" if s["via"] else ""
+            print(f"  Jour {day} : {names.get(s['from'], s['from'])} -> "
+                  f"{names.get(s['to'], s['to'])} : {s['km']} km, "
+                  f"D+ {s['dplus_m']} m{via}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import csv
+import time
+import pickle
+import argparse
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from collections import defaultdict
+
+from build_cabane_graph import (
+    build_spatial_index,
+    find_nearest_graph_node,
+    load_build_state,
+    STATE_FILE,
+    ANCHOR_RADIUS_M,
+)
+from shortest_path import multi_source_dijkstra
+
+BASE_DIR = Path(".")
+LABELS_FILE = BASE_DIR / "cache" / "nearest_hut_labels.pickle"
+LABELS_VERSION = 1
+CATCHMENTS_CSV = BASE_DIR / "neo4j_huts" / "hut_catchments.csv"
+CELL_SIZE_DEG = 0.05
+
+
+# -----------------------------
+# Étiquetage
+# -----------------------------
+def label_nearest_huts(graph, huts_by_anchor):
+    """
+    Étiquette chaque node du graphe avec la hut la plus proche par les
+    chemins, en un seul Dijkstra multi-sources depuis tous les ancrages.
+
+    Une hut ne « voit » jamais au-delà d'une autre : le chemin le plus court
+    vers l'ancrage le plus proche ne traverse aucun autre ancrage.
+    Quand plusieurs huts partagent un ancrage, la plus petite osm_id l'emporte
+    (comme TrailRouter.nearest_hut).
+
+    Renvoie un dict de tableaux compacts (voir NearestHutLabels).
+    """
+    t0 = time.perf_counter()
+    huts = sorted(min(h) for h in huts_by_anchor.values() if h)
+    hut_index = {h: i for i, h in enumerate(huts)}
+    seeds = [
+        (anchor, hut_index[min(h)])
+        for anchor, h in huts_by_anchor.items() if h
+    ]
+    dist_dict, label_of = multi_source_dijkstra(graph, seeds)
+
+    node_ids = array("q", sorted(graph))
+    hut_of = array("l")
+    dist_m = array("f")
+    for nid in node_ids:
+        label = label_of.get(nid)
+        if label is None:
+            # composante sans hut
+            hut_of.append(-1)
+            dist_m.append(float("inf"))
+        else:
+            hut_of.append(label)
+            dist_m.append(dist_dict[nid])
+
+    print(f"Étiquetage : {len(label_of)}/{len(node_ids)} nodes rattachés à "
+          f"{len(huts)} huts en {time.perf_counter() - t0:.1f} s")
+    return {
+        "version": LABELS_VERSION,
+        "huts": array("q", huts),
+        "node_ids": node_ids,
+        "hut_of": hut_of,
+        "dist_m": dist_m,
+    }
+
+
+class NearestHutLabels:
+    """
+    Hut la plus proche de chaque node : trois tableaux parallèles triés par
+    node_id (node_ids, hut_of = index dans huts ou -1, dist_m en float32).
+    lookup cherche par dichotomie dans node_ids, sans index en mémoire.
+    """
+
+    def __init__(self, data):
+        self.huts = data["huts"]
+        self.node_ids = data["node_ids"]
+        self.hut_of = data["hut_of"]
+        self.dist_m = data["dist_m"]
+        self.data = data
+
+    @classmethod
+    def load(cls, path: Path = LABELS_FILE):
+        with path.open("rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != LABELS_VERSION:
+            raise SystemExit(f"Étiquettes {path} obsolètes : relancer "
+                             f"'python nearest_hut_labels.py build'")
+        return cls(data)
+
+    def save(self, path: Path = LABELS_FILE):
+        path.parent.mkdir(exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump(self.data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Étiquettes sauvegardées dans {path}")
+
+    def lookup(self, node_id):
+        """(hut_id, distance_m) pour un node du graphe, ou (None, None)."""
+        i = bisect_left(self.node_ids, node_id)
+        if i == len(self.node_ids) or self.node_ids[i] != node_id or self.hut_of[i] < 0:
+            return None, None
+        return self.huts[self.hut_of[i]], float(self.dist_m[i])
+
+
+# -----------------------------
+# Bassins des huts
+# -----------------------------
+def catchment_stats(labels, graph):
+    """
+    Statistiques par hut sur les nodes qui lui sont rattachés.
+    La longueur de chemin d'une arête est partagée pour moitié entre les
+    huts de ses deux extrémités.
+    """
+    stats = {
+        h: {"nodes": 0, "trail_m": 0.0, "sum_m": 0.0, "max_m": 0.0}
+        for h in labels.huts
+    }
+    for i, nid in enumerate(labels.node_ids):
+        label = labels.hut_of[i]
+        if label < 0:
+            continue
+        s = stats[labels.huts[label]]
+        d = float(labels.dist_m[i])
+        s["nodes"] += 1
+        s["sum_m"] += d
+        s["max_m"] = max(s["max_m"], d)
+        # chaque arête apparaît dans les deux sens : demi-longueur par sens
+        for _, w in graph.get(nid, []):
+            s["trail_m"] += w / 2.0
+    return stats
+
+
+def write_catchments_csv(stats, hut_meta, huts_by_anchor, path: Path):
+    path.parent.mkdir(exist_ok=True)
+    shared = defaultdict(list)
+    for huts in huts_by_anchor.values():
+        for h in huts:
+            if h != min(huts):
+                shared[min(huts)].append(h)
+
+    fields = [
+        "hut_id:ID(Hut)",
+        "name",
+        "catchment_nodes:int",
+        "catchment_trail_km:float",
+        "catchment_mean_km:float",
+        "catchment_max_km:float",
+        "shared_anchor_huts",
+    ]
+    print(f"Écriture {path}")
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for hut_id in sorted(stats):
+            s = stats[hut_id]
+            n = s["nodes"]
+            writer.writerow({
+                "hut_id:ID(Hut)": hut_id,
+                "name": hut_meta.get(hut_id, {}).get("name", ""),
+                "catchment_nodes:int": n,
+                "catchment_trail_km:float": round(s["trail_m"] / 1000.0, 3),
+                "catchment_mean_km:float": round(s["sum_m"] / n / 1000.0, 3) if n else 0.0,
+                "catchment_max_km:float": round(s["max_m"] / 1000.0, 3),
+                "shared_anchor_huts": ";".join(str(h) for h in sorted(shared[hut_id])),
+            })
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Hut la plus proche (par les chemins) de chaque node du graphe."
+    )
+    parser.add_argument("command", choices=("build", "lookup"))
+    parser.add_argument("coords", nargs="*", type=float,
+                        help="lookup : latitude longitude")
+    args = parser.parse_args(argv)
+
+    state = load_build_state(BASE_DIR / STATE_FILE)
+    graph = state["graph"]
+
+    if args.command == "build":
+        huts_by_anchor = defaultdict(list)
+        for hut_id, anchor in state["anchor_by_hut"].items():
+            huts_by_anchor[anchor].append(hut_id)
+        labels = NearestHutLabels(label_nearest_huts(graph, huts_by_anchor))
+        labels.save(LABELS_FILE)
+        stats = catchment_stats(labels, graph)
+        write_catchments_csv(stats, state["hut_meta"], huts_by_anchor, CATCHMENTS_CSV)
+        return
+
+    if len(args.coords) != 2:
+        raise SystemExit("lookup attend latitude et longitude")
+    labels = NearestHutLabels.load(LABELS_FILE)
+    nodes = state["nodes"]
+    cells = state.get("cells") or build_spatial_index(nodes, graph, CELL_SIZE_DEG)
+    lat, lon = args.coords
+    start, snap_m = find_nearest_graph_node(
+        lat, lon, nodes, cells, max_radius_m=ANCHOR_RADIUS_M,
+        cell_size_deg=CELL_SIZE_DEG,
+    )
+    if start is None:
+        raise SystemExit(f"Aucun chemin à moins de {ANCHOR_RADIUS_M:.0f} m")
+    hut_id, dist_m = labels.lookup(start)
+    if hut_id is None:
+        print(f"Node {start} ({snap_m:.0f} m) : aucune hut atteignable")
+        return
+    name = state["hut_meta"].get(hut_id, {}).get("name", "?")
+    print(f"Node {start} ({snap_m:.0f} m) : {name} ({hut_id}) "
+          f"à {dist_m / 1000.0:.3f} km")
+
+
+if __name__ == "__main__":
+    main()
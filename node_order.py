@@ -0,0 +1,213 @@
+import time
+import random
+import argparse
+from array import array
+from pathlib import Path
+
+BASE_DIR = Path(".")
+
+# Ordres possibles des nodes du graphe interne ("osm" = ids OSM tels quels)
+NODE_ORDERS = ("osm", "hilbert", "zorder")
+# Résolution de la courbe : grille 2^16 x 2^16 sur l'emprise des nodes
+CURVE_BITS = 16
+
+
+# -----------------------------
+# Courbes de remplissage
+# -----------------------------
+def hilbert_index(x, y, bits=CURVE_BITS):
+    """Rang de la cellule (x, y) sur la courbe de Hilbert d'ordre bits."""
+    d = 0
+    s = 1 << (bits - 1)
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotation du quadrant
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+
+def zorder_index(x, y, bits=CURVE_BITS):
+    """Rang de la cellule (x, y) sur la courbe en Z (bits entrelacés)."""
+    d = 0
+    for b in range(bits):
+        d |= ((x >> b) & 1) << (2 * b) | ((y >> b) & 1) << (2 * b + 1)
+    return d
+
+
+CURVES = {
+    "hilbert": hilbert_index,
+    "zorder": zorder_index,
+}
+
+
+def curve_order(nodes, node_ids, curve="hilbert", bits=CURVE_BITS):
+    """
+    node_ids triés le long de la courbe (lat/lon quantifiés sur l'emprise),
+    l'id OSM départageant deux nodes de la même cellule.
+    """
+    node_ids = list(node_ids)
+    if not node_ids:
+        return []
+    index_fn = CURVES[curve]
+    lats = [nodes[nid]["lat"] for nid in node_ids]
+    lons = [nodes[nid]["lon"] for nid in node_ids]
+    lat0, lon0 = min(lats), min(lons)
+    side = (1 << bits) - 1
+    lat_scale = side / max(max(lats) - lat0, 1e-9)
+    lon_scale = side / max(max(lons) - lon0, 1e-9)
+
+    keys = {
+        nid: index_fn(int((lon - lon0) * lon_scale), int((lat - lat0) * lat_scale), bits)
+        for nid, lat, lon in zip(node_ids, lats, lons)
+    }
+    return sorted(node_ids, key=lambda nid: (keys[nid], nid))
+
+
+# -----------------------------
+# Renumérotation
+# -----------------------------
+class NodeOrder:
+    """
+    Renumérotation 0..n-1 des nodes le long d'une courbe de remplissage :
+    des nodes proches sur le terrain ont des numéros proches, donc des
+    entrées voisines dans les dicts (hash d'un int = l'int), des listes
+    d'adjacence allouées à la suite et des lignes / colonnes voisines dans
+    la matrice CSR du moteur scipy.
+
+    osm_ids : array q, numéro interne -> id OSM
+    index   : {id OSM: numéro interne}
+    """
+
+    def __init__(self, osm_ids):
+        self.osm_ids = array("q", osm_ids)
+        self.index = {nid: i for i, nid in enumerate(self.osm_ids)}
+
+    @classmethod
+    def from_graph(cls, nodes, graph, hut_ids=(), curve="hilbert"):
+        """Numérote les nodes du graphe et les huts (hors graphe comprises)."""
+        node_ids = set(graph)
+        node_ids.update(h for h in hut_ids if h in nodes)
+        return cls(curve_order(nodes, node_ids, curve))
+
+    def __len__(self):
+        return len(self.osm_ids)
+
+    def renumber_graph(self, graph):
+        """{id OSM: [(id OSM, w)]} -> {interne: [(interne, w)]}, dans l'ordre."""
+        index = self.index
+        return {
+            i: [(index[v], w) for v, w in graph[nid]]
+            for i, nid in enumerate(self.osm_ids) if nid in graph
+        }
+
+    def renumber_nodes(self, nodes):
+        """Coordonnées seules, dans l'ordre : {interne: {"lat", "lon"}}."""
+        return {
+            i: {"lat": nodes[nid]["lat"], "lon": nodes[nid]["lon"]}
+            for i, nid in enumerate(self.osm_ids)
+        }
+
+    def renumber_weights(self, weights):
+        """weights[profil][id OSM] (voir build_graph_profiles) -> numéros internes."""
+        return {
+            name: {
+                i: array("d", by_node[nid])
+                for i, nid in enumerate(self.osm_ids) if nid in by_node
+            }
+            for name, by_node in weights.items()
+        }
+
+    def osm_anchors(self, anchor_by_hut):
+        """{hut: ancrage interne} -> {hut: id OSM de l'ancrage}."""
+        return {h: self.osm_ids[a] for h, a in anchor_by_hut.items()}
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def run_bench(state, orders, sources_count, engine):
+    # imports locaux : build_cabane_graph importe ce module
+    from build_cabane_graph import compute_hut_anchors, compute_pairs_by_source
+
+    nodes, graph, hut_ids = state["nodes"], state["graph"], state["hut_ids"]
+    rng = random.Random(0)
+    anchored = sorted(state["anchor_by_hut"])
+    sources = sorted(rng.sample(anchored, min(sources_count, len(anchored))))
+
+    timings = {}
+    reference = None
+    # premier passage à blanc (imports, allocations) : on le refait ensuite
+    for name in [orders[0]] + orders:
+        t0 = time.perf_counter()
+        order = None
+        run_nodes, run_graph = nodes, graph
+        if name != "osm":
+            order = NodeOrder.from_graph(nodes, graph, hut_ids, curve=name)
+            run_nodes = order.renumber_nodes(nodes)
+            run_graph = order.renumber_graph(graph)
+        t_build = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        anchor_by_hut, huts_by_anchor = compute_hut_anchors(
+            run_nodes, run_graph, hut_ids,
+            max_radius_m=state["anchor_radius_m"], order=order,
+        )
+        t_anchor = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pairs = compute_pairs_by_source(
+            run_graph, anchor_by_hut, huts_by_anchor,
+            max_distance_km=state["max_distance_km"], sources=sources,
+            engine=engine,
+        )
+        t_dijkstra = time.perf_counter() - t0
+
+        if reference is None:
+            reference = pairs
+        elif pairs != reference:
+            raise SystemExit(f"ÉCHEC : l'ordre {name} ne donne pas les mêmes paires")
+        timings[name] = (t_build, t_anchor, t_dijkstra)
+
+    base = orders[0]
+    base_anchor, base_dijkstra = (max(t, 1e-9) for t in timings[base][1:])
+    print(f"\n{len(sources)} sources, {len(graph)} nodes, moteur {engine} "
+          f"(accélération xN par rapport à l'ordre {base}) :")
+    for name in orders:
+        t_build, t_anchor, t_dijkstra = timings[name]
+        print(f"  {name:8s} renumérotation {t_build:6.2f} s | ancrages "
+              f"{t_anchor:6.2f} s (x{base_anchor / max(t_anchor, 1e-9):.2f}) | "
+              f"Dijkstra {t_dijkstra:6.2f} s "
+              f"(x{base_dijkstra / max(t_dijkstra, 1e-9):.2f})")
+
+
+def main(argv=None):
+    # imports locaux : build_cabane_graph importe ce module
+    from build_cabane_graph import load_build_state, STATE_FILE
+    from shortest_path import ENGINES
+
+    parser = argparse.ArgumentParser(
+        description="Compare les temps d'ancrage et de Dijkstra selon l'ordre "
+                    "des nodes (ids OSM / courbe de Hilbert / courbe en Z), "
+                    "sur le graphe de cache/build_state.pickle."
+    )
+    parser.add_argument("--orders", nargs="+", choices=NODE_ORDERS,
+                        default=list(NODE_ORDERS),
+                        help="Ordres comparés, le premier sert de référence.")
+    parser.add_argument("--sources", type=int, default=200,
+                        help="Nombre de huts sources tirées au hasard (défaut: 200).")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="python")
+    args = parser.parse_args(argv)
+
+    state = load_build_state(BASE_DIR / STATE_FILE)
+    run_bench(state, list(dict.fromkeys(args.orders)), args.sources, args.engine)
+
+
+if __name__ == "__main__":
+    main()
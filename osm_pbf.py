@@ -0,0 +1,328 @@
+import re
+from pathlib import Path
+
+# -----------------------------
+# Filtres équivalents aux requêtes overpass/*.overpass
+# -----------------------------
+# bbox (sud, ouest, nord, est) commune à toutes les requêtes
+LAPLAND_BBOX = (66.56, 5.0, 72.0, 32.0)
+
+ROUTE_TYPES = ("hiking", "ski")
+
+HUT_TOURISM_NO = ("alpine_hut", "wilderness_hut", "hut", "chalet")
+LODGING_TOURISM = ("hotel", "hostel", "guest_house")
+
+_SMALL_CAPACITY = re.compile(r"^[0-4]$")
+
+
+def in_bbox(lat, lon, bbox=LAPLAND_BBOX):
+    south, west, north, east = bbox
+    return south <= lat <= north and west <= lon <= east
+
+
+def is_route_relation(tags):
+    """relation["route"~"^(hiking|ski)$"]"""
+    return tags.get("route") in ROUTE_TYPES
+
+
+def relation_touches_bbox(rel, ways, nodes, bbox=LAPLAND_BBOX):
+    """
+    Vrai si un node de la relation (membre direct ou node d'une way membre)
+    tombe dans la bbox. ways : {way_id: {"nodes": [...]}}, nodes :
+    {node_id: {"lat", "lon"}} ; les membres de position inconnue sont
+    ignorés.
+    """
+    for mem in rel["members"]:
+        if mem["type"] == "node":
+            refs = (mem["ref"],)
+        elif mem["type"] == "way" and mem["ref"] in ways:
+            refs = ways[mem["ref"]]["nodes"]
+        else:
+            continue
+        for ref in refs:
+            node = nodes.get(ref)
+            if node is not None and in_bbox(node["lat"], node["lon"], bbox):
+                return True
+    return False
+
+
+def _capacity_ok(tags):
+    # ["capacity"!~"^[0-4]$"] est vrai aussi quand la clé est absente
+    for key in ("capacity", "capacity:persons"):
+        if _SMALL_CAPACITY.search(tags.get(key, "")):
+            return False
+    return True
+
+
+def is_hut_se(tags):
+    """Reprend overpass/sweden_huts.overpass."""
+    name = tags.get("name")
+    if not name:
+        return False
+    tourism = tags.get("tourism")
+    if tourism == "alpine_hut" and name != "Abiskojåkka Fjällstuga":
+        return True
+    if re.search(r"STF Abisko Turiststation", name):
+        return True
+    if tourism in LODGING_TOURISM and re.search(r"Riksgr(a|ä)nsen", name):
+        return True
+    return False
+
+
+def is_hut_no(tags):
+    """Reprend overpass/norway_huts.overpass."""
+    name = tags.get("name")
+    if not name or name == "Katterat fjellstue":
+        return False
+    if not _capacity_ok(tags):
+        return False
+    tourism = tags.get("tourism")
+    if tourism in HUT_TOURISM_NO:
+        return True
+    if tourism in LODGING_TOURISM and re.search(r"DNT", tags.get("operator", "")):
+        return True
+    return False
+
+
+HUT_FILTERS = {
+    "SE": is_hut_se,
+    "NO": is_hut_no,
+}
+
+
+# -----------------------------
+# Lecture PBF (pyosmium)
+# -----------------------------
+def is_pbf(path: Path):
+    return Path(path).name.endswith(".pbf")
+
+
+def _import_osmium():
+    try:
+        import osmium
+    except ImportError as e:
+        raise RuntimeError(
+            "Le module 'osmium' (pyosmium >= 4.0) est nécessaire pour lire "
+            "un fichier .osm.pbf : pip install osmium"
+        ) from e
+    return osmium
+
+
+_MEMBER_TYPES = {"n": "node", "w": "way", "r": "relation"}
+
+
+def _tags(obj):
+    return {t.k: t.v for t in obj.tags}
+
+
+def _relation_element(rel):
+    return {
+        "type": "relation",
+        "id": rel.id,
+        "members": [
+            {"type": _MEMBER_TYPES[m.type], "ref": m.ref, "role": m.role}
+            for m in rel.members
+        ],
+        "tags": _tags(rel),
+    }
+
+
+def _read_ways(osmium, path, way_ids):
+    """Deuxième passe : ways demandées -> élément Overpass (avec refs)."""
+    ways = {}
+    if not way_ids:
+        return ways
+    fp = (osmium.FileProcessor(str(path), osmium.osm.WAY)
+          .with_filter(osmium.filter.IdFilter(way_ids)))
+    for w in fp:
+        ways[w.id] = {
+            "type": "way",
+            "id": w.id,
+            "nodes": [n.ref for n in w.nodes],
+            "tags": _tags(w),
+        }
+    return ways
+
+
+def _read_nodes(osmium, path, node_ids):
+    """Troisième passe : coordonnées (et tags) des nodes demandés."""
+    nodes = {}
+    if not node_ids:
+        return nodes
+    fp = (osmium.FileProcessor(str(path), osmium.osm.NODE)
+          .with_filter(osmium.filter.IdFilter(node_ids)))
+    for n in fp:
+        if not n.location.valid():
+            continue
+        el = {
+            "type": "node",
+            "id": n.id,
+            "lat": n.location.lat,
+            "lon": n.location.lon,
+        }
+        tags = _tags(n)
+        if tags:
+            el["tags"] = tags
+        nodes[n.id] = el
+    return nodes
+
+
+def read_route_elements(path: Path, bbox=LAPLAND_BBOX):
+    """
+    Équivalent local de overpass/nordics_paths_routes.overpass :
+      relations route=hiking|ski touchant la bbox, puis (._;>;)
+      (ways membres + nodes de ces ways + nodes membres).
+
+    Le fichier est lu en trois passes (relations, ways, nodes) ; pyosmium
+    décode les blocs PBF en C++ et seuls les objets retenus remontent en
+    Python. La zone "pays" des requêtes Overpass correspond à l'extrait
+    lui-même (ex. sweden-latest.osm.pbf).
+
+    Renvoie une liste d'éléments au format Overpass JSON.
+    """
+    osmium = _import_osmium()
+    print(f"Lecture PBF (routes) : {path}")
+
+    relations = []
+    fp = (osmium.FileProcessor(str(path), osmium.osm.RELATION)
+          .with_filter(osmium.filter.KeyFilter("route")))
+    for rel in fp:
+        if is_route_relation(rel.tags):
+            relations.append(_relation_element(rel))
+
+    way_ids = set()
+    member_node_ids = set()
+    for rel in relations:
+        for mem in rel["members"]:
+            if mem["type"] == "way":
+                way_ids.add(mem["ref"])
+            elif mem["type"] == "node":
+                member_node_ids.add(mem["ref"])
+
+    ways = _read_ways(osmium, path, way_ids)
+    node_ids = set(member_node_ids)
+    for way in ways.values():
+        node_ids.update(way["nodes"])
+    nodes = _read_nodes(osmium, path, node_ids)
+
+    # Filtre bbox : une relation est gardée si un de ses nodes y tombe
+    kept_relations = [
+        rel for rel in relations if relation_touches_bbox(rel, ways, nodes, bbox)
+    ]
+
+    kept_way_ids = set()
+    kept_node_ids = set()
+    for rel in kept_relations:
+        for mem in rel["members"]:
+            if mem["type"] == "way" and mem["ref"] in ways:
+                kept_way_ids.add(mem["ref"])
+                kept_node_ids.update(ways[mem["ref"]]["nodes"])
+            elif mem["type"] == "node":
+                kept_node_ids.add(mem["ref"])
+
+    elements = [nodes[nid] for nid in sorted(kept_node_ids) if nid in nodes]
+    elements += [ways[wid] for wid in sorted(kept_way_ids)]
+    elements += kept_relations
+
+    print(f"  Relations route gardées : {len(kept_relations)}")
+    print(f"  Ways membres            : {len(kept_way_ids)}")
+    print(f"  Nodes                   : {len(kept_node_ids)}")
+    return elements
+
+
+def read_hut_elements(path: Path, country_code, bbox=LAPLAND_BBOX):
+    """
+    Équivalent local de overpass/<pays>_huts.overpass ("nwr ... out center").
+
+    Les ways/relations reçoivent un "center" = centre de leur bbox, comme
+    Overpass. Le filtre bbox est appliqué sur ce centre.
+    """
+    osmium = _import_osmium()
+    hut_filter = HUT_FILTERS.get(country_code)
+    if hut_filter is None:
+        raise ValueError(f"Pas de filtre huts pour le pays {country_code!r}")
+
+    print(f"Lecture PBF (huts {country_code}) : {path}")
+
+    elements = []
+    hut_ways = {}
+    hut_relations = []
+
+    fp = (osmium.FileProcessor(str(path))
+          .with_filter(osmium.filter.KeyFilter("name")))
+    for obj in fp:
+        tags = _tags(obj)
+        if not hut_filter(tags):
+            continue
+        if obj.is_node():
+            if obj.location.valid() and in_bbox(obj.location.lat, obj.location.lon, bbox):
+                elements.append({
+                    "type": "node",
+                    "id": obj.id,
+                    "lat": obj.location.lat,
+                    "lon": obj.location.lon,
+                    "tags": tags,
+                })
+        elif obj.is_way():
+            hut_ways[obj.id] = {
+                "type": "way",
+                "id": obj.id,
+                "nodes": [n.ref for n in obj.nodes],
+                "tags": tags,
+            }
+        elif obj.is_relation():
+            hut_relations.append(_relation_element(obj))
+
+    # Ways membres des relations huts (bâtiments multipolygones)
+    member_way_ids = {
+        mem["ref"]
+        for rel in hut_relations
+        for mem in rel["members"]
+        if mem["type"] == "way" and mem["ref"] not in hut_ways
+    }
+    member_ways = _read_ways(osmium, path, member_way_ids)
+
+    node_ids = set()
+    for way in list(hut_ways.values()) + list(member_ways.values()):
+        node_ids.update(way["nodes"])
+    for rel in hut_relations:
+        node_ids.update(m["ref"] for m in rel["members"] if m["type"] == "node")
+    coords = _read_nodes(osmium, path, node_ids)
+
+    def center_of(node_refs):
+        pts = [coords[r] for r in node_refs if r in coords]
+        if not pts:
+            return None
+        lats = [p["lat"] for p in pts]
+        lons = [p["lon"] for p in pts]
+        return {
+            "lat": (min(lats) + max(lats)) / 2.0,
+            "lon": (min(lons) + max(lons)) / 2.0,
+        }
+
+    for way in hut_ways.values():
+        center = center_of(way["nodes"])
+        if center and in_bbox(center["lat"], center["lon"], bbox):
+            elements.append({
+                "type": "way", "id": way["id"],
+                "center": center, "tags": way["tags"],
+            })
+
+    for rel in hut_relations:
+        refs = []
+        for mem in rel["members"]:
+            if mem["type"] == "node":
+                refs.append(mem["ref"])
+            elif mem["type"] == "way":
+                way = hut_ways.get(mem["ref"]) or member_ways.get(mem["ref"])
+                if way:
+                    refs.extend(way["nodes"])
+        center = center_of(refs)
+        if center and in_bbox(center["lat"], center["lon"], bbox):
+            elements.append({
+                "type": "relation", "id": rel["id"],
+                "center": center, "tags": rel["tags"],
+            })
+
+    print(f"  Huts {country_code} trouvées dans le PBF : {len(elements)}")
+    return elements
@@ -0,0 +1,396 @@
+import re
+import sys
+import json
+from pathlib import Path
+from typing import Optional, Union
+
+from osm_pbf import is_pbf, read_route_elements, read_hut_elements
+
+# Tags absents (ou non lus) : un seul dict partagé, à ne pas modifier
+NO_TAGS = {}
+NO_REFS = ()
+
+# -----------------------------
+# Schémas : champs lus par type d'élément (les autres sont ignorés)
+# -----------------------------
+# Fichiers de chemins / routes : géométrie + tags des ways et relations
+ROUTE_SCHEMA = {
+    "node": ("lat", "lon"),
+    "way": ("nodes", "tags"),
+    "relation": ("members", "tags"),
+}
+# Première passe de build_tiled_graph : positions des nodes seulement
+NODE_SCHEMA = {
+    "node": ("lat", "lon"),
+    "way": (),
+    "relation": (),
+}
+# Fichiers de huts ("out center") : position + tous les tags
+HUT_SCHEMA = {
+    "node": ("lat", "lon", "tags"),
+    "way": ("center", "tags"),
+    "relation": ("center", "tags"),
+}
+
+
+# -----------------------------
+# Enregistrements typés
+# -----------------------------
+# Tous les attributs existent (valeur par défaut s'ils ne sont pas dans le
+# schéma), mais le code appelant ne lit que ceux du schéma qu'il utilise :
+# le décodeur msgspec ne crée que ceux-là.
+class OsmCenter:
+    __slots__ = ("lat", "lon")
+
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+
+    def __reduce__(self):
+        return OsmCenter, (self.lat, self.lon)
+
+
+class OsmNode:
+    __slots__ = ("id", "lat", "lon", "tags")
+
+    def __init__(self, id, lat, lon, tags=NO_TAGS):
+        self.id = id
+        self.lat = lat
+        self.lon = lon
+        self.tags = tags
+
+    def __reduce__(self):
+        return OsmNode, (self.id, self.lat, self.lon, self.tags)
+
+
+class OsmWay:
+    """center : OsmCenter des résultats "out center", sinon None."""
+
+    __slots__ = ("id", "nodes", "tags", "center")
+
+    def __init__(self, id, nodes=NO_REFS, tags=NO_TAGS, center=None):
+        self.id = id
+        self.nodes = nodes
+        self.tags = tags
+        self.center = center
+
+    def __reduce__(self):
+        return OsmWay, (self.id, self.nodes, self.tags, self.center)
+
+
+class OsmMember:
+    __slots__ = ("type", "ref")
+
+    def __init__(self, type, ref):
+        self.type = type
+        self.ref = ref
+
+    def __reduce__(self):
+        return OsmMember, (self.type, self.ref)
+
+
+class OsmRelation:
+    __slots__ = ("id", "members", "tags", "center")
+
+    def __init__(self, id, members=NO_REFS, tags=NO_TAGS, center=None):
+        self.id = id
+        self.members = members
+        self.tags = tags
+        self.center = center
+
+    def __reduce__(self):
+        return OsmRelation, (self.id, self.members, self.tags, self.center)
+
+
+class OsmData:
+    """Éléments d'un fichier, par type, dans l'ordre du fichier."""
+
+    __slots__ = ("nodes", "ways", "relations")
+
+    def __init__(self, nodes=None, ways=None, relations=None):
+        self.nodes = [] if nodes is None else nodes
+        self.ways = [] if ways is None else ways
+        self.relations = [] if relations is None else relations
+
+    def __len__(self):
+        return len(self.nodes) + len(self.ways) + len(self.relations)
+
+
+# -----------------------------
+# Décodage (bibliothèque standard)
+# -----------------------------
+def _tags(raw):
+    """Clés internées : partagées entre fichiers et avec les littéraux du code."""
+    if not raw:
+        return NO_TAGS
+    intern = sys.intern
+    return {intern(k): v for k, v in raw.items()}
+
+
+def _center(raw):
+    if not raw:
+        return None
+    lat = raw.get("lat")
+    lon = raw.get("lon")
+    if lat is None or lon is None:
+        return None
+    return OsmCenter(lat, lon)
+
+
+def element_hook(schema):
+    """
+    object_hook de json : chaque objet élément / membre est remplacé par
+    son enregistrement dès qu'il est décodé (le JSON n'est jamais gardé
+    entier sous forme de dicts). Les objets tags / center sont laissés en
+    dict, l'élément qui les contient les convertit.
+
+    Un élément se reconnaît à son "id" entier, un membre à son "ref" entier
+    (les valeurs des tags sont toujours des chaînes).
+    """
+    node_tags = "tags" in schema["node"]
+    way_nodes = "nodes" in schema["way"]
+    way_tags = "tags" in schema["way"]
+    way_center = "center" in schema["way"]
+    rel_members = "members" in schema["relation"]
+    rel_tags = "tags" in schema["relation"]
+    rel_center = "center" in schema["relation"]
+    member_types = {t: sys.intern(t) for t in ("node", "way", "relation")}
+
+    def hook(d):
+        eid = d.get("id")
+        if type(eid) is int:
+            etype = d.get("type")
+            if etype == "node":
+                lat = d.get("lat")
+                lon = d.get("lon")
+                if lat is None or lon is None:
+                    return d
+                return OsmNode(eid, lat, lon,
+                               _tags(d.get("tags")) if node_tags else NO_TAGS)
+            if etype == "way":
+                return OsmWay(
+                    eid,
+                    d.get("nodes") or NO_REFS if way_nodes else NO_REFS,
+                    _tags(d.get("tags")) if way_tags else NO_TAGS,
+                    _center(d.get("center")) if way_center else None,
+                )
+            if etype == "relation":
+                return OsmRelation(
+                    eid,
+                    d.get("members") or NO_REFS if rel_members else NO_REFS,
+                    _tags(d.get("tags")) if rel_tags else NO_TAGS,
+                    _center(d.get("center")) if rel_center else None,
+                )
+            return d
+        ref = d.get("ref")
+        if type(ref) is int and "type" in d:
+            mtype = d["type"]
+            return OsmMember(member_types.get(mtype, mtype), ref)
+        return d
+
+    return hook
+
+
+def _split(elements):
+    data = OsmData()
+    for el in elements:
+        t = type(el)
+        if t is OsmNode:
+            data.nodes.append(el)
+        elif t is OsmWay:
+            data.ways.append(el)
+        elif t is OsmRelation:
+            data.relations.append(el)
+    return data
+
+
+def _element_record(hook, el):
+    """Élément en dict (lecture PBF) -> enregistrement, membres compris."""
+    members = el.get("members")
+    if members:
+        el = dict(el, members=[hook(m) for m in members])
+    return hook(el)
+
+
+def records_from_elements(elements, schema=ROUTE_SCHEMA):
+    """Éléments déjà en dicts (lecture PBF, voir osm_pbf) -> OsmData."""
+    hook = element_hook(schema)
+    return _split([_element_record(hook, el) for el in elements])
+
+
+# -----------------------------
+# Lecture en flux (bibliothèque standard)
+# -----------------------------
+STREAM_CHUNK = 1 << 20  # caractères lus à la fois
+_ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+_RECORD_TYPES = (OsmNode, OsmWay, OsmRelation)
+
+
+def iter_overpass_file(path: Path, schema=ROUTE_SCHEMA, chunk_size=STREAM_CHUNK):
+    """
+    Éléments d'un JSON Overpass un par un (OsmNode / OsmWay / OsmRelation,
+    dans l'ordre du fichier). Le fichier est lu par blocs et chaque élément
+    décodé dès qu'il est complet : la mémoire ne dépend pas de la taille
+    du fichier.
+    """
+    decoder = json.JSONDecoder(object_hook=element_hook(schema))
+    with Path(path).open(encoding="utf-8") as f:
+        buf = ""
+        eof = False
+        # Début du tableau "elements" (après version, osm3s...)
+        while True:
+            m = _ELEMENTS_START.search(buf)
+            if m:
+                pos = m.end()
+                break
+            if eof:
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                if buf[pos] == "]":
+                    return
+                try:
+                    el, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # élément coupé en fin de bloc : on relit la suite
+                    if eof:
+                        raise
+                else:
+                    if type(el) in _RECORD_TYPES:
+                        yield el
+                    continue
+            if eof:
+                raise ValueError(f"{path} : tableau \"elements\" non terminé")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+# -----------------------------
+# Décodage msgspec (optionnel : pip install msgspec)
+# -----------------------------
+_MSGSPEC_DECODERS = {}
+
+
+def _msgspec_decoder(schema):
+    """
+    Décodeur msgspec construit depuis le schéma : une Struct (à slots) par
+    type d'élément, avec seulement les champs du schéma ; les autres champs
+    du JSON ne sont pas décodés. None si msgspec n'est pas installé.
+    """
+    key = tuple(sorted((etype, tuple(fields)) for etype, fields in schema.items()))
+    if key in _MSGSPEC_DECODERS:
+        return _MSGSPEC_DECODERS[key]
+    try:
+        import msgspec
+    except ImportError:
+        _MSGSPEC_DECODERS[key] = None
+        return None
+
+    center_type = msgspec.defstruct("Center", [("lat", float), ("lon", float)])
+    member_type = msgspec.defstruct("Member", [("type", str), ("ref", int)])
+    field_types = {
+        "lat": (Optional[float], None),
+        "lon": (Optional[float], None),
+        "tags": (dict[str, str], {}),
+        "nodes": (list[int], []),
+        "members": (list[member_type], []),
+        "center": (Optional[center_type], None),
+    }
+    element_types = []
+    for etype, fields in schema.items():
+        element_types.append(msgspec.defstruct(
+            f"Overpass{etype.capitalize()}",
+            [("id", int)] + [(name, *field_types[name]) for name in fields],
+            tag_field="type", tag=etype,
+        ))
+    document = msgspec.defstruct(
+        "OverpassDocument", [("elements", list[Union[tuple(element_types)]], [])]
+    )
+    decoder = (msgspec.json.Decoder(document), msgspec.ValidationError,
+               {t.__struct_config__.tag: t for t in element_types})
+    _MSGSPEC_DECODERS[key] = decoder
+    return decoder
+
+
+def _split_structs(elements, struct_by_tag):
+    """Comme _split pour les Structs msgspec ; clés de tags internées."""
+    node_t = struct_by_tag["node"]
+    way_t = struct_by_tag["way"]
+    rel_t = struct_by_tag["relation"]
+    data = OsmData()
+    for el in elements:
+        t = type(el)
+        if t is node_t:
+            if el.lat is not None and el.lon is not None:
+                data.nodes.append(el)
+            continue
+        if hasattr(el, "tags"):
+            el.tags = _tags(el.tags)
+        if t is way_t:
+            data.ways.append(el)
+        elif t is rel_t:
+            data.relations.append(el)
+    return data
+
+
+def decode_overpass(raw, schema=ROUTE_SCHEMA):
+    """
+    JSON Overpass (bytes ou str) -> OsmData. Avec msgspec, décodage direct
+    dans des Structs générées depuis le schéma ; sinon json + element_hook.
+    Les deux donnent les mêmes attributs pour les champs du schéma.
+    """
+    decoder = _msgspec_decoder(schema)
+    if decoder is not None:
+        json_decoder, validation_error, struct_by_tag = decoder
+        try:
+            document = json_decoder.decode(raw)
+        except validation_error:
+            # type d'élément inattendu (area, count...) : décodeur générique
+            pass
+        else:
+            return _split_structs(document.elements, struct_by_tag)
+
+    decoded = json.loads(raw, object_hook=element_hook(schema))
+    return _split(decoded.get("elements", []) if isinstance(decoded, dict) else [])
+
+
+# -----------------------------
+# Point d'entrée commun JSON / PBF
+# -----------------------------
+def load_route_records(path: Path):
+    """Chemins / routes depuis un JSON Overpass ou un extrait .osm.pbf."""
+    if is_pbf(path):
+        return records_from_elements(read_route_elements(path), ROUTE_SCHEMA)
+    return decode_overpass(Path(path).read_text(encoding="utf-8"), ROUTE_SCHEMA)
+
+
+def iter_route_records(path: Path, schema=ROUTE_SCHEMA):
+    """
+    Comme load_route_records, élément par élément. Pour un .osm.pbf, la
+    sélection des relations route (osm_pbf.read_route_elements) se fait
+    d'abord sur tout l'extrait ; les enregistrements sont créés au fil de
+    l'eau.
+    """
+    if is_pbf(path):
+        hook = element_hook(schema)
+        for el in read_route_elements(path):
+            el = _element_record(hook, el)
+            if type(el) in _RECORD_TYPES:
+                yield el
+        return
+    yield from iter_overpass_file(path, schema)
+
+
+def load_hut_records(path: Path, country_code):
+    """Huts depuis un JSON Overpass ou un extrait .osm.pbf."""
+    if is_pbf(path):
+        return records_from_elements(read_hut_elements(path, country_code), HUT_SCHEMA)
+    return decode_overpass(Path(path).read_text(encoding="utf-8"), HUT_SCHEMA)
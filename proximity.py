@@ -0,0 +1,71 @@
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_M = 6_371_000.0
+M_PER_DEG = math.pi * EARTH_RADIUS_M / 180.0
+
+# Cellule elle-même + 4 voisines "en avant" : chaque paire vue une fois
+_FORWARD = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+# -----------------------------
+# Jointure spatiale
+# -----------------------------
+def local_distance_m(lat1, lon1, lat2, lon2):
+    """Distance plane (équirectangulaire autour de lat1), suffisante sous ~1 km."""
+    dy = (lat2 - lat1) * M_PER_DEG
+    dx = (lon2 - lon1) * M_PER_DEG * math.cos(math.radians(lat1))
+    return math.hypot(dx, dy)
+
+
+def grid_pairs(points, radius_m):
+    """
+    Itère (a, b, distance_m) pour les points à moins de radius_m, via une
+    grille de cellules de radius_m de côté : chaque point n'est comparé
+    qu'aux points des cellules voisines, et chaque paire n'est vue qu'une
+    fois (a avant b dans l'ordre d'itération de points).
+
+    points : {clé: (lat, lon)} ; l'ordre du dict fixe l'ordre des paires.
+    """
+    if not points:
+        return
+    max_lat = max(abs(lat) for lat, _ in points.values())
+    cell_lat = radius_m / M_PER_DEG
+    cell_lon = radius_m / (M_PER_DEG * math.cos(math.radians(min(max_lat, 89.0))))
+
+    cells = defaultdict(list)
+    for key, (lat, lon) in points.items():
+        cells[(int(lat // cell_lat), int(lon // cell_lon))].append(key)
+
+    for (i, j), cell_keys in cells.items():
+        for di, dj in _FORWARD:
+            other = cells.get((i + di, j + dj))
+            if not other:
+                continue
+            same_cell = di == 0 and dj == 0
+            for k, a in enumerate(cell_keys):
+                lat1, lon1 = points[a]
+                for b in (other[k + 1:] if same_cell else other):
+                    lat2, lon2 = points[b]
+                    d = local_distance_m(lat1, lon1, lat2, lon2)
+                    if d <= radius_m:
+                        yield a, b, d
+
+
+# -----------------------------
+# Union-find
+# -----------------------------
+def find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def union(parent, a, b):
+    ra, rb = find(parent, a), find(parent, b)
+    if ra != rb:
+        # la plus petite clé devient la racine (id de cluster stable)
+        if rb < ra:
+            ra, rb = rb, ra
+        parent[rb] = ra
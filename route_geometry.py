@@ -0,0 +1,395 @@
+import math
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from collections import defaultdict
+
+BASE_DIR = Path(__file__).resolve().parent
+GEOMETRY_FILE = BASE_DIR / "neo4j_routes" / "routes_geometry.bin"
+
+EARTH_RADIUS_M = 6_371_000.0
+
+# Niveaux de simplification Douglas-Peucker (tolérance en mètres)
+SIMPLIFY_TIERS_M = (5.0, 25.0, 100.0)
+
+# Fichier binaire little-endian, tout aligné sur 8 octets :
+#   en-tête    : magic, nb routes, nb parties, nb points
+#   routes     : id, 1re partie, nb parties, bbox (4 x f64), longueur,
+#                écart max à la géométrie complète (0 si non simplifiée)
+#   parties    : offsets des points (nb parties + 1, u64)
+#   points     : lat, lon (f64) à la suite
+MAGIC = b"RGEO0002"
+HEADER = struct.Struct("<8sQQQ")
+ROUTE = struct.Struct("<qII6d")
+
+
+def point_segment_distance_m(lat, lon, lat1, lon1, lat2, lon2):
+    """
+    Distance d'un point (lat, lon) à un segment [ (lat1,lon1) - (lat2,lon2) ] en mètres.
+    Approximation equirectangulaire suffisante à cette échelle.
+    """
+    # conversion en radians
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    # latitude moyenne pour corriger la convergence des méridiens
+    lat0_rad = (lat1_rad + lat2_rad) / 2.0
+
+    # origine au point 1
+    x1, y1 = 0.0, 0.0
+    x2 = (lon2_rad - lon1_rad) * math.cos(lat0_rad) * EARTH_RADIUS_M
+    y2 = (lat2_rad - lat1_rad) * EARTH_RADIUS_M
+    xp = (lon_rad - lon1_rad) * math.cos(lat0_rad) * EARTH_RADIUS_M
+    yp = (lat_rad - lat1_rad) * EARTH_RADIUS_M
+
+    dx = x2 - x1
+    dy = y2 - y1
+    seg_len2 = dx * dx + dy * dy
+
+    if seg_len2 == 0.0:
+        # segment dégénéré : distance au point 1
+        return math.hypot(xp - x1, yp - y1)
+
+    # projection du point sur la droite paramétrée par t
+    t = ((xp - x1) * dx + (yp - y1) * dy) / seg_len2
+
+    if t <= 0.0:
+        xn, yn = x1, y1
+    elif t >= 1.0:
+        xn, yn = x2, y2
+    else:
+        xn = x1 + t * dx
+        yn = y1 + t * dy
+
+    return math.hypot(xp - xn, yp - yn)
+
+
+def min_distance_to_parts(lat, lon, parts):
+    """Distance minimale (m) du point aux parties [lat0, lon0, ...], ou None."""
+    min_dist = None
+    for part in parts:
+        for i in range(0, len(part) - 2, 2):
+            d = point_segment_distance_m(
+                lat, lon, part[i], part[i + 1], part[i + 2], part[i + 3]
+            )
+            if min_dist is None or d < min_dist:
+                min_dist = d
+    return min_dist
+
+
+# -----------------------------
+# Assemblage des ways en lignes
+# -----------------------------
+def stitch_ways(way_node_lists):
+    """
+    Assemble les ways d'une relation en lignes ordonnées : on prolonge la
+    ligne courante par une way qui partage une extrémité (retournée si
+    besoin), sinon on commence une nouvelle ligne.
+    Renvoie [[node_ids], ...] ; chaque segment de way apparaît une fois.
+    """
+    ways = [list(nids) for nids in way_node_lists if len(nids) >= 2]
+    by_end = defaultdict(set)
+    for i, nids in enumerate(ways):
+        by_end[nids[0]].add(i)
+        by_end[nids[-1]].add(i)
+    remaining = set(range(len(ways)))
+
+    def take(node):
+        for i in sorted(by_end.get(node, ())):
+            if i in remaining:
+                remaining.discard(i)
+                by_end[ways[i][0]].discard(i)
+                by_end[ways[i][-1]].discard(i)
+                return ways[i] if ways[i][0] == node else ways[i][::-1]
+        return None
+
+    lines = []
+    for first in range(len(ways)):
+        if first not in remaining:
+            continue
+        remaining.discard(first)
+        by_end[ways[first][0]].discard(first)
+        by_end[ways[first][-1]].discard(first)
+        line = list(ways[first])
+        # prolongement côté fin puis côté début
+        while True:
+            nxt = take(line[-1])
+            if nxt is None:
+                break
+            line.extend(nxt[1:])
+        while True:
+            prev = take(line[0])
+            if prev is None:
+                break
+            # prev part de line[0] : on le retourne pour finir sur line[0]
+            line[:0] = prev[:0:-1]
+        lines.append(line)
+    return lines
+
+
+def lines_to_parts(lines, nodes_by_id):
+    """
+    Node_ids -> parties de coordonnées [(lats, lons)] ; une ligne est coupée
+    là où un node manque (comme les segments ignorés par ailleurs).
+    """
+    parts = []
+    for line in lines:
+        lats, lons = [], []
+        for nid in line:
+            p = nodes_by_id.get(nid)
+            if p is None:
+                if len(lats) >= 2:
+                    parts.append((lats, lons))
+                lats, lons = [], []
+                continue
+            lats.append(p[0])
+            lons.append(p[1])
+        if len(lats) >= 2:
+            parts.append((lats, lons))
+    return parts
+
+
+def flatten_parts(parts):
+    """[(lats, lons)] -> [array('d', [lat0, lon0, lat1, lon1, ...])]"""
+    flat = []
+    for lats, lons in parts:
+        coords = array("d")
+        for lat, lon in zip(lats, lons):
+            coords.append(lat)
+            coords.append(lon)
+        flat.append(coords)
+    return flat
+
+
+# -----------------------------
+# Simplification (Douglas-Peucker)
+# -----------------------------
+def douglas_peucker(part, tolerance_m):
+    """
+    Simplifie une partie [lat0, lon0, ...] à tolerance_m près, en mesurant
+    les écarts avec point_segment_distance_m (la distance de la jointure).
+    Renvoie (array simplifiée, écart max des points retirés en m).
+
+    Tout point de la ligne d'origine est à moins de cet écart de la ligne
+    simplifiée (la distance à un segment est convexe le long d'un segment).
+    """
+    n = len(part) // 2
+    if n <= 2:
+        return array("d", part), 0.0
+    keep = [False] * n
+    keep[0] = keep[n - 1] = True
+    max_error = 0.0
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        lat1, lon1 = part[2 * i], part[2 * i + 1]
+        lat2, lon2 = part[2 * j], part[2 * j + 1]
+        worst, worst_d = -1, -1.0
+        for k in range(i + 1, j):
+            d = point_segment_distance_m(
+                part[2 * k], part[2 * k + 1], lat1, lon1, lat2, lon2
+            )
+            if d > worst_d:
+                worst, worst_d = k, d
+        if worst < 0:
+            continue
+        if worst_d > tolerance_m:
+            keep[worst] = True
+            stack.append((i, worst))
+            stack.append((worst, j))
+        elif worst_d > max_error:
+            max_error = worst_d
+
+    simplified = array("d")
+    for k in range(n):
+        if keep[k]:
+            simplified.append(part[2 * k])
+            simplified.append(part[2 * k + 1])
+    return simplified, max_error
+
+
+def simplify_parts(parts, tolerance_m):
+    """Parties simplifiées et écart max sur l'ensemble de la géométrie."""
+    out = []
+    max_error = 0.0
+    for part in parts:
+        simplified, err = douglas_peucker(part, tolerance_m)
+        out.append(simplified)
+        max_error = max(max_error, err)
+    return out, max_error
+
+
+def tier_path(path: Path, tolerance_m):
+    """routes_geometry.bin -> routes_geometry_25m.bin"""
+    return path.with_name(f"{path.stem}_{tolerance_m:g}m{path.suffix}")
+
+
+# -----------------------------
+# Métriques
+# -----------------------------
+def polyline_length_m(lats, lons):
+    """Longueur haversine d'une polyligne (vectorisée avec numpy si présent)."""
+    if len(lats) < 2:
+        return 0.0
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is None:
+        total = 0.0
+        for i in range(len(lats) - 1):
+            phi1 = math.radians(lats[i])
+            phi2 = math.radians(lats[i + 1])
+            dphi = phi2 - phi1
+            dlambda = math.radians(lons[i + 1] - lons[i])
+            a = (math.sin(dphi / 2) ** 2
+                 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2)
+            total += 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        return EARTH_RADIUS_M * total
+
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lons, dtype=np.float64))
+    dphi = np.diff(phi)
+    dlambda = np.diff(lam)
+    a = (np.sin(dphi / 2) ** 2
+         + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(dlambda / 2) ** 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return float(EARTH_RADIUS_M * c.sum())
+
+
+def route_metrics(parts):
+    """Longueur (m), bbox (min_lat, min_lon, max_lat, max_lon) et comptes."""
+    if not parts:
+        return {"length_m": 0.0, "bbox": None, "parts": 0, "segments": 0}
+    return {
+        "length_m": sum(polyline_length_m(lats, lons) for lats, lons in parts),
+        "bbox": (
+            min(min(lats) for lats, _ in parts),
+            min(min(lons) for _, lons in parts),
+            max(max(lats) for lats, _ in parts),
+            max(max(lons) for _, lons in parts),
+        ),
+        "parts": len(parts),
+        "segments": sum(len(lats) - 1 for lats, _ in parts),
+    }
+
+
+# -----------------------------
+# Fichier de géométrie
+# -----------------------------
+def geometry_record(flat_parts, bbox, length_m, max_error_m=0.0):
+    return {
+        "parts": flat_parts,
+        "bbox": bbox,
+        "length_m": length_m,
+        "max_error_m": max_error_m,
+    }
+
+
+def write_geometry_file(geometries, path: Path = GEOMETRY_FILE):
+    """
+    geometries : {id: geometry_record(...)} -> fichier binaire compact
+    (voir MAGIC), lisible par RouteGeometry via mmap.
+    """
+    path.parent.mkdir(exist_ok=True)
+    ids = sorted(geometries)
+    offsets = array("Q", [0])
+    coords = array("d")
+    table = bytearray()
+    for key in ids:
+        geom = geometries[key]
+        first_part = len(offsets) - 1
+        for flat in geom["parts"]:
+            coords.extend(flat)
+            offsets.append(len(coords) // 2)
+        bbox = geom["bbox"] or (math.nan,) * 4
+        table += ROUTE.pack(key, first_part, len(geom["parts"]), *bbox,
+                            geom["length_m"], geom["max_error_m"])
+
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids), len(offsets) - 1,
+                            len(coords) // 2))
+        f.write(table)
+        f.write(offsets.tobytes())
+        f.write(coords.tobytes())
+    tmp.replace(path)
+    print(f"Géométrie de {len(ids)} éléments ({len(coords) // 2} points) "
+          f"écrite dans {path}")
+
+
+def write_geometry_tiers(geometries, path: Path = GEOMETRY_FILE,
+                         tiers_m=SIMPLIFY_TIERS_M):
+    """
+    Écrit la géométrie complète puis une version simplifiée par tolérance
+    (tier_path), avec l'écart max mesuré pour chaque élément.
+    Renvoie {tolérance: {id: écart max}}.
+    """
+    write_geometry_file(geometries, path)
+    errors = {}
+    for tol in tiers_m:
+        tier = {}
+        for key, geom in geometries.items():
+            parts, err = simplify_parts(geom["parts"], tol)
+            tier[key] = geometry_record(parts, geom["bbox"], geom["length_m"], err)
+        write_geometry_file(tier, tier_path(path, tol))
+        errors[tol] = {key: g["max_error_m"] for key, g in tier.items()}
+    return errors
+
+
+class RouteGeometry:
+    """Lecture en mmap du fichier écrit par write_geometry_file."""
+
+    def __init__(self, path: Path = GEOMETRY_FILE):
+        self._file = path.open("rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_routes, n_parts, n_points = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} n'est pas un fichier de géométrie de routes")
+
+        pos = HEADER.size
+        self.routes = {}
+        for k in range(n_routes):
+            route_id, first, count, *bbox, length_m, max_error_m = ROUTE.unpack_from(
+                self._mm, pos + k * ROUTE.size
+            )
+            self.routes[route_id] = (first, count, tuple(bbox), length_m, max_error_m)
+        pos += n_routes * ROUTE.size
+
+        view = memoryview(self._mm)
+        self._offsets = view[pos:pos + (n_parts + 1) * 8].cast("Q")
+        pos += (n_parts + 1) * 8
+        self._coords = view[pos:pos + n_points * 16].cast("d")
+
+    def __contains__(self, route_id):
+        return route_id in self.routes
+
+    def bbox(self, route_id):
+        return self.routes[route_id][2]
+
+    def length_m(self, route_id):
+        return self.routes[route_id][3]
+
+    def max_error_m(self, route_id):
+        """Écart max à la géométrie complète (niveaux simplifiés)."""
+        return self.routes[route_id][4]
+
+    def parts(self, route_id):
+        """Parties de la route : vues [lat0, lon0, lat1, lon1, ...] sans copie."""
+        first, count = self.routes[route_id][:2]
+        return [
+            self._coords[2 * self._offsets[i]:2 * self._offsets[i + 1]]
+            for i in range(first, first + count)
+        ]
+
+    def close(self):
+        self._coords.release()
+        self._offsets.release()
+        self._mm.close()
+        self._file.close()
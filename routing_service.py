@@ -0,0 +1,395 @@
+import json
+import time
+import math
+import argparse
+import threading
+import traceback
+from pathlib import Path
+from collections import defaultdict, deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from build_cabane_graph import (
+    load_excluded_hut_ids,
+    load_inputs,
+    build_graph,
+    build_spatial_index,
+    compute_hut_anchors,
+    find_nearest_graph_node,
+    parse_pbf_sources,
+    load_build_state,
+    STATE_FILE,
+    MAX_DISTANCE_KM,
+    ANCHOR_RADIUS_M,
+)
+from shortest_path import shortest_path_between, nodes_within
+from contraction_hierarchy import ContractionHierarchy, CH_FILE
+from nearest_hut_labels import NearestHutLabels, LABELS_FILE
+
+BASE_DIR = Path(".")
+CELL_SIZE_DEG = 0.05
+LATENCY_WINDOW = 1024
+
+
+# -----------------------------
+# Routage en mémoire
+# -----------------------------
+class TrailRouter:
+    """
+    Graphe des chemins + ancrages des huts, chargés une fois et partagés
+    (en lecture seule) entre les threads du serveur.
+    """
+
+    def __init__(self, nodes, graph, hut_ids, hut_meta, anchor_by_hut, ch=None,
+                 labels=None):
+        self.nodes = nodes
+        self.graph = graph
+        self.hut_ids = set(hut_ids)
+        self.hut_meta = hut_meta
+        self.anchor_by_hut = anchor_by_hut
+        self.huts_by_anchor = defaultdict(list)
+        for hut_id, anchor in anchor_by_hut.items():
+            self.huts_by_anchor[anchor].append(hut_id)
+        self.anchors = frozenset(self.huts_by_anchor)
+        self.cells = build_spatial_index(nodes, graph, cell_size_deg=CELL_SIZE_DEG)
+
+        self.hut_by_name = {}
+        for hut_id in sorted(self.hut_ids):
+            name = hut_meta.get(hut_id, {}).get("name")
+            if name:
+                self.hut_by_name.setdefault(name, hut_id)
+
+        # Contraction hierarchy optionnelle pour les requêtes sans blocage
+        self.ch = ch
+        # Étiquettes "hut la plus proche" optionnelles pour /nearest
+        self.labels = labels
+        self._route = lru_cache(maxsize=4096)(self._route_uncached)
+
+    # --- huts
+    def resolve_hut(self, ref):
+        """Hut par osm_id ou par nom exact. KeyError si inconnue."""
+        if ref is None or ref == "":
+            raise ValueError("hut manquante")
+        try:
+            hut_id = int(ref)
+        except ValueError:
+            hut_id = self.hut_by_name.get(ref)
+        if hut_id is None or hut_id not in self.hut_ids:
+            raise KeyError(f"hut inconnue: {ref}")
+        return hut_id
+
+    def hut_summary(self, hut_id):
+        node = self.nodes[hut_id]
+        meta = self.hut_meta.get(hut_id, {})
+        return {
+            "osm_id": hut_id,
+            "name": meta.get("name", ""),
+            "country_code": meta.get("country_code", ""),
+            "lat": node["lat"],
+            "lon": node["lon"],
+            "anchor": self.anchor_by_hut.get(hut_id),
+        }
+
+    def anchor_of(self, hut_id):
+        anchor = self.anchor_by_hut.get(hut_id)
+        if anchor is None:
+            raise KeyError(f"hut {hut_id} sans ancrage sur le graphe des chemins")
+        return anchor
+
+    # --- requêtes
+    def _route_uncached(self, anchor_a, anchor_b, blocking, max_distance_m):
+        if self.ch is not None and not blocking:
+            dist_m, path = self.ch.query(anchor_a, anchor_b)
+            if dist_m is None or dist_m > max_distance_m:
+                return None, None
+            return dist_m, path
+        blocked = self.anchors if blocking else None
+        return shortest_path_between(
+            self.graph, anchor_a, anchor_b,
+            blocked=blocked, max_distance_m=max_distance_m,
+        )
+
+    def route(self, hut_a, hut_b, blocking=False, max_km=None):
+        max_distance_m = math.inf if max_km is None else max_km * 1000.0
+        anchor_a = self.anchor_of(hut_a)
+        anchor_b = self.anchor_of(hut_b)
+        return self._route(anchor_a, anchor_b, blocking, max_distance_m)
+
+    def distance(self, hut_a, hut_b, blocking=False, max_km=None):
+        dist_m, path = self.route(hut_a, hut_b, blocking, max_km)
+        return {
+            "from": self.hut_summary(hut_a),
+            "to": self.hut_summary(hut_b),
+            "distance_km": None if dist_m is None else dist_m / 1000.0,
+            "path_nodes": None if path is None else len(path),
+        }
+
+    def path(self, hut_a, hut_b, blocking=False, max_km=None):
+        result = self.distance(hut_a, hut_b, blocking, max_km)
+        _, path = self.route(hut_a, hut_b, blocking, max_km)
+        result["nodes"] = path
+        result["coordinates"] = None if path is None else [
+            [self.nodes[n]["lat"], self.nodes[n]["lon"]] for n in path
+        ]
+        return result
+
+    def nearest_hut(self, lat, lon, max_km=MAX_DISTANCE_KM,
+                    snap_radius_m=ANCHOR_RADIUS_M):
+        """Hut la plus proche par les chemins depuis un point quelconque."""
+        start, snap_m = find_nearest_graph_node(
+            lat, lon, self.nodes, self.cells,
+            max_radius_m=snap_radius_m, cell_size_deg=CELL_SIZE_DEG,
+        )
+        if start is None:
+            return {"snapped_node": None, "hut": None,
+                    "error": f"aucun chemin à moins de {snap_radius_m:.0f} m"}
+
+        if self.labels is not None:
+            hut_id, d = self.labels.lookup(start)
+            hut = None
+            if hut_id is not None and d <= max_km * 1000.0:
+                hut = dict(self.hut_summary(hut_id), distance_km=d / 1000.0)
+            return {"snapped_node": start, "snap_distance_m": snap_m, "hut": hut}
+
+        reached = nodes_within(self.graph, start, max_km * 1000.0,
+                               blocked=self.anchors)
+        best = None
+        for anchor in self.anchors:
+            d = reached.get(anchor)
+            if d is not None and (best is None or d < best[0]):
+                best = (d, anchor)
+        hut = None
+        if best is not None:
+            hut_id = min(self.huts_by_anchor[best[1]])
+            hut = dict(self.hut_summary(hut_id), distance_km=best[0] / 1000.0)
+        return {"snapped_node": start, "snap_distance_m": snap_m, "hut": hut}
+
+    def neighbors(self, hut_id, km, blocking=False):
+        """Huts à moins de km par les chemins, triées par distance."""
+        anchor = self.anchor_of(hut_id)
+        blocked = self.anchors if blocking else None
+        reached = nodes_within(self.graph, anchor, km * 1000.0, blocked=blocked)
+        out = []
+        for other_anchor in self.anchors:
+            d = reached.get(other_anchor)
+            if d is None:
+                continue
+            for other in self.huts_by_anchor[other_anchor]:
+                if other != hut_id:
+                    out.append(dict(self.hut_summary(other), distance_km=d / 1000.0))
+        out.sort(key=lambda h: (h["distance_km"], h["osm_id"]))
+        return {"hut": self.hut_summary(hut_id), "km": km, "neighbors": out}
+
+
+# -----------------------------
+# Métriques de latence
+# -----------------------------
+class LatencyMetrics:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok=True):
+        with self.lock:
+            self.samples[endpoint].append(seconds * 1000.0)
+            self.counts[endpoint] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def snapshot(self):
+        with self.lock:
+            out = {}
+            for endpoint, samples in self.samples.items():
+                values = sorted(samples)
+                n = len(values)
+
+                def pct(p):
+                    return values[min(n - 1, int(p * n))]
+
+                out[endpoint] = {
+                    "count": self.counts[endpoint],
+                    "errors": self.errors[endpoint],
+                    "mean_ms": sum(values) / n,
+                    "p50_ms": pct(0.50),
+                    "p95_ms": pct(0.95),
+                    "p99_ms": pct(0.99),
+                    "max_ms": values[-1],
+                }
+            return out
+
+
+# -----------------------------
+# Serveur HTTP/JSON
+# -----------------------------
+def _param(query, name, cast=str, default=None):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise ValueError(f"paramètre manquant: {name}")
+        return default
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise ValueError(f"paramètre invalide: {name}={values[0]!r}") from None
+
+
+def _flag(query, name):
+    return _param(query, name, str, "0").lower() in ("1", "true", "yes", "oui")
+
+
+def _max_km(query):
+    return _param(query, "max_km", float) if "max_km" in query else None
+
+
+def make_handler(router, metrics):
+    def distance(q):
+        return router.distance(
+            router.resolve_hut(_param(q, "from")), router.resolve_hut(_param(q, "to")),
+            blocking=_flag(q, "blocking"), max_km=_max_km(q),
+        )
+
+    def path(q):
+        return router.path(
+            router.resolve_hut(_param(q, "from")), router.resolve_hut(_param(q, "to")),
+            blocking=_flag(q, "blocking"), max_km=_max_km(q),
+        )
+
+    def nearest(q):
+        return router.nearest_hut(
+            _param(q, "lat", float), _param(q, "lon", float),
+            max_km=_param(q, "max_km", float, MAX_DISTANCE_KM),
+        )
+
+    def neighbors(q):
+        return router.neighbors(
+            router.resolve_hut(_param(q, "hut")), _param(q, "km", float),
+            blocking=_flag(q, "blocking"),
+        )
+
+    routes = {
+        "/distance": distance,
+        "/path": path,
+        "/nearest": nearest,
+        "/neighbors": neighbors,
+        "/metrics": lambda q: metrics.snapshot(),
+    }
+
+    class RoutingHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            handler = routes.get(url.path)
+            status = 200
+            try:
+                if handler is None:
+                    status, body = 404, {"error": f"inconnu: {url.path}",
+                                         "endpoints": sorted(routes)}
+                else:
+                    try:
+                        body = handler(parse_qs(url.query))
+                    except KeyError as e:
+                        status, body = 404, {"error": e.args[0]}
+                    except ValueError as e:
+                        status, body = 400, {"error": str(e)}
+                    except Exception as e:
+                        # Erreur inattendue : réponse JSON 500 plutôt qu'une
+                        # connexion coupée, trace sur stderr
+                        traceback.print_exc()
+                        status, body = 500, {"error": f"erreur interne: {type(e).__name__}"}
+
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except Exception:
+                status = 500
+                raise
+            finally:
+                # La métrique est enregistrée même si la réponse échoue
+                if url.path != "/metrics":
+                    metrics.record(url.path, time.perf_counter() - start, ok=status == 200)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return RoutingHandler
+
+
+# -----------------------------
+# Chargement
+# -----------------------------
+def load_router_from_state(path: Path):
+    state = load_build_state(path)
+    return TrailRouter(state["nodes"], state["graph"], state["hut_ids"],
+                       state["hut_meta"], state["anchor_by_hut"])
+
+
+def load_router_from_inputs(pbf_specs):
+    if pbf_specs:
+        hut_sources = parse_pbf_sources(pbf_specs)
+        paths_files = [path for path, _ in hut_sources]
+    else:
+        paths_files = [BASE_DIR / "overpass_nordics_paths.json"]
+        hut_sources = [
+            (BASE_DIR / "overpass_sweden_huts.json", "SE"),
+            (BASE_DIR / "overpass_norway_huts.json", "NO"),
+        ]
+    excluded_ids = load_excluded_hut_ids(BASE_DIR / "excluded_huts.txt")
+    nodes, ways_by_id, _, hut_ids, hut_meta = load_inputs(
+        paths_files, hut_sources, excluded_ids
+    )
+    graph = build_graph(nodes, ways_by_id)
+    anchor_by_hut, _ = compute_hut_anchors(nodes, graph, hut_ids,
+                                           max_radius_m=ANCHOR_RADIUS_M)
+    return TrailRouter(nodes, graph, hut_ids, hut_meta, anchor_by_hut)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Service HTTP/JSON de routage sur le graphe des chemins."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore le cache et reconstruit depuis les fichiers OSM.")
+    parser.add_argument("--pbf", action="append", default=[], metavar="CC=FICHIER")
+    parser.add_argument("--ch", action="store_true",
+                        help=f"Utilise la contraction hierarchy ({CH_FILE}) pour "
+                             f"les requêtes hut-hut sans blocage.")
+    parser.add_argument("--labels", action="store_true",
+                        help=f"Répond à /nearest depuis les étiquettes "
+                             f"précalculées ({LABELS_FILE}).")
+    args = parser.parse_args(argv)
+
+    state_path = BASE_DIR / STATE_FILE
+    if state_path.exists() and not args.rebuild and not args.pbf:
+        router = load_router_from_state(state_path)
+    else:
+        router = load_router_from_inputs(args.pbf)
+    if args.ch:
+        router.ch = ContractionHierarchy.load(CH_FILE)
+        router._route.cache_clear()
+    if args.labels:
+        router.labels = NearestHutLabels.load(LABELS_FILE)
+
+    metrics = LatencyMetrics()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(router, metrics))
+    print(f"Service de routage sur http://{args.host}:{args.port} "
+          f"({len(router.graph)} nodes, {len(router.anchor_by_hut)} huts ancrées)")
+    print("  /distance?from=&to=  /path?from=&to=  /nearest?lat=&lon=  "
+          "/neighbors?hut=&km=  /metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Arrêt du service.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+import heapq
+import math
+
+
+# -----------------------------
+# Moteur de référence (Python pur)
+# -----------------------------
+def dijkstra_from_hut(hut_source, anchor_src, graph, huts_by_anchor,
+                      max_distance_m):
+    """
+    Dijkstra depuis l'ancrage d'une hut, limité à max_distance_m, sans
+    propager au-delà de l'ancrage d'une autre hut.
+
+    Renvoie {hut_target: distance_km} pour les huts atteintes.
+    """
+    reached = {}
+    dist_dict = {anchor_src: 0.0}
+    heap = [(0.0, anchor_src)]
+
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > max_distance_m:
+            break
+        if d != dist_dict.get(node, float("inf")):
+            continue
+
+        # Si ce noeud est l'ancrage d'une ou plusieurs huts (autres que la source)
+        if node in huts_by_anchor and node != anchor_src:
+            d_km = d / 1000.0
+            for hut_target in huts_by_anchor[node]:
+                if hut_target == hut_source:
+                    continue
+                old = reached.get(hut_target)
+                if old is None or d_km < old:
+                    reached[hut_target] = d_km
+
+            # On ne propage pas au-delà : on ne veut pas "sauter" des huts
+            continue
+
+        for neigh, w in graph.get(node, []):
+            nd = d + w
+            if nd < dist_dict.get(neigh, float("inf")) and nd <= max_distance_m:
+                dist_dict[neigh] = nd
+                heapq.heappush(heap, (nd, neigh))
+
+    return reached
+
+
+class PythonEngine:
+    """Un heapq Dijkstra par hut source (implémentation de référence)."""
+
+    name = "python"
+    batch_size = 1
+
+    def __init__(self, graph, anchor_by_hut, huts_by_anchor, max_distance_m):
+        self.graph = graph
+        self.anchor_by_hut = anchor_by_hut
+        self.huts_by_anchor = huts_by_anchor
+        self.max_distance_m = max_distance_m
+
+    def run(self, sources):
+        return {
+            hut_source: dijkstra_from_hut(
+                hut_source, self.anchor_by_hut[hut_source], self.graph,
+                self.huts_by_anchor, self.max_distance_m,
+            )
+            for hut_source in sources
+        }
+
+
+# -----------------------------
+# Moteur SciPy (csgraph, code natif)
+# -----------------------------
+class ScipyEngine:
+    """
+    Dijkstra multi-sources de scipy.sparse.csgraph sur une matrice CSR.
+
+    La règle "on ne propage pas au-delà d'une autre hut" est conservée en
+    dédoublant chaque ancrage : une copie "entrée" qui ne reçoit que les
+    arêtes entrantes (puits, sans arête sortante) et une copie "sortie"
+    qui porte les arêtes sortantes et sert de point de départ.
+    """
+
+    name = "scipy"
+    # lignes (sources) × colonnes (nodes) de float64 par appel natif
+    max_cells_per_call = 32_000_000
+
+    def __init__(self, graph, anchor_by_hut, huts_by_anchor, max_distance_m):
+        try:
+            import numpy as np
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import dijkstra
+        except ImportError as e:
+            raise RuntimeError(
+                "Le moteur 'scipy' nécessite numpy et scipy : pip install scipy"
+            ) from e
+        self._np = np
+        self._dijkstra = dijkstra
+
+        self.anchor_by_hut = anchor_by_hut
+        self.max_distance_m = max_distance_m
+
+        # Indexation : un index par node, plus un index "sortie" par ancrage
+        index = {node: i for i, node in enumerate(graph)}
+        for anchor in huts_by_anchor:
+            if anchor not in index:
+                index[anchor] = len(index)
+        out_index = {}
+        for anchor in huts_by_anchor:
+            out_index[anchor] = len(index) + len(out_index)
+        n = len(index) + len(out_index)
+
+        rows, cols, weights = [], [], []
+        for u, neighbours in graph.items():
+            iu = out_index.get(u, index[u])
+            for v, w in neighbours:
+                if v == u:
+                    continue
+                rows.append(iu)
+                cols.append(index[v])
+                weights.append(w)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # Arêtes parallèles (plusieurs ways) : on garde la plus courte,
+        # csr_matrix additionnerait les doublons.
+        order = np.lexsort((weights, cols, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        if len(rows):
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            rows, cols, weights = rows[first], cols[first], weights[first]
+
+        self.matrix = csr_matrix((weights, (rows, cols)), shape=(n, n))
+        self.out_index = out_index
+
+        # Colonnes "entrée" des ancrages -> huts cibles
+        self.anchor_cols = np.asarray(
+            [index[a] for a in huts_by_anchor], dtype=np.int64
+        )
+        self.huts_at_col = [huts_by_anchor[a] for a in huts_by_anchor]
+        self.anchor_of_col = list(huts_by_anchor)
+
+        self.batch_size = max(1, self.max_cells_per_call // max(n, 1))
+        print(f"  Moteur scipy : {n} sommets, {self.matrix.nnz} arcs, "
+              f"{self.batch_size} sources par appel")
+
+    def run(self, sources):
+        np = self._np
+        sources = list(sources)
+        result = {}
+        for start in range(0, len(sources), self.batch_size):
+            chunk = sources[start:start + self.batch_size]
+            indices = [self.out_index[self.anchor_by_hut[h]] for h in chunk]
+            dist = self._dijkstra(
+                self.matrix, directed=True, indices=indices,
+                limit=self.max_distance_m,
+            )
+            dist = dist[:, self.anchor_cols]
+            for row, hut_source in enumerate(chunk):
+                anchor_src = self.anchor_by_hut[hut_source]
+                reached = {}
+                # Même ordre que le heap du moteur de référence : (d, node)
+                found = sorted(
+                    np.flatnonzero(np.isfinite(dist[row])),
+                    key=lambda k: (dist[row, k], self.anchor_of_col[k]),
+                )
+                for k in found:
+                    if self.anchor_of_col[k] == anchor_src:
+                        continue
+                    d = float(dist[row, k])
+                    if d > self.max_distance_m:
+                        continue
+                    d_km = d / 1000.0
+                    for hut_target in self.huts_at_col[k]:
+                        if hut_target == hut_source:
+                            continue
+                        old = reached.get(hut_target)
+                        if old is None or d_km < old:
+                            reached[hut_target] = d_km
+                result[hut_source] = reached
+        return result
+
+
+# -----------------------------
+# Plus court chemin point à point
+# -----------------------------
+def _unwind(parents, node):
+    path = []
+    while node is not None:
+        path.append(node)
+        node = parents[node]
+    return path
+
+
+def shortest_path_between(graph, source, target, blocked=None,
+                          max_distance_m=math.inf):
+    """
+    Dijkstra bidirectionnel entre deux nodes du graphe (non orienté).
+
+    blocked : nodes qu'on peut atteindre mais pas traverser (ex. ancrages
+              des autres huts) ; source et target ne sont jamais bloqués.
+    Renvoie (distance_m, [node_ids de source à target]) ou (None, None).
+    """
+    if source == target:
+        return 0.0, [source]
+    if blocked is None:
+        blocked = ()
+
+    dist = ({source: 0.0}, {target: 0.0})
+    parents = ({source: None}, {target: None})
+    settled = (set(), set())
+    heaps = ([(0.0, source)], [(0.0, target)])
+
+    best = math.inf
+    meeting = None
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        # On avance le côté dont la frontière est la plus petite
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        d, node = heapq.heappop(heaps[side])
+        if d != dist[side].get(node) or node in settled[side]:
+            continue
+        settled[side].add(node)
+
+        # Un node bloqué ne peut pas servir de point de jonction
+        if node in blocked and node not in (source, target):
+            continue
+
+        other = dist[1 - side].get(node)
+        if other is not None and d + other < best:
+            best = d + other
+            meeting = node
+
+        for neigh, w in graph.get(node, []):
+            nd = d + w
+            if nd > max_distance_m:
+                continue
+            if nd < dist[side].get(neigh, math.inf):
+                dist[side][neigh] = nd
+                parents[side][neigh] = node
+                heapq.heappush(heaps[side], (nd, neigh))
+                other = dist[1 - side].get(neigh)
+                if (other is not None and nd + other < best
+                        and (neigh not in blocked or neigh in (source, target))):
+                    best = nd + other
+                    meeting = neigh
+
+    if meeting is None or best > max_distance_m:
+        return None, None
+
+    forward = _unwind(parents[0], meeting)
+    forward.reverse()
+    backward = _unwind(parents[1], meeting)
+    return best, forward + backward[1:]
+
+
+def _great_circle_m(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (math.sin(dphi / 2.0) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2.0) ** 2)
+    return 2.0 * 6_371_000.0 * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
+
+
+def astar_between(graph, nodes, source, target, blocked=None):
+    """
+    A* bidirectionnel entre deux nodes, heuristique = distance à vol
+    d'oiseau (haversine, minorant des arêtes du graphe). Potentiel moyen
+    p(v) = (h(v, target) - h(v, source)) / 2, cohérent dans les deux sens :
+    on s'arrête dès que la somme des deux clés minimales dépasse le
+    meilleur chemin trouvé.
+
+    blocked : comme shortest_path_between. Pas de borne de distance.
+    Renvoie (distance_m, [node_ids de source à target]) ou (None, None).
+    """
+    if source == target:
+        return 0.0, [source]
+    if blocked is None:
+        blocked = ()
+
+    s_lat, s_lon = nodes[source]["lat"], nodes[source]["lon"]
+    t_lat, t_lon = nodes[target]["lat"], nodes[target]["lon"]
+    potential = {}
+
+    def pot(node):
+        p = potential.get(node)
+        if p is None:
+            lat, lon = nodes[node]["lat"], nodes[node]["lon"]
+            p = 0.5 * (_great_circle_m(lat, lon, t_lat, t_lon)
+                       - _great_circle_m(lat, lon, s_lat, s_lon))
+            potential[node] = p
+        return p
+
+    # côté 0 : clé = d + p ; côté 1 : clé = d - p
+    signs = (1.0, -1.0)
+    dist = ({source: 0.0}, {target: 0.0})
+    parents = ({source: None}, {target: None})
+    settled = (set(), set())
+    heaps = ([(pot(source), 0.0, source)], [(-pot(target), 0.0, target)])
+
+    best = math.inf
+    meeting = None
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        _, d, node = heapq.heappop(heaps[side])
+        if d != dist[side].get(node) or node in settled[side]:
+            continue
+        settled[side].add(node)
+
+        if node in blocked and node not in (source, target):
+            continue
+
+        other = dist[1 - side].get(node)
+        if other is not None and d + other < best:
+            best = d + other
+            meeting = node
+
+        sign = signs[side]
+        for neigh, w in graph.get(node, []):
+            nd = d + w
+            if nd < dist[side].get(neigh, math.inf):
+                dist[side][neigh] = nd
+                parents[side][neigh] = node
+                heapq.heappush(heaps[side], (nd + sign * pot(neigh), nd, neigh))
+                other = dist[1 - side].get(neigh)
+                if (other is not None and nd + other < best
+                        and (neigh not in blocked or neigh in (source, target))):
+                    best = nd + other
+                    meeting = neigh
+
+    if meeting is None:
+        return None, None
+
+    forward = _unwind(parents[0], meeting)
+    forward.reverse()
+    backward = _unwind(parents[1], meeting)
+    return best, forward + backward[1:]
+
+
+def nodes_within(graph, source, max_distance_m, blocked=None):
+    """
+    Dijkstra borné depuis un node : {node: distance_m} pour tous les nodes
+    à moins de max_distance_m. Les nodes de blocked sont atteints mais pas
+    traversés.
+    """
+    if blocked is None:
+        blocked = ()
+    dist_dict = {source: 0.0}
+    heap = [(0.0, source)]
+    done = {}
+    while heap:
+        d, node = heapq.heappop(heap)
+        if node in done:
+            continue
+        done[node] = d
+        if node in blocked and node != source:
+            continue
+        for neigh, w in graph.get(node, []):
+            nd = d + w
+            if nd <= max_distance_m and nd < dist_dict.get(neigh, math.inf):
+                dist_dict[neigh] = nd
+                heapq.heappush(heap, (nd, neigh))
+    return done
+
+
+def multi_source_dijkstra(graph, seeds):
+    """
+    Dijkstra unique depuis plusieurs sources à la fois.
+
+    seeds : [(node, label)] ; à distance égale, le label le plus petit
+            l'emporte (résultat déterministe).
+    Renvoie ({node: distance_m}, {node: label}) : pour chaque node atteint,
+    la source la plus proche par le graphe et sa distance.
+    """
+    dist_dict = {}
+    label_of = {}
+    heap = [(0.0, label, node) for node, label in seeds]
+    heapq.heapify(heap)
+    while heap:
+        d, label, node = heapq.heappop(heap)
+        if node in dist_dict:
+            continue
+        dist_dict[node] = d
+        label_of[node] = label
+        for neigh, w in graph.get(node, []):
+            if neigh not in dist_dict:
+                heapq.heappush(heap, (d + w, label, neigh))
+    return dist_dict, label_of
+
+
+ENGINES = {
+    PythonEngine.name: PythonEngine,
+    ScipyEngine.name: ScipyEngine,
+}
+
+
+def make_engine(name, graph, anchor_by_hut, huts_by_anchor, max_distance_m):
+    try:
+        engine_cls = ENGINES[name]
+    except KeyError:
+        raise ValueError(
+            f"Moteur de plus court chemin inconnu {name!r} "
+            f"(disponibles : {', '.join(sorted(ENGINES))})"
+        ) from None
+    return engine_cls(graph, anchor_by_hut, huts_by_anchor, max_distance_m)
@@ -0,0 +1,424 @@
+import sys
+import heapq
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from collections import defaultdict, ChainMap
+
+from build_cabane_graph import (
+    haversine,
+    build_spatial_index,
+    find_nearest_graph_node_for_hut,
+    compute_pairs_by_source,
+    edges_from_pairs_by_source,
+    write_hut_csv,
+    load_build_state,
+    save_build_state,
+    STATE_FILE,
+)
+from osm_pbf import is_route_relation, relation_touches_bbox
+
+BASE_DIR = Path(".")
+OUTPUT_DIR = BASE_DIR / "neo4j_huts"
+CELL_SIZE_DEG = 0.05
+
+
+# -----------------------------
+# Lecture osmChange (.osc)
+# -----------------------------
+def parse_osm_change(path: Path):
+    """
+    Lit un fichier osmChange et renvoie :
+      {"create"|"modify"|"delete": {"node": {id: el}, "way": {id: el},
+                                    "relation": {id: el}}}
+    avec des éléments au format Overpass JSON.
+    """
+    changes = {
+        action: {"node": {}, "way": {}, "relation": {}}
+        for action in ("create", "modify", "delete")
+    }
+
+    action = None
+    for event, elem in ET.iterparse(str(path), events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag in changes:
+                action = tag
+            continue
+
+        if tag in changes:
+            action = None
+            elem.clear()
+            continue
+        if action is None or tag not in ("node", "way", "relation"):
+            continue
+
+        osm_id = int(elem.get("id"))
+        tags = {t.get("k"): t.get("v") for t in elem.findall("tag")}
+        el = {"type": tag, "id": osm_id, "tags": tags}
+        if tag == "node":
+            if elem.get("lat") is not None:
+                el["lat"] = float(elem.get("lat"))
+                el["lon"] = float(elem.get("lon"))
+        elif tag == "way":
+            el["nodes"] = [int(nd.get("ref")) for nd in elem.findall("nd")]
+        else:
+            el["members"] = [
+                {"type": m.get("type"), "ref": int(m.get("ref")),
+                 "role": m.get("role", "")}
+                for m in elem.findall("member")
+            ]
+        changes[action][tag][osm_id] = el
+        elem.clear()
+
+    for action, by_type in changes.items():
+        counts = ", ".join(f"{k}={len(v)}" for k, v in by_type.items())
+        print(f"  osmChange {action}: {counts}")
+    return changes
+
+
+# -----------------------------
+# Application sur l'état en cache
+# -----------------------------
+def build_ways_by_node(ways_by_id):
+    ways_by_node = defaultdict(set)
+    for way_id, way in ways_by_id.items():
+        for nid in way.get("nodes", []):
+            ways_by_node[nid].add(way_id)
+    return ways_by_node
+
+
+def apply_osm_change(changes, nodes, ways_by_id, relations_by_id, ways_by_node):
+    """
+    Applique l'osmChange aux nodes / ways / relations de chemins (en place).
+
+    Renvoie (touched, moved) :
+      touched : nodes dont l'adjacence dans le graphe a pu changer
+                (nodes des ways modifiées, nodes déplacés et leurs voisins),
+      moved   : {node_id: (lat, lon)} anciennes positions des nodes
+                déplacés ou supprimés.
+    """
+    created, modified, deleted = changes["create"], changes["modify"], changes["delete"]
+
+    # Positions connues après l'osmChange, pour le filtre bbox des relations
+    new_ways = ChainMap(created["way"], modified["way"], ways_by_id)
+    new_nodes = ChainMap(
+        {nid: n for by_type in (created, modified)
+         for nid, n in by_type["node"].items() if "lat" in n},
+        nodes,
+    )
+
+    # 1) Relations route=hiking|ski -> ensemble des ways de chemins
+    #    (même filtre bbox que osm_pbf.read_route_elements : un diff
+    #    régional ou planète ne doit pas ajouter de routes hors zone)
+    outside = 0
+    for rel_id in deleted["relation"]:
+        relations_by_id.pop(rel_id, None)
+    for by_type in (created, modified):
+        for rel_id, rel in by_type["relation"].items():
+            if not is_route_relation(rel["tags"]):
+                relations_by_id.pop(rel_id, None)
+            elif not relation_touches_bbox(rel, new_ways, new_nodes):
+                outside += 1
+                relations_by_id.pop(rel_id, None)
+            else:
+                relations_by_id[rel_id] = [
+                    m["ref"] for m in rel["members"] if m["type"] == "way"
+                ]
+
+    if outside:
+        print(f"  Relations route hors bbox ignorées : {outside}")
+
+    wanted_ways = set()
+    for way_ids in relations_by_id.values():
+        wanted_ways.update(way_ids)
+
+    changed_ways = {}
+    for by_type in (created, modified):
+        changed_ways.update(by_type["way"])
+
+    # 2) Ways : ajout / retrait / nouvelle géométrie
+    touched = set()
+    missing_geometry = 0
+
+    def unlink(way_id):
+        old = ways_by_id.pop(way_id)
+        for nid in old.get("nodes", []):
+            touched.add(nid)
+            ways_by_node[nid].discard(way_id)
+            if not ways_by_node[nid]:
+                del ways_by_node[nid]
+
+    def link(way):
+        ways_by_id[way["id"]] = way
+        for nid in way.get("nodes", []):
+            touched.add(nid)
+            ways_by_node[nid].add(way["id"])
+
+    for way_id in list(ways_by_id):
+        if way_id in deleted["way"] or way_id not in wanted_ways:
+            unlink(way_id)
+
+    for way_id in wanted_ways:
+        new_way = changed_ways.get(way_id)
+        if new_way is not None:
+            old_way = ways_by_id.get(way_id)
+            if old_way is not None and old_way.get("nodes") == new_way["nodes"]:
+                ways_by_id[way_id] = new_way
+                continue
+            if old_way is not None:
+                unlink(way_id)
+            link(new_way)
+        elif way_id not in ways_by_id and way_id not in deleted["way"]:
+            # Way déjà existante, ajoutée à une relation : géométrie absente
+            # de l'osmChange -> il faudra un rebuild complet pour l'avoir.
+            missing_geometry += 1
+
+    if missing_geometry:
+        print(f"ATTENTION: {missing_geometry} ways ajoutées à une route sans "
+              f"géométrie dans l'osmChange (rebuild complet conseillé).")
+
+    # 3) Nodes : coordonnées créées / déplacées / supprimées
+    moved = {}
+    for by_type in (created, modified):
+        for nid, node in by_type["node"].items():
+            # Seuls les nodes de chemins nous intéressent (les huts
+            # viennent de leurs propres fichiers)
+            if "lat" not in node or nid not in ways_by_node:
+                continue
+            old = nodes.get(nid)
+            if old is not None and (old["lat"], old["lon"]) == (node["lat"], node["lon"]):
+                old["tags"] = node["tags"]
+                continue
+            if old is not None:
+                moved[nid] = (old["lat"], old["lon"])
+            nodes[nid] = node
+            touched.add(nid)
+            for way_id in ways_by_node.get(nid, ()):
+                touched.update(ways_by_id[way_id].get("nodes", []))
+
+    for nid in deleted["node"]:
+        if nid in nodes and nid in ways_by_node:
+            moved[nid] = (nodes[nid]["lat"], nodes[nid]["lon"])
+            del nodes[nid]
+            touched.add(nid)
+            for way_id in ways_by_node.get(nid, ()):
+                touched.update(ways_by_id[way_id].get("nodes", []))
+
+    print(f"  Ways de chemins après osmChange : {len(ways_by_id)}")
+    print(f"  Nodes du graphe à recalculer    : {len(touched)}")
+    return touched, moved
+
+
+def patch_graph(graph, nodes, ways_by_id, ways_by_node, touched):
+    """
+    Recalcule l'adjacence des nodes touchés, comme build_graph le ferait,
+    et renvoie l'ancienne adjacence de ces nodes.
+    """
+    old_adjacency = {nid: graph.get(nid, []) for nid in touched}
+
+    for nid in touched:
+        adjacency = []
+        if nid in nodes:
+            for way_id in ways_by_node.get(nid, ()):
+                node_ids = ways_by_id[way_id].get("nodes", [])
+                for i, ref in enumerate(node_ids):
+                    if ref != nid:
+                        continue
+                    for j in (i - 1, i + 1):
+                        if 0 <= j < len(node_ids) and node_ids[j] in nodes:
+                            other = nodes[node_ids[j]]
+                            d = haversine(nodes[nid]["lat"], nodes[nid]["lon"],
+                                          other["lat"], other["lon"])
+                            adjacency.append((node_ids[j], d))
+        if adjacency:
+            graph[nid] = adjacency
+        else:
+            graph.pop(nid, None)
+
+    return old_adjacency
+
+
+def update_spatial_index(cells, nodes, graph, old_adjacency, moved, touched):
+    """
+    Met à jour les cellules de l'index spatial pour les nodes touchés et
+    renvoie les cellules modifiées.
+    """
+    changed_cells = set()
+    for nid in touched:
+        if old_adjacency.get(nid):
+            old = moved.get(nid) or (nodes[nid]["lat"], nodes[nid]["lon"])
+            key = (int(old[0] / CELL_SIZE_DEG), int(old[1] / CELL_SIZE_DEG))
+            if nid in cells.get(key, ()):
+                cells[key].remove(nid)
+                if not cells[key]:
+                    del cells[key]
+            changed_cells.add(key)
+        if nid in graph:
+            node = nodes[nid]
+            key = (int(node["lat"] / CELL_SIZE_DEG), int(node["lon"] / CELL_SIZE_DEG))
+            cells[key].append(nid)
+            changed_cells.add(key)
+    return changed_cells
+
+
+def reanchor_huts(nodes, graph, cells, hut_ids, anchor_by_hut, changed_cells,
+                  max_radius_m):
+    """
+    Recalcule l'ancrage des huts dont le voisinage 3x3 de cellules contient
+    une cellule modifiée. Renvoie {hut_id: (ancien_ancrage, nouvel_ancrage)}
+    pour les ancrages qui ont changé.
+    """
+    changed = {}
+    for hut_id in hut_ids:
+        hut = nodes.get(hut_id)
+        if hut is None:
+            continue
+        i0 = int(hut["lat"] / CELL_SIZE_DEG)
+        j0 = int(hut["lon"] / CELL_SIZE_DEG)
+        near = any(
+            (i0 + di, j0 + dj) in changed_cells
+            for di in (-1, 0, 1) for dj in (-1, 0, 1)
+        )
+        if not near and hut_id not in changed_cells:
+            continue
+
+        old_anchor = anchor_by_hut.get(hut_id)
+        new_anchor = find_nearest_graph_node_for_hut(
+            hut_id, nodes, graph, cells,
+            max_radius_m=max_radius_m, cell_size_deg=CELL_SIZE_DEG
+        )
+        if new_anchor == old_anchor:
+            continue
+        changed[hut_id] = (old_anchor, new_anchor)
+        if new_anchor is None:
+            del anchor_by_hut[hut_id]
+        else:
+            anchor_by_hut[hut_id] = new_anchor
+
+    print(f"  Huts dont l'ancrage a changé : {len(changed)}")
+    return changed
+
+
+def find_affected_sources(seeds, graph, old_adjacency, anchor_sets,
+                          max_distance_m):
+    """
+    Dijkstra multi-sources inverse depuis les nodes modifiés, sur l'union de
+    l'ancien et du nouveau graphe. Toute hut dont l'ancrage est atteint à
+    moins de max_distance_m a une boule Dijkstra qui touche une arête
+    modifiée.
+
+    Comme dans shortest_path.dijkstra_from_hut, on ne propage pas au-delà d'un ancrage
+    (sauf depuis les seeds eux-mêmes, par prudence).
+    """
+    huts_at = defaultdict(set)
+    for anchor_by_hut in anchor_sets:
+        for hut_id, anchor in anchor_by_hut.items():
+            huts_at[anchor].add(hut_id)
+
+    affected = set()
+    dist_dict = {nid: 0.0 for nid in seeds}
+    heap = [(0.0, nid) for nid in seeds]
+    heapq.heapify(heap)
+
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > max_distance_m:
+            break
+        if d != dist_dict.get(node, float("inf")):
+            continue
+
+        if node in huts_at:
+            affected.update(huts_at[node])
+            if d > 0.0:
+                continue
+
+        neighbours = list(graph.get(node, []))
+        neighbours.extend(old_adjacency.get(node, []))
+        for neigh, w in neighbours:
+            nd = d + w
+            if nd < dist_dict.get(neigh, float("inf")) and nd <= max_distance_m:
+                dist_dict[neigh] = nd
+                heapq.heappush(heap, (nd, neigh))
+
+    return affected
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python update_from_osc.py fichier.osc")
+    osc_path = Path(sys.argv[1])
+    state_path = BASE_DIR / STATE_FILE
+
+    state = load_build_state(state_path)
+    nodes = state["nodes"]
+    ways_by_id = state["ways_by_id"]
+    relations_by_id = state["relations_by_id"]
+    graph = state["graph"]
+    hut_ids = state["hut_ids"]
+    hut_meta = state["hut_meta"]
+    anchor_by_hut = state["anchor_by_hut"]
+    pairs_by_source = state["pairs_by_source"]
+    max_distance_km = state["max_distance_km"]
+    anchor_radius_m = state["anchor_radius_m"]
+
+    # Index construits une seule fois puis maintenus dans l'état
+    if "ways_by_node" not in state:
+        print("Construction de l'index node -> ways (une seule fois)...")
+        state["ways_by_node"] = build_ways_by_node(ways_by_id)
+    if "cells" not in state:
+        state["cells"] = build_spatial_index(nodes, graph, cell_size_deg=CELL_SIZE_DEG)
+    ways_by_node = state["ways_by_node"]
+    cells = state["cells"]
+
+    print(f"Lecture osmChange : {osc_path}")
+    changes = parse_osm_change(osc_path)
+
+    touched, moved = apply_osm_change(changes, nodes, ways_by_id,
+                                      relations_by_id, ways_by_node)
+    old_adjacency = patch_graph(graph, nodes, ways_by_id, ways_by_node, touched)
+    changed_cells = update_spatial_index(cells, nodes, graph, old_adjacency,
+                                         moved, touched)
+
+    old_anchor_by_hut = dict(anchor_by_hut)
+    changed_anchors = reanchor_huts(
+        nodes, graph, cells, hut_ids, anchor_by_hut, changed_cells,
+        max_radius_m=anchor_radius_m,
+    )
+
+    seeds = set(touched)
+    for old_anchor, new_anchor in changed_anchors.values():
+        seeds.update(a for a in (old_anchor, new_anchor) if a is not None)
+
+    affected = find_affected_sources(
+        seeds, graph, old_adjacency, (old_anchor_by_hut, anchor_by_hut),
+        max_distance_km * 1000.0,
+    )
+    affected.update(changed_anchors)
+    print(f"Huts sources à recalculer : {len(affected)} / {len(anchor_by_hut)}")
+
+    for hut_id in affected:
+        pairs_by_source.pop(hut_id, None)
+
+    huts_by_anchor = defaultdict(list)
+    for hut_id, anchor in anchor_by_hut.items():
+        huts_by_anchor[anchor].append(hut_id)
+
+    pairs_by_source.update(compute_pairs_by_source(
+        graph, anchor_by_hut, huts_by_anchor,
+        max_distance_km=max_distance_km,
+        sources=[h for h in affected if h in anchor_by_hut],
+    ))
+    # Même ordre des sources qu'un build complet (ordre des lignes du CSV)
+    pairs_by_source = {h: pairs_by_source[h] for h in sorted(pairs_by_source)}
+    state["pairs_by_source"] = pairs_by_source
+
+    edges = edges_from_pairs_by_source(pairs_by_source)
+    write_hut_csv(nodes, hut_ids, hut_meta, edges, OUTPUT_DIR)
+    save_build_state(state, state_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,15 @@ import csv
 import os
 import time
 import json
+import argparse
 from pathlib import Path
 
-import requests
+from build_cabane_graph import load_build_state, STATE_FILE
+from shortest_path import astar_between
 
 BASE_DIR = Path(__file__).resolve().parent
 HUTS_CSV = BASE_DIR / "neo4j_huts" / "huts.csv"
 
-ORS_API_KEY = os.environ.get("ORS_API_KEY")
-if not ORS_API_KEY:
-    raise RuntimeError(
-        "Variable d'environnement ORS_API_KEY non définie. "
-        "Définis-la avant de lancer ce script."
-    )
-
 ORS_URL = "https://api.openrouteservice.org/v2/directions/foot-hiking"
 SLEEP_BETWEEN_CALLS = 2.0  # secondes entre les appels pour rester gentil avec l'API
 
@@ -54,7 +49,20 @@ def load_huts_by_name(path: Path):
     return huts
 
 
+def ors_api_key():
+    """Clé ORS, demandée seulement si on appelle vraiment ORS."""
+    key = os.environ.get("ORS_API_KEY")
+    if not key:
+        raise RuntimeError(
+            "Variable d'environnement ORS_API_KEY non définie. "
+            "Définis-la avant de lancer ce script avec --ors ou --ors-fallback."
+        )
+    return key
+
+
 def call_ors(hut_a, hut_b):
+    import requests
+
     body = {
         "coordinates": [
             [hut_a["lon"], hut_a["lat"]],
@@ -64,7 +72,7 @@ def call_ors(hut_a, hut_b):
     }
 
     headers = {
-        "Authorization": ORS_API_KEY,
+        "Authorization": ors_api_key(),
         "Content-Type": "application/json",
     }
 
@@ -145,33 +153,60 @@ def call_ors(hut_a, hut_b):
     return distance_km, ascent, descent
 
 
-def main():
-    huts = load_huts_by_name(HUTS_CSV)
-
-    print("\n-- Requêtes Cypher à exécuter dans Neo4j pour mettre à jour les liens manuels --\n")
-
-    for (name_a, name_b) in MANUAL_EDGES:
-        hut_a = huts.get(name_a)
-        hut_b = huts.get(name_b)
+# --------------------------------------------------------------------
+# Routage local sur le graphe des chemins (cache du build)
+# --------------------------------------------------------------------
+def local_route(graph, nodes, anchor_by_hut, hut_a, hut_b, blocked=None):
+    """
+    Plus court chemin entre les ancrages des deux huts (A* bidirectionnel,
+    sans limite de distance). Renvoie (distance_km, [node_ids]) ou None.
+    """
+    anchor_a = anchor_by_hut.get(hut_a["hut_id"])
+    anchor_b = anchor_by_hut.get(hut_b["hut_id"])
+    if anchor_a is None or anchor_b is None:
+        return None
+    distance_m, path = astar_between(graph, nodes, anchor_a, anchor_b, blocked=blocked)
+    if path is None:
+        return None
+    return distance_m / 1000.0, path
 
-        if hut_a is None or hut_b is None:
-            print(f"-- SKIP: Hut introuvable dans huts.csv pour le couple ({name_a}, {name_b})")
-            continue
 
-        print(f"Calcul ORS pour {name_a} -> {name_b} ...")
-        result = call_ors(hut_a, hut_b)
-        if result is None:
-            print(f"-- ERREUR ORS pour {name_a} -> {name_b}, lien non mis à jour.\n")
+def path_ascent(path, elevations):
+    """(D+, D-) en m le long du chemin, sur les nodes dont l'altitude est connue."""
+    dplus = dminus = 0.0
+    previous = None
+    for nid in path:
+        ele = elevations.get(nid)
+        if ele is None:
             continue
+        if previous is not None:
+            if ele > previous:
+                dplus += ele - previous
+            else:
+                dminus += previous - ele
+        previous = ele
+    return dplus, dminus
+
+
+def cypher_for_link(name_a, name_b, distance_km, dplus=None, dminus=None):
+    # On arrondit un peu pour éviter les nombres à rallonge
+    distance_km_r = round(distance_km, 3)
+    if dplus is None or dminus is None:
+        # Pas de dénivelé connu : on ne touche pas aux valeurs existantes
+        return f"""
+// {name_a} <-> {name_b}
+// ATTENTION : dplus_m / dminus_m non mis à jour (dénivelé inconnu)
+MATCH (a:Hut {{name:"{name_a}"}}), (b:Hut {{name:"{name_b}"}})
+MERGE (a)-[l1:LINK]->(b)
+SET l1.distance_km = {distance_km_r};
 
-        distance_km, dplus, dminus = result
-
-        # On arrondit un peu pour éviter les nombres à rallonge
-        distance_km_r = round(distance_km, 3)
-        dplus_r = round(dplus, 1)
-        dminus_r = round(dminus, 1)
+MERGE (b)-[l2:LINK]->(a)
+SET l2.distance_km = {distance_km_r};
+"""
 
-        print(f"""
+    dplus_r = round(dplus, 1)
+    dminus_r = round(dminus, 1)
+    return f"""
 // {name_a} <-> {name_b}
 MATCH (a:Hut {{name:"{name_a}"}}), (b:Hut {{name:"{name_b}"}})
 MERGE (a)-[l1:LINK]->(b)
@@ -183,9 +218,124 @@ MERGE (b)-[l2:LINK]->(a)
 SET l2.distance_km = {distance_km_r},
     l2.dplus_m     = {dminus_r},
     l2.dminus_m    = {dplus_r};
-""")
+"""
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Distances des liens manuels (MANUAL_EDGES) : routage local "
+                    "sur le graphe des chemins, ORS en secours."
+    )
+    parser.add_argument(
+        "--block-huts", action="store_true",
+        help="Ne pas traverser l'ancrage d'une autre hut (règle du build).",
+    )
+    elevation = parser.add_mutually_exclusive_group()
+    elevation.add_argument(
+        "--dem", type=Path, default=None, metavar="FICHIER",
+        help="MNT raster (GeoTIFF EPSG:4326) pour le D+/D- des chemins locaux.",
+    )
+    elevation.add_argument(
+        "--ors-elevation", action="store_true",
+        help="D+/D- des chemins locaux demandés à ORS (la distance reste "
+             "celle du graphe local).",
+    )
+    elevation.add_argument(
+        "--no-elevation", action="store_true",
+        help="Chemins locaux sans D+/D- : seul distance_km est mis à jour, "
+             "dplus_m / dminus_m gardent leur ancienne valeur dans Neo4j.",
+    )
+    parser.add_argument(
+        "--ors-fallback", action="store_true",
+        help="Interroge ORS pour les couples sans chemin local.",
+    )
+    parser.add_argument(
+        "--ors", action="store_true",
+        help="Tout calculer via ORS (ancien comportement, sans le graphe local).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.ors and args.dem is None and not args.ors_elevation and not args.no_elevation:
+        # Le script ORS mettait toujours à jour dplus_m / dminus_m
+        raise SystemExit(
+            "Le D+/D- des chemins locaux nécessite --dem FICHIER ou "
+            "--ors-elevation (--no-elevation : distance_km seule mise à jour)."
+        )
+    huts = load_huts_by_name(HUTS_CSV)
+
+    graph = nodes = anchor_by_hut = blocked = None
+    if not args.ors:
+        state = load_build_state(BASE_DIR / STATE_FILE)
+        graph = state["graph"]
+        nodes = state["nodes"]
+        anchor_by_hut = state["anchor_by_hut"]
+        if args.block_huts:
+            blocked = set(anchor_by_hut.values())
+
+    # (name_a, name_b, distance_km, dplus, dminus, chemin local ou None)
+    links = []
+    for (name_a, name_b) in MANUAL_EDGES:
+        hut_a = huts.get(name_a)
+        hut_b = huts.get(name_b)
+
+        if hut_a is None or hut_b is None:
+            print(f"-- SKIP: Hut introuvable dans huts.csv pour le couple ({name_a}, {name_b})")
+            continue
+
+        if not args.ors:
+            t0 = time.perf_counter()
+            result = local_route(graph, nodes, anchor_by_hut, hut_a, hut_b, blocked)
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            if result is not None:
+                distance_km, path = result
+                print(f"Chemin local {name_a} -> {name_b} : {distance_km:.3f} km, "
+                      f"{len(path)} nodes ({elapsed_ms:.1f} ms)")
+                dplus = dminus = None
+                if args.ors_elevation:
+                    print(f"Dénivelé ORS pour {name_a} -> {name_b} ...")
+                    ors_result = call_ors(hut_a, hut_b)
+                    time.sleep(SLEEP_BETWEEN_CALLS)
+                    if ors_result is not None:
+                        _, dplus, dminus = ors_result
+                links.append((name_a, name_b, distance_km, dplus, dminus, path))
+                continue
+            print(f"Pas de chemin local pour {name_a} -> {name_b}")
+            if not args.ors_fallback:
+                continue
+
+        print(f"Calcul ORS pour {name_a} -> {name_b} ...")
+        result = call_ors(hut_a, hut_b)
         time.sleep(SLEEP_BETWEEN_CALLS)
+        if result is None:
+            print(f"-- ERREUR ORS pour {name_a} -> {name_b}, lien non mis à jour.\n")
+            continue
+        distance_km, dplus, dminus = result
+        links.append((name_a, name_b, distance_km, dplus, dminus, None))
+
+    if args.dem is not None:
+        from edge_profiles import load_dem_elevations
+
+        path_nodes = {nid for *_, path in links if path for nid in path}
+        elevations = load_dem_elevations(nodes, path_nodes, args.dem)
+        links = [
+            (a, b, d, *path_ascent(path, elevations), path) if path else
+            (a, b, d, dplus, dminus, path)
+            for a, b, d, dplus, dminus, path in links
+        ]
+
+    missing = [(a, b) for a, b, _, dplus, dminus, _ in links if dplus is None or dminus is None]
+    if missing:
+        print(f"\nATTENTION : D+/D- non mis à jour pour {len(missing)} lien(s) "
+              f"(seul distance_km est écrit) :")
+        for name_a, name_b in missing:
+            print(f"  {name_a} <-> {name_b}")
+
+    print("\n-- Requêtes Cypher à exécuter dans Neo4j pour mettre à jour les liens manuels --\n")
+    for name_a, name_b, distance_km, dplus, dminus, _ in links:
+        print(cypher_for_link(name_a, name_b, distance_km, dplus, dminus))
 
 
 if __name__ == "__main__":